@@ -1,8 +1,69 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import ctypes, math, os, time, re
-from ctypes import c_int, c_uint32, c_char_p, c_void_p, POINTER, Structure, c_uint8, c_uint16
+import argparse, ast, bisect, cmath, collections, ctypes, decimal, functools, itertools, json, math, mmap, multiprocessing, operator, os, struct, sys, time, re, warnings
+from array import array
+from decimal import Decimal
+from fractions import Fraction
+from ctypes import c_int, c_uint32, c_char_p, c_void_p, c_float, POINTER, Structure, c_uint8, c_uint16
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Repère de démarrage si /proc n'est pas disponible
+_IMPORT_NS = time.perf_counter_ns()
+
+# Configuration de l'affichage
+MAX_FPS = 30            # Cadence maximale des images sans entrée récente (animations, calculs)
+ACTIVE_MS = 500         # Après une entrée, les images suivent la synchro verticale pendant ce délai
+ALWAYS_REDRAW = False   # True : redessine à chaque image, même sans changement
+IDLE_TIMEOUT_MS = 1000  # Attente maximale d'un événement quand rien ne change
+GRAPH_PAN_PX = 16       # Pas de déplacement du graphe (flèches)
+GRAPH_INPUT_PX = 20     # Hauteur de la bande de saisie sous le graphe, retirée du tracé
+GRAPH_REFINE_START = 8  # Après un zoom, une colonne sur N est tracée d'abord
+PERF_WINDOW_MS = 500    # Période de mesure et de rafraîchissement du HUD de performance
+HISTORY_CAPACITY = 1000 # Lignes d'historique conservées, les plus anciennes sont oubliées
+TEXT_CACHE_SIZE = 256   # Textures de texte gardées en cache (les moins récentes sont libérées)
+
+# Configuration de la session (journal d'historique sur disque)
+HISTORY_SYNC_LINES = 32            # Lignes écrites entre deux fsync du journal
+HISTORY_SYNC_S = 5.0               # Délai maximal avant fsync des lignes en attente
+HISTORY_LOG_MAX_BYTES = 1 << 20    # Au-delà, le journal est compacté (pendant la session)
+HISTORY_LOG_KEEP_LINES = 2 * HISTORY_CAPACITY  # Lignes gardées au compactage et relues au démarrage
+
+# Configuration du calcul
+PROGRAM_CACHE_SIZE = 256  # Expressions compilées gardées en cache
+EVAL_TIMEOUT_S = 10.0     # Durée maximale d'un calcul avant abandon
+EVAL_MEMORY_MB = 256      # Mémoire supplémentaire autorisée au processus de calcul
+EVAL_FAST_WAIT_S = 0.02   # Attente directe du résultat avant d'afficher « occupé »
+BATCH_MEMO_SIZE = 65536   # Résultats mémorisés par --batch pour les lignes répétées
+BATCH_SHAPE_SIZE = 4096   # Programmes liés gardés par --batch, un par forme d'expression
+RESULT_DIGIT_BUDGET = 4000  # Au-delà, un résultat est approché en notation scientifique
+FACTORIAL_TABLE_SIZE = 256  # Factorielles précalculées (0! à 255!)
+RESULT_LINE_DIGITS = 30     # Chiffres d'un résultat affichés tels quels, au-delà notation scientifique
+RESULT_MEMO_SIZE = 128      # Résultats gardés par expression normalisée (touche =)
+DIGITS_CHUNK = 400          # Chiffres convertis à la fois par la vue des chiffres complets (V)
+PREVIEW_BUDGET_MS = 4       # Temps d'évaluation de l'aperçu par touche
+PREVIEW_IDLE_BUDGET_MS = 40 # Aperçu différé : temps accordé une fois la frappe arrêtée
+PREVIEW_DEFER_MS = 250      # Pause de frappe avant de reprendre un aperçu différé
+PREVIEW_RETRIES = 3         # Reprises d'un aperçu différé avant d'y renoncer
+PREVIEW_MEMO_SIZE = 256     # Groupes entre parenthèses et termes gardés par l'aperçu
+PREVIEW_MAX_MAGNITUDE = 1000  # Aperçu : pas de sin, cos, tan ni ! au-delà de 10^1000 (coût non borné)
+SOLVER_SCAN_POINTS = 256    # Points du balayage initial de root, fmin et fmax
+SOLVER_MAX_STEPS = 200      # Itérations de la méthode de Brent
+INTEGRAL_TOL = 1e-10        # Erreur relative visée par integ
+INTEGRAL_MAX_EVALS = 60000  # Évaluations au plus par intégrale
+TABLE_ROWS = 1000000        # Lignes de la table de valeurs (touche A)
+TABLE_CHUNK = 256           # Lignes calculées à la fois
+TABLE_CACHE_CHUNKS = 8      # Blocs de lignes gardés (mémoire bornée)
+STATS_CHUNK_BYTES = 1 << 20  # Octets d'un fichier de données analysés à la fois (--stats)
+STATS_STEP_MS = 30          # Lecture d'un fichier de données par image, l'interface reste réactive
+STATS_SKETCH_SIZE = 4096    # Valeurs par niveau de l'esquisse des quantiles
 
 # Chargement SDL2 / SDL_ttf
 def load_libs():
@@ -22,17 +83,25 @@ def load_libs():
         raise RuntimeError("SDL2/SDL_ttf introuvables")
     return sdl, ttf
 
-sdl2, sdl2_ttf = load_libs()
+# Chargées par init_libs() : le moteur de calcul s'utilise sans SDL (--batch)
+sdl2 = None
+sdl2_ttf = None
 
 # Constantes
 SDL_INIT_VIDEO = 0x00000020
 SDL_WINDOW_SHOWN = 0x00000004
 SDL_RENDERER_ACCELERATED = 0x00000002
 SDL_RENDERER_PRESENTVSYNC = 0x00000004
+SDL_RENDERER_TARGETTEXTURE = 0x00000008
+SDL_PIXELFORMAT_RGBA8888 = 0x16462004
+SDL_TEXTUREACCESS_TARGET = 2
 SDL_QUIT = 0x100
+SDL_WINDOWEVENT = 0x200
 SDL_MOUSEBUTTONDOWN = 0x401
 SDL_KEYDOWN = 0x300
 SDL_KEYUP = 0x301
+SDL_RENDER_TARGETS_RESET = 0x2000
+SDL_RENDER_DEVICE_RESET = 0x2001
 SDLK_ESCAPE = 27
 SDLK_RETURN = 13
 SDLK_EQUALS = 61
@@ -40,15 +109,41 @@ SDLK_BACKSPACE = 8
 SDLK_DELETE = 127
 SDLK_UP = 1073741906
 SDLK_DOWN = 1073741905
+SDLK_RIGHT = 1073741903
+SDLK_LEFT = 1073741904
+SDLK_PAGEUP = 1073741899
+SDLK_PAGEDOWN = 1073741902
+KMOD_SHIFT = 0x0003
+SDLK_PLUS = 43
+SDLK_MINUS = 45
 SDLK_SPACE = 32
 SDLK_h = 104
 SDLK_c = 99
 SDLK_i = 105
 SDLK_q = 113
 SDLK_w = 119
+SDLK_x = 120
 SDLK_e = 101
 SDLK_r = 114
 SDLK_t = 116
+SDLK_p = 112
+SDLK_l = 108
+SDLK_m = 109
+SDLK_n = 110
+SDLK_v = 118
+SDLK_s = 115
+SDLK_g = 103
+SDLK_j = 106
+SDLK_d = 100
+SDLK_k = 107
+SDLK_LEFTBRACKET = 91
+SDLK_RIGHTBRACKET = 93
+SDLK_AT = 64
+SDLK_o = 111
+SDLK_b = 98
+SDLK_a = 97
+SDLK_y = 121
+SDLK_COMMA = 44
 SDLK_6 = 54
 SDLK_8 = 56
 SDLK_9 = 57
@@ -67,9 +162,18 @@ SDLK_F9 = 1073741890
 class SDL_Rect(Structure):
     _fields_ = [("x", c_int), ("y", c_int), ("w", c_int), ("h", c_int)]
 
+class SDL_Point(Structure):
+    _fields_ = [("x", c_int), ("y", c_int)]
+
 class SDL_Color(Structure):
     _fields_ = [("r", c_uint8), ("g", c_uint8), ("b", c_uint8), ("a", c_uint8)]
 
+class SDL_FPoint(Structure):
+    _fields_ = [("x", c_float), ("y", c_float)]
+
+class SDL_Vertex(Structure):
+    _fields_ = [("position", SDL_FPoint), ("color", SDL_Color), ("tex_coord", SDL_FPoint)]
+
 class SDL_Keysym(Structure):
     _fields_ = [("scancode", c_int), ("sym", c_int), ("mod", c_uint16), ("unused", c_uint32)]
 
@@ -87,50 +191,84 @@ class SDL_Event(ctypes.Union):
     _fields_ = [("type", c_uint32), ("key", SDL_KeyboardEvent), ("button", SDL_MouseButtonEvent),
                 ("padding", c_uint8 * 56)]
 
-# Prototypes SDL
-sdl2.SDL_Init.argtypes = [c_uint32]
-sdl2.SDL_Init.restype = c_int
-sdl2.SDL_CreateWindow.argtypes = [c_char_p, c_int, c_int, c_int, c_int, c_uint32]
-sdl2.SDL_CreateWindow.restype = c_void_p
-sdl2.SDL_CreateRenderer.argtypes = [c_void_p, c_int, c_uint32]
-sdl2.SDL_CreateRenderer.restype = c_void_p
-sdl2.SDL_SetRenderDrawColor.argtypes = [c_void_p, c_uint8, c_uint8, c_uint8, c_uint8]
-sdl2.SDL_RenderClear.argtypes = [c_void_p]
-sdl2.SDL_RenderPresent.argtypes = [c_void_p]
-sdl2.SDL_RenderFillRect.argtypes = [c_void_p, POINTER(SDL_Rect)]
-sdl2.SDL_RenderDrawRect.argtypes = [c_void_p, POINTER(SDL_Rect)]
-sdl2.SDL_RenderDrawLine.argtypes = [c_void_p, c_int, c_int, c_int, c_int]
-sdl2.SDL_PollEvent.argtypes = [POINTER(SDL_Event)]
-sdl2.SDL_PollEvent.restype = c_int
-sdl2.SDL_DestroyRenderer.argtypes = [c_void_p]
-sdl2.SDL_DestroyWindow.argtypes = [c_void_p]
-sdl2.SDL_Quit.argtypes = []
-sdl2.SDL_Delay.argtypes = [c_uint32]
-sdl2.SDL_GetWindowSize = sdl2.SDL_GetWindowSize
-sdl2.SDL_GetWindowSize.argtypes = [c_void_p, POINTER(c_int), POINTER(c_int)]
-sdl2.SDL_CreateTextureFromSurface.argtypes = [c_void_p, c_void_p]
-sdl2.SDL_CreateTextureFromSurface.restype = c_void_p
-sdl2.SDL_RenderCopy.argtypes = [c_void_p, c_void_p, c_void_p, POINTER(SDL_Rect)]
-sdl2.SDL_QueryTexture.argtypes = [c_void_p, c_void_p, c_void_p, POINTER(c_int), POINTER(c_int)]
-sdl2.SDL_DestroyTexture.argtypes = [c_void_p]
-sdl2.SDL_FreeSurface.argtypes = [c_void_p]
-sdl2.SDL_GetTicks = sdl2.SDL_GetTicks
-sdl2.SDL_GetTicks.restype = c_uint32
-
-# Prototypes SDL_ttf
-sdl2_ttf.TTF_Init.restype = c_int
-sdl2_ttf.TTF_OpenFont.argtypes = [c_char_p, c_int]
-sdl2_ttf.TTF_OpenFont.restype = c_void_p
-sdl2_ttf.TTF_RenderText_Solid.argtypes = [c_void_p, c_char_p, SDL_Color]
-sdl2_ttf.TTF_RenderText_Solid.restype = c_void_p
-sdl2_ttf.TTF_CloseFont.argtypes = [c_void_p]
-sdl2_ttf.TTF_Quit.argtypes = []
+# Prototypes (argtypes, restype), déclarés au premier accès à chaque fonction
+SDL_PROTOTYPES = {
+    'SDL_Init': ([c_uint32], c_int),
+    'SDL_Quit': ([], None),
+    'SDL_CreateWindow': ([c_char_p, c_int, c_int, c_int, c_int, c_uint32], c_void_p),
+    'SDL_DestroyWindow': ([c_void_p], None),
+    'SDL_GetWindowSize': ([c_void_p, POINTER(c_int), POINTER(c_int)], None),
+    'SDL_CreateRenderer': ([c_void_p, c_int, c_uint32], c_void_p),
+    'SDL_DestroyRenderer': ([c_void_p], None),
+    'SDL_SetRenderDrawColor': ([c_void_p, c_uint8, c_uint8, c_uint8, c_uint8], c_int),
+    'SDL_RenderClear': ([c_void_p], c_int),
+    'SDL_RenderPresent': ([c_void_p], None),
+    'SDL_RenderFillRect': ([c_void_p, POINTER(SDL_Rect)], c_int),
+    'SDL_RenderDrawRect': ([c_void_p, POINTER(SDL_Rect)], c_int),
+    'SDL_RenderDrawLine': ([c_void_p, c_int, c_int, c_int, c_int], c_int),
+    # Adresse brute d'un tableau de SDL_Point (ctypes ou NumPy)
+    'SDL_RenderDrawLines': ([c_void_p, c_void_p, c_int], c_int),
+    'SDL_RenderSetClipRect': ([c_void_p, POINTER(SDL_Rect)], c_int),
+    'SDL_RenderCopy': ([c_void_p, c_void_p, c_void_p, POINTER(SDL_Rect)], c_int),
+    'SDL_RenderTargetSupported': ([c_void_p], c_int),
+    'SDL_SetRenderTarget': ([c_void_p, c_void_p], c_int),
+    'SDL_CreateTexture': ([c_void_p, c_uint32, c_int, c_int, c_int], c_void_p),
+    'SDL_CreateTextureFromSurface': ([c_void_p, c_void_p], c_void_p),
+    'SDL_QueryTexture': ([c_void_p, c_void_p, c_void_p, POINTER(c_int), POINTER(c_int)], c_int),
+    'SDL_SetTextureColorMod': ([c_void_p, c_uint8, c_uint8, c_uint8], c_int),
+    # SDL >= 2.0.18 seulement
+    'SDL_RenderGeometry': ([c_void_p, c_void_p, POINTER(SDL_Vertex), c_int, POINTER(c_int), c_int], c_int),
+    'SDL_DestroyTexture': ([c_void_p], None),
+    'SDL_FreeSurface': ([c_void_p], None),
+    'SDL_RWFromConstMem': ([c_char_p, c_int], c_void_p),
+    'SDL_PollEvent': ([POINTER(SDL_Event)], c_int),
+    'SDL_WaitEventTimeout': ([POINTER(SDL_Event), c_int], c_int),
+    'SDL_GetTicks': ([], c_uint32),
+    'SDL_Delay': ([c_uint32], None),
+}
+
+TTF_PROTOTYPES = {
+    'TTF_Init': ([], c_int),
+    'TTF_Quit': ([], None),
+    'TTF_OpenFont': ([c_char_p, c_int], c_void_p),
+    # Le flux RW est libéré avec la police (freesrc = 1)
+    'TTF_OpenFontRW': ([c_void_p, c_int, c_int], c_void_p),
+    'TTF_CloseFont': ([c_void_p], None),
+    'TTF_RenderText_Solid': ([c_void_p, c_char_p, SDL_Color], c_void_p),
+    # Texte UTF-8 (« ± », « π ») ; TTF_RenderText lit du Latin-1
+    'TTF_RenderUTF8_Solid': ([c_void_p, c_char_p, SDL_Color], c_void_p),
+}
+
+class LazyLib:
+    """Bibliothèque ctypes dont chaque fonction reçoit son prototype au premier accès"""
+    def __init__(self, lib, prototypes):
+        self._lib = lib
+        self._prototypes = prototypes
+
+    def __getattr__(self, name):
+        func = getattr(self._lib, name)
+        proto = self._prototypes.get(name)
+        if proto is not None:
+            func.argtypes, func.restype = proto
+        # Les accès suivants trouvent l'attribut sans repasser par ici
+        setattr(self, name, func)
+        return func
+
+def init_libs():
+    """Charge SDL2 / SDL_ttf ; les prototypes sont déclarés à la demande"""
+    global sdl2, sdl2_ttf
+    if sdl2 is not None:
+        return
+    sdl, ttf = load_libs()
+    sdl2 = LazyLib(sdl, SDL_PROTOTYPES)
+    sdl2_ttf = LazyLib(ttf, TTF_PROTOTYPES)
 
 # Couleurs
 class Color:
     BG = (44, 62, 80)
     DISPLAY_BG = (10, 61, 10)
     DISPLAY_TEXT = (0, 255, 0)
+    PREVIEW_TEXT = (80, 150, 80)
     BTN_NUMBER = (52, 73, 94)
     BTN_OP = (243, 156, 18)
     BTN_FUNC = (52, 152, 219)
@@ -146,89 +284,3568 @@ class Color:
     BLUE = (0, 0, 255)
     GRID = (220, 220, 220)
 
-# Utilitaires police
-def open_any_font(size=10):
-    candidates = [
-        b"./DejaVuSansMono.ttf",
-        b"./LiberationMono-Regular.ttf",
-        b"/usr/local/share/fonts/DejaVuSansMono.ttf",
-        b"/usr/local/share/fonts/LiberationMono-Regular.ttf",
-        b"/usr/share/fonts/dejavu/DejaVuSansMono.ttf",
-        b"/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
-        b"/usr/share/fonts/truetype/liberation/LiberationMono-Regular.ttf",
-        b"/system/fonts/DroidSansMono.ttf",
-    ]
-    for p in candidates:
-        if p.startswith(b"./"):
-            if not os.path.exists(p.decode()): continue
-        font = sdl2_ttf.TTF_OpenFont(p, size)
-        if font:
-            print("Font OK:", p.decode())
-            return font
-    print("ERREUR: aucune police chargée. Placez DejaVuSansMono.ttf à côté du script.")
-    return None
+# Moteur d'expressions
+class ExprError(ValueError):
+    """Erreur d'analyse ou d'évaluation, avec la position (0-based) dans le texte ou None"""
+    def __init__(self, message, pos):
+        super().__init__(message)
+        self.message = message
+        self.pos = pos
+
+class EvalDeadline(Exception):
+    """Échéance d'une évaluation bornée dépassée (aperçu)"""
+
+# Fonctions connues et leur nombre d'arguments
+FUNCTIONS = {'sin': 1, 'cos': 1, 'tan': 1, 'sqrt': 1, 'log': 1, 'log10': 1, 'nCr': 2, 'nPr': 2,
+             'det': 1, 'inv': 1, 'transpose': 1, 'solve': 2}
+CONSTANTS = {'pi', 'e', 'i'}
+VARIABLES = {'x', 'ANS'} | {f"R{i}" for i in range(10)}   # x du graphe, dernier résultat, registres
+
+_NUM_PATTERN = r"(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?"
+_NAME_PATTERN = r"[A-Za-z_]\w*"
+_TOKEN_RE = re.compile(rf"""
+    (?P<num>{_NUM_PATTERN})
+  | (?P<name>{_NAME_PATTERN})
+  | (?P<op>\*\*|[-+*/%^!(),@\[\]])
+  | (?P<space>\s+)
+  | (?P<bad>.)
+""", re.VERBOSE | re.DOTALL)
+
+def tokenize(text):
+    """Découpe le texte en jetons (type, texte, position)"""
+    tokens = []
+    append = tokens.append
+    for m in _TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == 'op':
+            value = m.group()
+            append(('**' if value == '^' else value, value, m.start()))
+        elif kind == 'num':
+            append((kind, m.group(), m.start()))
+        elif kind == 'name':
+            value = m.group()
+            if value == 'i' and tokens and tokens[-1][0] == 'num' and tokens[-1][2] + len(tokens[-1][1]) == m.start():
+                # « 2i » : nombre imaginaire, lu 2*i
+                append(('*', '*', m.start()))
+            append((kind, value, m.start()))
+        elif kind == 'bad':
+            raise ExprError(f"unexpected '{m.group()}'", m.start())
+    append(('end', '', len(text)))
+    return tokens
+
+# Instructions du programme RPN
+PUSH, LOAD, CALL1, CALL2, CALLN = range(5)
+
+# Opérateurs binaires : (priorité, associatif à droite)
+_BINARY = {'+': (1, False), '-': (1, False),
+           '*': (2, False), '/': (2, False), '%': (2, False), '@': (2, False),
+           '**': (4, True)}
+_UNARY_PRIORITY = 3
+
+def parse(tokens):
+    """Analyse par précédence (shunting-yard) ; produit une liste RPN (op, argument, position)
+
+    Priorités, de la plus faible à la plus forte :
+    + -  |  * / % @  |  - unaire  |  ** ^ (associatif à droite)  |  ! postfixe
+    [a, b, ...] : vecteur ou matrice (instruction CALLN '[').
+    """
+    rpn = []
+    emit = rpn.append
+    ops = []        # (priorité, instruction, nom, position) ; parenthèse ouvrante : priorité -1
+    counts = []     # arguments de chaque parenthèse ouverte, None hors appel de fonction
+    operand = True  # un opérande est attendu
+    func = None     # nom de fonction lu, '(' attendue
+    for kind, value, pos in tokens:
+        if func is not None:
+            if kind != '(':
+                raise ExprError("expected '('", pos)
+            ops.append((-1, None, func, func_pos))
+            counts.append(1)
+            func = None
+        elif operand:
+            if kind == 'num':
+                emit((PUSH, value, pos))
+                operand = False
+            elif kind == 'name':
+                if value in FUNCTIONS:
+                    func, func_pos = value, pos
+                elif value in CONSTANTS or value in VARIABLES:
+                    emit((LOAD, value, pos))
+                    operand = False
+                else:
+                    raise ExprError(f"unknown name '{value}'", pos)
+            elif kind == 'var':
+                # Valeur déjà calculée (aperçu), lue dans les variables
+                emit((LOAD, value, pos))
+                operand = False
+            elif kind == '(':
+                ops.append((-1, None, None, pos))
+                counts.append(None)
+            elif kind == '[':
+                ops.append((-1, None, '[', pos))
+                counts.append(1)
+            elif kind == '-' or kind == '+':
+                ops.append((_UNARY_PRIORITY, CALL1, 'neg' if kind == '-' else 'pos', pos))
+            elif kind == 'end':
+                raise ExprError("incomplete expression", pos)
+            else:
+                raise ExprError(f"unexpected '{value}'", pos)
+        elif kind == '!':
+            emit((CALL1, '!', pos))
+        elif kind in _BINARY:
+            priority, right = _BINARY[kind]
+            while ops and (ops[-1][0] > priority or (ops[-1][0] == priority and not right)):
+                _, op, name, op_pos = ops.pop()
+                emit((op, name, op_pos))
+            ops.append((priority, CALL2, kind, pos))
+            operand = True
+        elif kind == ')' or kind == ']' or kind == ',' or kind == 'end':
+            while ops and ops[-1][0] >= 0:
+                _, op, name, op_pos = ops.pop()
+                emit((op, name, op_pos))
+            if kind == 'end':
+                if ops:
+                    raise ExprError("expected ']'" if ops[-1][2] == '[' else "expected ')'", pos)
+            elif (not ops or (kind == ',' and counts[-1] is None)
+                  or (kind != ',' and (kind == ']') != (ops[-1][2] == '['))):
+                raise ExprError(f"unexpected '{value}'", pos)
+            elif kind == ',':
+                counts[-1] += 1
+                operand = True
+            else:
+                _, _, name, name_pos = ops.pop()
+                nargs = counts.pop()
+                if name == '[':
+                    emit((CALLN, ('[', nargs), name_pos))
+                elif name is not None:
+                    if nargs != FUNCTIONS[name]:
+                        raise ExprError(f"{name} takes {FUNCTIONS[name]} argument(s)", name_pos)
+                    if nargs == 1:
+                        emit((CALL1, name, name_pos))
+                    elif nargs == 2:
+                        emit((CALL2, name, name_pos))
+                    else:
+                        emit((CALLN, (name, nargs), name_pos))
+        else:
+            raise ExprError(f"unexpected '{value}'", pos)
+    return rpn
+
+class Program:
+    """Expression compilée en RPN, évaluable sans eval() dans plusieurs modes"""
+    def __init__(self, text, rpn):
+        self.text = text
+        self.rpn = rpn
+        self.names = {arg for op, arg, _ in rpn if op == LOAD and arg in VARIABLES}
+        # Forme normalisée : « 2^3 », « 2 ** 3 » et « (2)**3 » ont la même clé
+        self.key = tuple((op, arg) for op, arg, _ in rpn)
+        self._bound = {}
+
+    def bind(self, ops):
+        """Résout littéraux, constantes et opérateurs pour une table d'opérations"""
+        code = self._bound.get(ops)
+        if code is not None:
+            return code
+        code = []
+        for op, arg, pos in self.rpn:
+            if op == PUSH:
+                try:
+                    arg = ops['num'](arg)
+                except ArithmeticError:
+                    # Hors des float, ou exposant hors des limites de Decimal (« 5e99999999999999999999 »)
+                    raise ExprError("overflow", pos) from None
+            elif op == LOAD:
+                if arg in ops:
+                    op, arg = PUSH, ops[arg]
+            else:
+                key = arg[0] if op == CALLN else arg
+                if key not in ops:
+                    raise ExprError(f"'{key}' not available in this mode", pos)
+                arg = (ops[key], arg[1]) if op == CALLN else ops[key]
+            code.append((op, arg, pos))
+        code = tuple(code)
+        self._bound[ops] = code
+        return code
+
+    def run(self, ops=None, variables=None, deadline=0):
+        """Exécute le programme ; deadline (perf_counter_ns, 0 : aucune) : EvalDeadline au-delà"""
+        return run_code(self.bind(REAL_OPS if ops is None else ops), variables, deadline)
+
+def run_code(code, variables=None, deadline=0):
+    """Exécute un code lié par Program.bind"""
+    if variables is None:
+        variables = _NO_VARIABLES
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    arg = pos = None
+    try:
+        for op, arg, pos in code:
+            if deadline and time.perf_counter_ns() > deadline:
+                raise EvalDeadline()
+            if op == PUSH:
+                push(arg)
+            elif op == CALL2:
+                b = pop()
+                stack[-1] = arg(stack[-1], b)
+            elif op == CALL1:
+                stack[-1] = arg(stack[-1])
+            elif op == LOAD:
+                push(variables[arg])
+            else:
+                func, n = arg
+                args = stack[-n:]
+                del stack[-n:]
+                push(func(*args))
+    except (KeyError, TypeError) as e:
+        if isinstance(e, KeyError):
+            raise ExprError(f"'{arg}' undefined", pos) from None
+        raise ExprError("invalid operand", pos) from None
+    except ZeroDivisionError:
+        raise ExprError("division by zero", pos) from None
+    except (OverflowError, decimal.Overflow):
+        raise ExprError("overflow", pos) from None
+    except decimal.InvalidOperation:
+        raise ExprError("math domain error", pos) from None
+    except ValueError as e:
+        raise ExprError(str(e) or "math error", pos) from None
+    return stack[0]
+
+_NO_VARIABLES = {}
+
+@functools.lru_cache(maxsize=PROGRAM_CACHE_SIZE)
+def compile_expression(text, tokens=None):
+    """Compile un texte en Program ; les programmes sont gardés dans un cache LRU
+
+    tokens : jetons de text déjà découpés (tuple, comme tokenize), ou None.
+    """
+    return Program(text, parse(tokenize(text) if tokens is None else tokens))
+
+def evaluate(text, ops=None, variables=None, tokens=None):
+    return compile_expression(text, tokens).run(ops, variables)
+
+# Grands nombres et combinatoire
+# Au-delà de RESULT_DIGIT_BUDGET chiffres, un résultat n'est plus calculé
+# exactement (chiffres jamais affichables) mais approché en Decimal.
+APPROX_DIGITS = 20   # Chiffres significatifs gardés pour un grand nombre approché
+_APPROX = decimal.Context(prec=APPROX_DIGITS, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN,
+                          traps=[decimal.InvalidOperation, decimal.DivisionByZero, decimal.Overflow])
+_LOG10_2 = math.log10(2)
+
+# Table des petites factorielles, calculée une fois
+_FACTORIALS = list(itertools.accumulate(range(1, FACTORIAL_TABLE_SIZE), operator.mul, initial=1))
+
+class Big:
+    """Réel hors de portée des float, approché à APPROX_DIGITS chiffres (mode réel)
+
+    Se combine avec int et float par les opérateurs ; redevient float dès
+    que le résultat tient dans un float.
+    """
+    __slots__ = ('d',)
+
+    def __init__(self, d):
+        self.d = d
+
+    def __float__(self):
+        raise OverflowError("overflow")
+
+    def __neg__(self):
+        return Big(self.d.copy_negate())
+
+    def __pos__(self):
+        return self
+
+    def __add__(self, other):
+        return _big(_APPROX.add(self.d, _to_dec(other)))
+
+    def __radd__(self, other):
+        return _big(_APPROX.add(_to_dec(other), self.d))
+
+    def __sub__(self, other):
+        return _big(_APPROX.subtract(self.d, _to_dec(other)))
+
+    def __rsub__(self, other):
+        return _big(_APPROX.subtract(_to_dec(other), self.d))
+
+    def __mul__(self, other):
+        return _big(_APPROX.multiply(self.d, _to_dec(other)))
+
+    def __rmul__(self, other):
+        return _big(_APPROX.multiply(_to_dec(other), self.d))
+
+    def __truediv__(self, other):
+        return _big(_APPROX.divide(self.d, _to_dec(other)))
+
+    def __rtruediv__(self, other):
+        return _big(_APPROX.divide(_to_dec(other), self.d))
+
+    def __mod__(self, other):
+        # Le reste dépend des chiffres perdus
+        raise ValueError("result too large for exact arithmetic")
+
+    def __rmod__(self, other):
+        raise ValueError("result too large for exact arithmetic")
+
+    def __pow__(self, other):
+        return _big(_APPROX.power(self.d, _to_dec(other)))
+
+    def __rpow__(self, other):
+        return _big(_APPROX.power(_to_dec(other), self.d))
+
+def _to_dec(v):
+    return v.d if type(v) is Big else Decimal(v)
+
+def _big(d):
+    """Decimal approché -> float s'il tient dans un float, sinon Big"""
+    return float(d) if not d or d.adjusted() < 300 else Big(d)
+
+def _int_digits(n):
+    """Nombre de chiffres décimaux de |n| (par log10, à une unité près)"""
+    return math.log10(abs(n)) + 1 if n else 1
+
+def _factorial_digits(n):
+    return math.lgamma(n + 1) / math.log(10)
+
+@functools.lru_cache(maxsize=None)
+def _spouge_coefficients(prec):
+    """Coefficients de l'approximation de Spouge pour prec chiffres, calculés une fois par précision"""
+    # Erreur relative < (2π)^-(a+1/2) ; les termes alternés perdent environ prec chiffres
+    a = int(prec * 1.2531) + 2
+    ctx = _dec_context(2 * prec + 10)
+    coefficients = [ctx.sqrt(ctx.multiply(2, _dec_pi(2 * prec + 10)))]
+    fact = 1
+    for k in range(1, a):
+        if k > 1:
+            fact *= k - 1
+        c = ctx.divide(ctx.multiply(ctx.power(Decimal(a - k), Decimal(2 * k - 1) / 2), ctx.exp(Decimal(a - k))), fact)
+        coefficients.append(c if k % 2 else c.copy_negate())
+    return a, coefficients
+
+def _dec_gamma1(z, prec):
+    """z! = Γ(z+1) en Decimal à prec chiffres, z non entier négatif (Spouge, réflexion si z < 0)"""
+    ctx = _dec_context(prec + 5)
+    if z < 0:
+        z1 = ctx.add(z, 1)
+        if z1 > 0:
+            # z! = (z+1)! / (z+1)
+            return _dec_context(prec).divide(_dec_gamma1(z1, prec + 2), z1)
+        # Réflexion : Γ(x) Γ(1-x) = π / sin(πx), avec x = z+1 et Γ(1-x) = (-z-1)!
+        pi = _dec_pi(prec + 5 + max(0, z.adjusted()))
+        s = _dec_sin(_dec_context(prec + 5 + max(0, z.adjusted())).multiply(pi, z1), prec + 5)
+        if not s:
+            raise ValueError("factorial of negative integer")
+        return _dec_context(prec).divide(pi, ctx.multiply(s, _dec_gamma1(z1.copy_negate(), prec + 2)))
+    a, coefficients = _spouge_coefficients(prec + 5)
+    wctx = _dec_context(2 * (prec + 5) + 10)
+    s = coefficients[0]
+    for k in range(1, a):
+        s = wctx.add(s, wctx.divide(coefficients[k], wctx.add(z, k)))
+    za = wctx.add(z, a)
+    r = wctx.multiply(wctx.power(za, wctx.add(z, Decimal("0.5"))), wctx.exp(za.copy_negate()))
+    return _dec_context(prec).multiply(r, s)
+
+def _factorial(n, prec):
+    """n! exact (table, math.factorial), ou Decimal à prec chiffres au-delà du budget"""
+    if n < FACTORIAL_TABLE_SIZE:
+        return _FACTORIALS[n]
+    if _factorial_digits(n) > RESULT_DIGIT_BUDGET:
+        return _dec_gamma1(Decimal(n), prec)
+    return math.factorial(n)
+
+def _combinatorics(name, n, r, prec):
+    """nCr / nPr exacts (math.comb, math.perm), ou Decimal à prec chiffres au-delà du budget"""
+    if r > n:
+        return 0
+    ln10 = math.log(10)
+    digits = (math.lgamma(n + 1) - math.lgamma(n - r + 1)) / ln10
+    if name == 'nCr':
+        digits -= math.lgamma(r + 1) / ln10
+    if digits <= RESULT_DIGIT_BUDGET:
+        return math.comb(n, r) if name == 'nCr' else math.perm(n, r)
+    ctx = _dec_context(prec)
+    result = ctx.divide(_dec_gamma1(Decimal(n), prec + 2), _dec_gamma1(Decimal(n - r), prec + 2))
+    if name == 'nCr':
+        result = ctx.divide(result, _dec_gamma1(Decimal(r), prec + 2))
+    return result
+
+def _real_int(v, name):
+    """Argument entier positif d'une fonction combinatoire (mode réel)"""
+    if type(v) is Big:
+        raise OverflowError("overflow")
+    if isinstance(v, float):
+        if not v.is_integer():
+            raise ValueError(f"{name} of non-integer")
+        v = int(v)
+    if v < 0:
+        raise ValueError(f"{name} of negative")
+    return v
+
+def _real_combinatorics(name):
+    def func(n, r):
+        result = _combinatorics(name, _real_int(n, name), _real_int(r, name), APPROX_DIGITS)
+        return result if type(result) is int else Big(result)
+    return func
+
+def _real_num(text):
+    if text.isdigit():
+        return int(text)
+    v = float(text)
+    # Littéral hors des float (résultat approché rappelé) : gardé en Decimal
+    return Big(Decimal(text)) if v == math.inf else v
+
+def _real_pow(a, b):
+    if type(a) is int and type(b) is int and b > 0 and abs(a) > 1 \
+            and b * math.log10(abs(a)) >= RESULT_DIGIT_BUDGET:
+        return Big(_APPROX.power(a, b))
+    try:
+        r = a ** b
+    except OverflowError:
+        if type(a) is Big or type(b) is Big:
+            raise
+        r = _big(_APPROX.power(Decimal(a), Decimal(b)))
+    if isinstance(r, complex):
+        raise ValueError("complex result")
+    return r
+
+def _real_factorial(v):
+    if type(v) is Big:
+        raise OverflowError("overflow")
+    if isinstance(v, float) and not v.is_integer():
+        # Fonction Gamma ; au-delà des float, approchée en Decimal
+        try:
+            return math.gamma(v + 1)
+        except OverflowError:
+            return _big(_dec_gamma1(Decimal(v), APPROX_DIGITS))
+    v = int(v)
+    if v < 0:
+        raise ValueError("factorial of negative integer")
+    result = _factorial(v, APPROX_DIGITS)
+    return result if type(result) is int else Big(result)
+
+def _real_sqrt(v):
+    return _big(_APPROX.sqrt(v.d)) if type(v) is Big else math.sqrt(v)
+
+def _real_log(v):
+    return _big(_APPROX.ln(v.d)) if type(v) is Big else math.log(v)
+
+def _real_log10(v):
+    return _big(_APPROX.log10(v.d)) if type(v) is Big else math.log10(v)
+
+class OpTable(dict):
+    """Table d'opérations d'un mode : nom -> fonction ou constante
+
+    Hachée et comparée par identité : Program.bind garde ses programmes
+    résolus sous la table elle-même, qui reste ainsi en vie. Un id() aurait
+    pu être repris par une autre table après decimal_ops.cache_clear().
+    """
+    __slots__ = ()
+    __hash__ = object.__hash__
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+
+# Table d'opérations du mode réel (flottants / entiers Python)
+REAL_OPS = OpTable({
+    'num': _real_num,
+    '+': operator.add, '-': operator.sub, '*': operator.mul,
+    '/': operator.truediv, '%': operator.mod, '**': _real_pow,
+    'neg': operator.neg, 'pos': operator.pos, '!': _real_factorial,
+    'sin': math.sin, 'cos': math.cos, 'tan': math.tan, 'sqrt': _real_sqrt,
+    'log': _real_log, 'log10': _real_log10,
+    'nCr': _real_combinatorics('nCr'), 'nPr': _real_combinatorics('nPr'),
+    'pi': math.pi, 'e': math.e,
+})
+
+# Mode décimal : précision arbitraire, rationnels exacts tant que possible
+COMPLEX_MODE = 'complex'             # Mode complexe et matriciel (« CPLX »)
+PRECISION_LEVELS = (None, 50, 100, COMPLEX_MODE)   # Touche M ; None : flottants binaires
+DECIMAL_GUARD = 10          # Chiffres de garde des calculs intermédiaires
+DECIMAL_MEMO_SIZE = 256     # Résultats de fonctions gardés par niveau de précision
+
+@functools.lru_cache(maxsize=None)
+def _dec_context(prec):
+    return decimal.Context(prec=prec, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN,
+                           traps=[decimal.InvalidOperation, decimal.DivisionByZero, decimal.Overflow])
+
+@functools.lru_cache(maxsize=None)
+def _dec_pi(prec):
+    """π à prec chiffres (série de la documentation de decimal), calculé une fois par précision"""
+    ctx = _dec_context(prec + 2)
+    three = Decimal(3)
+    lasts, t, s, n, na, d, da = 0, three, three, 1, 0, 0, 24
+    while s != lasts:
+        lasts = s
+        n, na = n + na, na + 8
+        d, da = d + da, da + 32
+        t = ctx.divide(ctx.multiply(t, n), d)
+        s = ctx.add(s, t)
+    return _dec_context(prec).plus(s)
+
+@functools.lru_cache(maxsize=None)
+def _dec_e(prec):
+    return _dec_context(prec).exp(Decimal(1))
+
+def _dec_sin(x, prec):
+    """sin(x) à prec chiffres : réduction modulo 2π puis série de Taylor"""
+    # Réduction : π avec autant de chiffres en plus que x en a avant la virgule
+    wp = prec + max(0, x.adjusted()) + 2
+    ctx = _dec_context(wp)
+    pi = _dec_pi(wp)
+    two_pi = ctx.multiply(pi, 2)
+    r = ctx.subtract(x, ctx.multiply(two_pi, ctx.divide(x, two_pi).to_integral_value()))
+    half_pi = ctx.divide(pi, 2)
+    # Pas de - ni abs() sur un Decimal : ils arrondissent au contexte global (28 chiffres)
+    if r > half_pi:
+        r = ctx.subtract(pi, r)
+    elif r < half_pi.copy_negate():
+        r = ctx.subtract(pi.copy_negate(), r)
+    ctx = _dec_context(prec + 2)
+    r2 = ctx.multiply(r, r)
+    term = s = r
+    n = 1
+    while term:
+        term = ctx.divide(ctx.multiply(term.copy_negate(), r2), (n + 1) * (n + 2))
+        n += 2
+        if term.copy_abs() <= s.copy_abs().scaleb(-prec - 2):
+            break
+        s = ctx.add(s, term)
+    return _dec_context(prec).plus(s)
+
+def _exact_sqrt(q):
+    """Racine d'un rationnel carré parfait, sinon None"""
+    if q < 0:
+        return None
+    num, den = math.isqrt(q.numerator), math.isqrt(q.denominator)
+    if num * num == q.numerator and den * den == q.denominator:
+        return Fraction(num, den)
+    return None
+
+@functools.lru_cache(maxsize=None)
+def decimal_ops(digits):
+    """Table d'opérations du mode décimal à digits chiffres significatifs
+
+    Les littéraux sont des Fraction : + - * / % et les puissances entières
+    restent exactes. Le reste (racines, puissances non entières, fonctions)
+    passe en Decimal avec DECIMAL_GUARD chiffres de garde. Constantes et
+    résultats de fonctions sont mémorisés pour ce niveau de précision.
+    Une table par niveau : Program.bind les résout une fois chacune.
+    """
+    prec = digits + DECIMAL_GUARD
+    ctx = _dec_context(prec)
+
+    def dec(v):
+        if type(v) is Fraction:
+            return ctx.divide(Decimal(v.numerator), Decimal(v.denominator))
+        return v
+
+    def memo(func):
+        return functools.lru_cache(maxsize=DECIMAL_MEMO_SIZE)(func)
+
+    def num(text):
+        d = Decimal(text)
+        # Exposant énorme (résultat approché rappelé) : pas de Fraction à des millions de chiffres
+        return d if d.adjusted() > RESULT_DIGIT_BUDGET else Fraction(d)
+
+    def mixed(exact, inexact):
+        def op(a, b):
+            if type(a) is Fraction and type(b) is Fraction:
+                return exact(a, b)
+            return inexact(dec(a), dec(b))
+        return op
+
+    def mod(a, b):
+        # Signe du diviseur, comme en mode réel (remainder suit le dividende)
+        if not b:
+            raise ZeroDivisionError
+        r = ctx.remainder(a, b)
+        if r and (r < 0) != (b < 0):
+            r = ctx.add(r, b)
+        return r
+
+    def power(a, b):
+        if not a and b < 0:
+            # decimal rend Infinity sans signal ; comme 0.0 ** -1 en mode réel
+            raise ZeroDivisionError
+        if type(b) is Fraction and b.denominator == 1:
+            # Taille de la fraction exacte, pas de sa valeur : (1001/1000)^200000 a 600 000 chiffres
+            if type(a) is Fraction and (abs(b.numerator) * math.log10(max(abs(a.numerator), a.denominator))
+                                        < RESULT_DIGIT_BUDGET):
+                return a ** b.numerator
+            return ctx.power(dec(a), b.numerator)
+        a, b = dec(a), dec(b)
+        if a < 0:
+            raise ValueError("complex result")
+        return ctx.power(a, b)
+
+    def neg(v):
+        return -v if type(v) is Fraction else v.copy_negate()
+
+    def integer(v):
+        """Entier d'un Fraction ou Decimal entier, sinon None"""
+        if type(v) is Fraction:
+            return v.numerator if v.denominator == 1 else None
+        return int(v) if v == v.to_integral_value() else None
+
+    def exact(result):
+        return Fraction(result) if type(result) is int else result
+
+    @memo
+    def factorial(v):
+        n = integer(v)
+        if n is None:
+            # Fonction Gamma
+            return _dec_gamma1(dec(v), prec)
+        if n < 0:
+            raise ValueError("factorial of negative integer")
+        return exact(_factorial(n, prec))
+
+    def combinatorics(name):
+        def func(n, r):
+            n, r = integer(n), integer(r)
+            if n is None or r is None:
+                raise ValueError(f"{name} of non-integer")
+            if n < 0 or r < 0:
+                raise ValueError(f"{name} of negative")
+            return exact(_combinatorics(name, n, r, prec))
+        return func
+
+    @memo
+    def sqrt(v):
+        if type(v) is Fraction:
+            root = _exact_sqrt(v)
+            if root is not None:
+                return root
+        if v < 0:
+            raise ValueError("math domain error")
+        return dec(v).sqrt(ctx)
+
+    @memo
+    def sin(v):
+        return _dec_sin(dec(v), prec)
+
+    @memo
+    def cos(v):
+        return _dec_sin(ctx.subtract(ctx.divide(_dec_pi(prec + 2), 2), dec(v)), prec)
+
+    @memo
+    def tan(v):
+        return ctx.divide(sin(v), cos(v))
+
+    @memo
+    def log(v):
+        if v <= 0:
+            raise ValueError("math domain error")
+        return dec(v).ln(ctx)
+
+    @memo
+    def log10(v):
+        if v <= 0:
+            raise ValueError("math domain error")
+        return dec(v).log10(ctx)
+
+    return OpTable({
+        'num': num,
+        '+': mixed(operator.add, ctx.add), '-': mixed(operator.sub, ctx.subtract),
+        '*': mixed(operator.mul, ctx.multiply), '/': mixed(operator.truediv, ctx.divide),
+        '%': mixed(operator.mod, mod), '**': power,
+        'neg': neg, 'pos': lambda v: v, '!': factorial,
+        'sin': sin, 'cos': cos, 'tan': tan, 'sqrt': sqrt, 'log': log, 'log10': log10,
+        'nCr': combinatorics('nCr'), 'nPr': combinatorics('nPr'),
+        'pi': _dec_pi(prec), 'e': _dec_e(prec),
+    })
+
+def format_decimal(result, digits):
+    """Texte d'un résultat du mode décimal : digits chiffres significatifs et décimales au plus"""
+    if type(result) is Fraction:
+        if result.denominator == 1:
+            return format_result(result.numerator)
+        result = _dec_context(digits + DECIMAL_GUARD).divide(Decimal(result.numerator), Decimal(result.denominator))
+    ctx = _dec_context(digits)
+    d = ctx.plus(result)
+    # Comme round(result, 10) en mode réel : les résidus (sin(pi)) disparaissent
+    if d.as_tuple().exponent < -digits:
+        d = d.quantize(Decimal(1).scaleb(-digits), context=_dec_context(digits * 2 + DECIMAL_GUARD))
+    d = d.normalize(ctx)
+    if not d:
+        return "0"
+    if d.adjusted() < digits:
+        return format(d, 'f')
+    return format(d, 'E')
+
+# Évaluation vectorielle : un programme appliqué à un lot d'abscisses
+def _vsafe(func):
+    def safe(*args):
+        try:
+            return float(func(*args))
+        except (ValueError, ZeroDivisionError, OverflowError, TypeError):
+            return math.nan
+    return safe
+
+def _vlift(func):
+    """Fonction scalaire appliquée élément par élément à des array('d'), NaN si indéfinie"""
+    safe = _vsafe(func)
+    def lifted(*args):
+        n = next((len(a) for a in args if isinstance(a, array)), None)
+        if n is None:
+            return safe(*args)
+        cols = [a if isinstance(a, array) else itertools.repeat(a, n) for a in args]
+        return array('d', map(safe, *cols))
+    return lifted
+
+def _gamma_factorial(v):
+    return math.gamma(v + 1)
+
+# Repli sans NumPy : module array de la bibliothèque standard
+ARRAY_OPS = OpTable({
+    'num': float,
+    '+': _vlift(operator.add), '-': _vlift(operator.sub), '*': _vlift(operator.mul),
+    '/': _vlift(operator.truediv), '%': _vlift(operator.mod), '**': _vlift(_real_pow),
+    'neg': _vlift(operator.neg), 'pos': _vlift(operator.pos), '!': _vlift(_gamma_factorial),
+    'sin': _vlift(math.sin), 'cos': _vlift(math.cos), 'tan': _vlift(math.tan),
+    'sqrt': _vlift(math.sqrt), 'log': _vlift(math.log), 'log10': _vlift(math.log10),
+    'nCr': _vlift(_real_combinatorics('nCr')), 'nPr': _vlift(_real_combinatorics('nPr')),
+    'pi': math.pi, 'e': math.e,
+})
+
+if np is not None:
+    _np_gamma = np.frompyfunc(_vsafe(_gamma_factorial), 1, 1)
+    _np_ncr = np.frompyfunc(_vsafe(_real_combinatorics('nCr')), 2, 1)
+    _np_npr = np.frompyfunc(_vsafe(_real_combinatorics('nPr')), 2, 1)
+    NUMPY_OPS = OpTable({
+        'num': float,
+        '+': np.add, '-': np.subtract, '*': np.multiply,
+        '/': np.true_divide, '%': np.mod, '**': np.power,
+        'neg': np.negative, 'pos': np.positive,
+        '!': lambda v: np.asarray(_np_gamma(v), dtype=float),
+        'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+        'sqrt': np.sqrt, 'log': np.log, 'log10': np.log10,
+        'nCr': lambda n, r: np.asarray(_np_ncr(n, r), dtype=float),
+        'nPr': lambda n, r: np.asarray(_np_npr(n, r), dtype=float),
+        'pi': math.pi, 'e': math.e,
+    })
+else:
+    NUMPY_OPS = None
+
+# Mode complexe et matriciel : scalaires Python (float, complex), tableaux NumPy
+MATRIX_ROWS_SHOWN = 6       # Lignes d'une matrice écrites dans l'historique
+MATRIX_COLS_SHOWN = 8       # Coefficients affichés par ligne
+MATRIX_ENTRY_DIGITS = 6     # Chiffres significatifs des coefficients affichés
+
+def _is_array(v):
+    return np is not None and isinstance(v, np.ndarray)
+
+def _is_complex(v):
+    if _is_array(v):
+        return np.iscomplexobj(v)
+    return type(v) is complex
+
+def _has_zero(v):
+    return bool(np.any(v == 0)) if _is_array(v) else not v
+
+def _cvalue(r):
+    """Résultat d'une opération du mode complexe : float si la partie imaginaire est nulle"""
+    if np is not None:
+        if isinstance(r, np.ndarray):
+            if r.ndim:
+                if not np.all(np.isfinite(r)):
+                    raise OverflowError("overflow")
+                return r.real if np.iscomplexobj(r) and not np.any(r.imag) else r
+            r = r.item()
+        elif isinstance(r, np.generic):
+            r = r.item()
+    if type(r) is complex:
+        if not (math.isfinite(r.real) and math.isfinite(r.imag)):
+            raise OverflowError("overflow")
+        return r if r.imag else r.real
+    r = float(r)   # int, Big : OverflowError au-delà des float
+    if not math.isfinite(r):
+        raise OverflowError("overflow")
+    return r
+
+def _complex_op(func):
+    """Opération du mode complexe : avertissements NumPy coupés, résultat normalisé"""
+    if np is None:
+        return lambda *args: _cvalue(func(*args))
+    def op(*args):
+        with np.errstate(all='ignore'):
+            return _cvalue(func(*args))
+    return op
+
+def _elementwise(func):
+    """Opération terme à terme ; formes incompatibles -> « dimension mismatch »"""
+    def op(a, b):
+        try:
+            return func(a, b)
+        except ValueError:
+            if _is_array(a) and _is_array(b):
+                raise ValueError("dimension mismatch") from None
+            raise
+    return op
+
+def _cdiv(a, b):
+    if _has_zero(b):
+        raise ZeroDivisionError("division by zero")
+    return a / b
+
+def _cmod(a, b):
+    if _is_complex(a) or _is_complex(b):
+        raise ValueError("modulo of complex")
+    if _has_zero(b):
+        raise ZeroDivisionError("division by zero")
+    return a % b
+
+def _cpow(a, b):
+    if _is_array(a) or _is_array(b):
+        return np.emath.power(a, b)
+    if not a and b.real < 0:
+        raise ZeroDivisionError("division by zero")
+    return a ** b
+
+def _creal(name, func):
+    """Fonction réservée aux scalaires réels (factorielle, nCr, nPr)"""
+    def op(*args):
+        for v in args:
+            if _is_array(v):
+                raise ValueError(f"{name} of a matrix")
+            if type(v) is complex:
+                raise ValueError(f"{name} of complex")
+        return func(*args)
+    return op
+
+def _cfunc(name):
+    """Fonction élémentaire prolongée aux complexes (branche principale)"""
+    if np is None:
+        func = getattr(cmath, name)
+    else:
+        func = getattr(np.emath, name, None) or getattr(np, name)
+    if name.startswith('log'):
+        def log(v):
+            if _has_zero(v):
+                raise ValueError("math domain error")
+            return func(v)
+        return log
+    return func
+
+def _need_numpy():
+    if np is None:
+        raise ValueError("matrices need NumPy")
+
+def _matrix(v, name):
+    _need_numpy()
+    if not _is_array(v) or v.ndim != 2:
+        raise ValueError(f"{name} of a non-matrix")
+    if v.shape[0] != v.shape[1]:
+        raise ValueError(f"{name} of a non-square matrix")
+    return v
+
+def _cbrackets(*items):
+    """[a, b, ...] : vecteur de scalaires ou matrice de lignes de même longueur"""
+    _need_numpy()
+    arrays = [v for v in items if _is_array(v)]
+    if not arrays:
+        return np.array(items)
+    if len(arrays) != len(items) or any(v.ndim != 1 for v in arrays):
+        raise ValueError("matrix rows must be vectors")
+    if any(len(v) != len(arrays[0]) for v in arrays):
+        raise ValueError("rows of different lengths")
+    return np.array(items)
+
+def _cmatmul(a, b):
+    _need_numpy()
+    if not (_is_array(a) and _is_array(b)):
+        raise ValueError("@ of a non-matrix")
+    return _elementwise(np.matmul)(a, b)
+
+def _cdet(v):
+    v = _matrix(v, 'det')
+    return np.linalg.det(v)
+
+def _cinv(v):
+    v = _matrix(v, 'inv')
+    try:
+        return np.linalg.inv(v)
+    except np.linalg.LinAlgError:
+        raise ValueError("singular matrix") from None
+
+def _ctranspose(v):
+    _need_numpy()
+    if not _is_array(v):
+        raise ValueError("transpose of a scalar")
+    return v.T
+
+def _csolve(a, b):
+    """Solution x de a @ x = b (b vecteur ou matrice de seconds membres)"""
+    _matrix(a, 'solve')
+    if not _is_array(b) or b.ndim > 2 or len(b) != len(a):
+        raise ValueError("dimension mismatch")
+    try:
+        return np.linalg.solve(a, b)
+    except np.linalg.LinAlgError:
+        raise ValueError("singular matrix") from None
+
+def _complex_num(text):
+    # Littéral hors des float (1e400) : « overflow » plutôt qu'un Infinity affiché
+    return _cvalue(float(text))
+
+COMPLEX_OPS = OpTable({
+    'num': _complex_num,
+    '+': _complex_op(_elementwise(operator.add)), '-': _complex_op(_elementwise(operator.sub)),
+    '*': _complex_op(_elementwise(operator.mul)), '/': _complex_op(_elementwise(_cdiv)),
+    '%': _complex_op(_elementwise(_cmod)), '**': _complex_op(_elementwise(_cpow)),
+    '@': _complex_op(_cmatmul),
+    'neg': _complex_op(operator.neg), 'pos': _complex_op(operator.pos),
+    '!': _complex_op(_creal('factorial', _real_factorial)),
+    'sin': _complex_op(_cfunc('sin')), 'cos': _complex_op(_cfunc('cos')), 'tan': _complex_op(_cfunc('tan')),
+    'sqrt': _complex_op(_cfunc('sqrt')), 'log': _complex_op(_cfunc('log')),
+    'log10': _complex_op(_cfunc('log10')),
+    'nCr': _complex_op(_creal('nCr', _real_combinatorics('nCr'))),
+    'nPr': _complex_op(_creal('nPr', _real_combinatorics('nPr'))),
+    '[': _complex_op(_cbrackets),
+    'det': _complex_op(_cdet), 'inv': _complex_op(_cinv),
+    'transpose': _complex_op(_ctranspose), 'solve': _complex_op(_csolve),
+    'pi': math.pi, 'e': math.e, 'i': 1j,
+})
+
+def mode_ops(precision):
+    """Table d'opérations d'un mode : réel (None), décimal (chiffres) ou complexe"""
+    if precision is None:
+        return REAL_OPS
+    if precision == COMPLEX_MODE:
+        return COMPLEX_OPS
+    return decimal_ops(precision)
+
+def linspace(start, stop, n):
+    if np is not None:
+        return np.linspace(start, stop, n)
+    step = (stop - start) / (n - 1) if n > 1 else 0.0
+    return array('d', [start + i * step for i in range(n)])
+
+def sample_function(program, xs):
+    """Évalue un programme en x sur tout le lot xs en une passe ; NaN hors domaine"""
+    if np is not None:
+        with np.errstate(all='ignore'):
+            ys = program.run(NUMPY_OPS, {'x': xs})
+        return np.broadcast_to(np.asarray(ys, dtype=float), xs.shape)
+    ys = program.run(ARRAY_OPS, {'x': xs})
+    if not isinstance(ys, array):
+        ys = array('d', [_vsafe(float)(ys)]) * len(xs)
+    return ys
+
+# Résolution numérique sur graph_func (touches O et B)
+_EPS = sys.float_info.epsilon
+_CGOLD = (3 - math.sqrt(5)) / 2
+
+# Gauss-Kronrod 7-15 : nœuds sur [-1, 1], poids de Kronrod et de Gauss (0 hors nœuds de Gauss)
+_GK_XK = (0.991455371120812639206854697526329, 0.949107912342758524526189684047851,
+          0.864864423359769072789712788640926, 0.741531185599394439863864773280788,
+          0.586087235467691130294144845693013, 0.405845151377397166906606412076961,
+          0.207784955007898467600689403773245, 0.0)
+_GK_WK = (0.022935322010529224963732008058970, 0.063092092629978553290700663189204,
+          0.104790010322250183839876322541518, 0.140653259715525918745189590510238,
+          0.169004726639267902826583426598550, 0.190350578064785409913256402421014,
+          0.204432940075298892414161999234649, 0.209482141084727828012999174891714)
+_GK_WG = (0.0, 0.129484966168869693270611432679082, 0.0, 0.279705391489276667901467771423780,
+          0.0, 0.381830050505118944950369775488975, 0.0, 0.417959183673469387755102040816327)
+_GK_NODES = tuple(-x for x in _GK_XK[:-1]) + _GK_XK[::-1]
+_GK_KRONROD = _GK_WK[:-1] + _GK_WK[::-1]
+_GK_GAUSS = _GK_WG[:-1] + _GK_WG[::-1]
+
+class FunctionSampler:
+    """Évaluations comptées d'un programme en x, par lots (un seul passage du programme par lot)
+
+    sign -1 : la fonction opposée (maximum cherché comme un minimum).
+    Les valeurs non finies sont rendues en NaN.
+    """
+    def __init__(self, program, sign=1.0):
+        self.program = program
+        self.sign = sign
+        self.evals = 0
+
+    def batch(self, xs):
+        self.evals += len(xs)
+        points = np.asarray(xs, dtype=float) if np is not None else array('d', xs)
+        sign = self.sign
+        return [sign * y if math.isfinite(y) else math.nan
+                for y in sample_function(self.program, points).tolist()]
+
+    def __call__(self, x):
+        return self.batch([x])[0]
+
+def _scan(f, a, b):
+    xs = linspace(a, b, SOLVER_SCAN_POINTS + 1).tolist()
+    return xs, f.batch(xs)
+
+def _brent_root(f, a, b, fa, fb):
+    """Méthode de Brent (van Wijngaarden-Dekker-Brent) sur un encadrement fa*fb < 0"""
+    c, fc = b, fb
+    d = e = b - a
+    for _ in range(SOLVER_MAX_STEPS):
+        if (fb > 0) == (fc > 0):
+            c, fc = a, fa
+            d = e = b - a
+        if abs(fc) < abs(fb):
+            a, b, c = b, c, b
+            fa, fb, fc = fb, fc, fb
+        tol = 2 * _EPS * abs(b) + 1e-300
+        m = 0.5 * (c - b)
+        if abs(m) <= tol or fb == 0:
+            break
+        if abs(e) >= tol and abs(fa) > abs(fb):
+            # Interpolation (sécante ou quadratique inverse)
+            s = fb / fa
+            if a == c:
+                p = 2 * m * s
+                q = 1 - s
+            else:
+                q = fa / fc
+                r = fb / fc
+                p = s * (2 * m * q * (q - r) - (b - a) * (r - 1))
+                q = (q - 1) * (r - 1) * (s - 1)
+            if p > 0:
+                q = -q
+            else:
+                p = -p
+            if 2 * p < min(3 * m * q - abs(tol * q), abs(e * q)):
+                e, d = d, p / q
+            else:
+                d = e = m
+        else:
+            # Bissection
+            d = e = m
+        a, fa = b, fb
+        b += d if abs(d) > tol else math.copysign(tol, m)
+        fb = f(b)
+        if math.isnan(fb):
+            raise ExprError(f"undefined near x={format_result(b)}", None)
+    return b, fb
+
+def _brent_min(f, a, b, x, fx):
+    """Minimum de Brent (section dorée et interpolation parabolique), a < x < b, f(x) <= f(a), f(b)"""
+    w = v = x
+    fw = fv = fx
+    d = e = 0.0
+    for _ in range(SOLVER_MAX_STEPS):
+        xm = 0.5 * (a + b)
+        tol1 = math.sqrt(_EPS) * abs(x) + 1e-12
+        tol2 = 2 * tol1
+        if abs(x - xm) <= tol2 - 0.5 * (b - a):
+            break
+        golden = True
+        if abs(e) > tol1:
+            r = (x - w) * (fx - fv)
+            q = (x - v) * (fx - fw)
+            p = (x - v) * q - (x - w) * r
+            q = 2 * (q - r)
+            if q > 0:
+                p = -p
+            q = abs(q)
+            if abs(p) < abs(0.5 * q * e) and q * (a - x) < p < q * (b - x):
+                e, d = d, p / q
+                u = x + d
+                if u - a < tol2 or b - u < tol2:
+                    d = math.copysign(tol1, xm - x)
+                golden = False
+        if golden:
+            e = (a - x) if x >= xm else (b - x)
+            d = _CGOLD * e
+        u = x + d if abs(d) >= tol1 else x + math.copysign(tol1, d)
+        fu = f(u)
+        if math.isnan(fu):
+            fu = math.inf
+        if fu <= fx:
+            if u >= x:
+                a = x
+            else:
+                b = x
+            v, w, x = w, x, u
+            fv, fw, fx = fw, fx, fu
+        else:
+            if u < x:
+                a = u
+            else:
+                b = u
+            if fu <= fw or w == x:
+                v, w = w, u
+                fv, fw = fw, fu
+            elif fu <= fv or v == x or v == w:
+                v, fv = u, fu
+    return x, fx
+
+def find_root(f, a, b):
+    """Zéro de f dans [a, b] : balayage vectorisé, puis Brent sur le premier changement de signe"""
+    xs, ys = _scan(f, a, b)
+    for i in range(len(xs) - 1):
+        y0, y1 = ys[i], ys[i + 1]
+        if y0 == 0:
+            return xs[i]
+        if (y0 < 0 < y1) or (y1 < 0 < y0):
+            x, fx = _brent_root(f, xs[i], xs[i + 1], y0, y1)
+            # Changement de signe par un pôle (1/x) : pas de zéro
+            if abs(fx) > max(abs(y0), abs(y1)):
+                raise ExprError(f"discontinuity at x={format_result(x)}", None)
+            return x
+    if ys[-1] == 0:
+        return xs[-1]
+    raise ExprError("no sign change", None)
+
+def find_minimum(f, a, b):
+    """Minimum de f sur [a, b] : meilleur point du balayage, affiné par Brent entre ses voisins"""
+    xs, ys = _scan(f, a, b)
+    best = None
+    for i, y in enumerate(ys):
+        if y == y and (best is None or y < ys[best]):
+            best = i
+    if best is None:
+        raise ExprError("undefined on the interval", None)
+    if best == 0 or best == len(xs) - 1:
+        return xs[best], ys[best]
+    return _brent_min(f, xs[best - 1], xs[best + 1], xs[best], ys[best])
+
+def integrate(f, a, b):
+    """Intégrale de f sur [a, b] par Gauss-Kronrod 7-15 adaptatif
+
+    À chaque passe, tous les sous-intervalles encore imprécis sont évalués
+    en un seul lot (15 nœuds chacun), puis coupés en deux.
+    Renvoie (valeur, erreur estimée).
+    """
+    pending = [(a + (b - a) * k / 8, a + (b - a) * (k + 1) / 8) for k in range(8)]
+    total = error = 0.0
+    tol = None
+    while pending:
+        xs = [0.5 * (lo + hi) + 0.5 * (hi - lo) * t for lo, hi in pending for t in _GK_NODES]
+        ys = f.batch(xs)
+        last = f.evals + len(xs) > INTEGRAL_MAX_EVALS
+        estimates = []
+        for k, (lo, hi) in enumerate(pending):
+            vals = ys[15 * k:15 * k + 15]
+            half = 0.5 * (hi - lo)
+            kronrod = half * math.fsum(w * y for w, y in zip(_GK_KRONROD, vals))
+            gauss = half * math.fsum(w * y for w, y in zip(_GK_GAUSS, vals))
+            if kronrod != kronrod:
+                raise ExprError("undefined on the interval", None)
+            estimates.append((lo, hi, kronrod, abs(kronrod - gauss)))
+        if tol is None:
+            tol = INTEGRAL_TOL * max(abs(math.fsum(e[2] for e in estimates)), 1.0)
+        pending = []
+        for lo, hi, value, err in estimates:
+            mid = 0.5 * (lo + hi)
+            if err <= tol * (hi - lo) / (b - a) or last or not lo < mid < hi:
+                total += value
+                error += err
+            else:
+                pending += [(lo, mid), (mid, hi)]
+    # Budget épuisé loin de la précision visée (singularité non intégrable)
+    if error > 1e-4 * max(abs(total), 1.0):
+        raise ExprError("integral does not converge", None)
+    return total, error
+
+# Statistiques en une passe (touche Y, --stats)
+class QuantileSketch:
+    """Quantiles approchés en mémoire bornée (compacteurs à la KLL)
+
+    Le niveau h garde des valeurs de poids 2**h. Un niveau plein est trié et
+    une valeur sur deux (décalage alterné) monte au niveau suivant : au plus
+    size valeurs par niveau, environ log2(n / size) niveaux. Exact tant que
+    toutes les valeurs tiennent dans le premier niveau.
+    """
+    def __init__(self, size=STATS_SKETCH_SIZE):
+        self.size = size
+        self.levels = [[]]
+        self.offsets = [0]
+
+    def extend(self, values):
+        level = self.levels[0]
+        self.levels[0] = np.concatenate((level, values)) if np is not None else level + list(values)
+        h = 0
+        while len(self.levels[h]) > self.size:
+            self._compact(h)
+            h += 1
+
+    def _compact(self, h):
+        items = np.sort(self.levels[h]) if np is not None else sorted(self.levels[h])
+        if h + 1 == len(self.levels):
+            self.levels.append([])
+            self.offsets.append(0)
+        # Nombre impair : la plus grande valeur reste, le poids total est conservé
+        odd = len(items) % 2
+        promoted = items[self.offsets[h]:len(items) - odd:2]
+        self.offsets[h] ^= 1
+        self.levels[h] = items[len(items) - odd:]
+        upper = self.levels[h + 1]
+        self.levels[h + 1] = np.concatenate((upper, promoted)) if np is not None else upper + promoted
+
+    def quantiles(self, qs):
+        """Quantiles q de [0, 1], interpolés entre rangs comme numpy.quantile"""
+        items = sorted(itertools.chain.from_iterable(
+            zip(level if isinstance(level, list) else level.tolist(), itertools.repeat(1 << h))
+            for h, level in enumerate(self.levels)))
+        if not items:
+            return [math.nan for _ in qs]
+        ranks = list(itertools.accumulate(w for _, w in items))
+        result = []
+        for q in qs:
+            pos = q * (ranks[-1] - 1)
+            lo = math.floor(pos)
+            a = items[bisect.bisect_right(ranks, lo)][0]
+            b = items[min(bisect.bisect_right(ranks, lo + 1), len(items) - 1)][0]
+            result.append(a + (b - a) * (pos - lo))
+        return result
+
+class StreamStats:
+    """Moyenne, variance, extrêmes, quantiles et régression en une passe, mémoire bornée
+
+    Une colonne : x seul ; deux colonnes : paires (x, y) et régression
+    y = a + b·x. Une valeur saisie met à jour l'accumulateur de Welford ;
+    un bloc lu est résumé (moyenne, écarts) puis fusionné par les formules
+    de Chan. Jamais de somme des carrés brute, qui perd ses chiffres sur
+    les longues séries.
+    """
+    __slots__ = ('columns', 'n', 'mean_x', 'm2_x', 'mean_y', 'm2_y', 'c_xy', 'min', 'max', 'skipped', 'sketch')
+
+    def __init__(self):
+        self.columns = None
+        self.n = 0
+        self.mean_x = self.m2_x = 0.0
+        self.mean_y = self.m2_y = 0.0
+        self.c_xy = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.skipped = 0
+        self.sketch = QuantileSketch()
+
+    def _check(self, columns):
+        if self.columns is None:
+            self.columns = columns
+        elif columns != self.columns:
+            raise ExprError("expected x,y" if self.columns == 2 else "expected a single value", None)
+
+    def add(self, x, y=None):
+        """Une valeur (ou une paire) : mise à jour de Welford"""
+        self._check(1 if y is None else 2)
+        self.n += 1
+        dx = x - self.mean_x
+        self.mean_x += dx / self.n
+        self.m2_x += dx * (x - self.mean_x)
+        if y is not None:
+            dy = y - self.mean_y
+            self.mean_y += dy / self.n
+            self.m2_y += dy * (y - self.mean_y)
+            self.c_xy += dx * (y - self.mean_y)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        self.sketch.extend((x,))
+
+    def add_block(self, xs, ys=None):
+        """Bloc de valeurs finies (tableaux NumPy ou listes) : résumé fusionné à l'accumulateur"""
+        nb = len(xs)
+        if not nb:
+            return
+        self._check(1 if ys is None else 2)
+        if np is not None:
+            mx = float(xs.mean())
+            dxs = xs - mx
+            m2x = float(dxs @ dxs)
+            lo, hi = float(xs.min()), float(xs.max())
+            if ys is not None:
+                my = float(ys.mean())
+                dys = ys - my
+                m2y = float(dys @ dys)
+                cxy = float(dxs @ dys)
+        else:
+            mx = math.fsum(xs) / nb
+            m2x = math.fsum((v - mx) ** 2 for v in xs)
+            lo, hi = min(xs), max(xs)
+            if ys is not None:
+                my = math.fsum(ys) / nb
+                m2y = math.fsum((v - my) ** 2 for v in ys)
+                cxy = math.fsum((u - mx) * (v - my) for u, v in zip(xs, ys))
+        n = self.n + nb
+        weight = self.n * nb / n
+        dx = mx - self.mean_x
+        self.mean_x += dx * nb / n
+        self.m2_x += m2x + dx * dx * weight
+        if ys is not None:
+            dy = my - self.mean_y
+            self.mean_y += dy * nb / n
+            self.m2_y += m2y + dy * dy * weight
+            self.c_xy += cxy + dx * dy * weight
+        self.n = n
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+        self.sketch.extend(xs)
+
+    def report(self):
+        """Lignes du résultat pour l'historique (écart type et variance d'échantillon, n-1)"""
+        if not self.n:
+            return ["= Error: no data"]
+        lines = [f"n = {self.n}" + (f"  ({self.skipped} skipped)" if self.skipped else ""),
+                 f"mean = {format_result(self.mean_x)}"]
+        if self.n > 1:
+            var = self.m2_x / (self.n - 1)
+            lines += [f"sd = {format_result(math.sqrt(var))}", f"var = {format_result(var)}"]
+        lines += [f"min = {format_result(self.min)}", f"max = {format_result(self.max)}"]
+        q1, median, q3 = self.sketch.quantiles((0.25, 0.5, 0.75))
+        lines += [f"q1 = {format_result(q1)}", f"median = {format_result(median)}", f"q3 = {format_result(q3)}"]
+        if self.columns == 2:
+            lines.append(f"mean y = {format_result(self.mean_y)}")
+            if self.n > 1:
+                lines.append(f"sd y = {format_result(math.sqrt(self.m2_y / (self.n - 1)))}")
+            if self.m2_x > 0:
+                b = self.c_xy / self.m2_x
+                lines += ["y = a + b*x", f"a = {format_result(self.mean_y - b * self.mean_x)}",
+                          f"b = {format_result(b)}"]
+                if self.m2_y > 0:
+                    lines.append(f"r = {format_result(self.c_xy / math.sqrt(self.m2_x * self.m2_y))}")
+            else:
+                lines.append("= Error: no regression, x is constant")
+        return lines
+
+_STATS_SEPARATORS = bytes.maketrans(b",;\t", b"   ")
+
+def _row_width(text):
+    """Valeurs par ligne de données : celles de la première ligne entièrement numérique"""
+    for line in text.split(b"\n"):
+        parts = line.split()
+        try:
+            [float(p) for p in parts]
+        except ValueError:
+            continue
+        if parts:
+            return len(parts)
+    return None
+
+def _parse_rows(text, width):
+    """Colonnes x et y (None) d'un bloc de lignes, et lignes ignorées
+
+    NumPy convertit le bloc d'un coup ; un en-tête, une ligne incomplète ou
+    une ligne vide font relire le bloc ligne par ligne.
+    """
+    if np is not None:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            try:
+                flat = np.fromstring(text, sep=' ')
+            except (ValueError, DeprecationWarning):
+                flat = None
+        rows = text.count(b"\n") + (not text.endswith(b"\n"))
+        if flat is not None and flat.size == rows * width:
+            table = flat.reshape(rows, width)[:, :2]
+            table = table[np.isfinite(table).all(axis=1)]
+            return table[:, 0], (table[:, 1] if width > 1 else None), rows - len(table)
+    xs, ys, skipped = [], [], 0
+    for line in text.split(b"\n"):
+        parts = line.split()
+        if not parts:
+            continue
+        try:
+            values = [float(p) for p in parts]
+        except ValueError:
+            values = None
+        if values is None or len(values) != width or not all(map(math.isfinite, values[:2])):
+            skipped += 1
+            continue
+        xs.append(values[0])
+        if width > 1:
+            ys.append(values[1])
+    if np is not None:
+        xs, ys = np.array(xs), np.array(ys)
+    return xs, (ys if width > 1 else None), skipped
+
+def read_stats_file(path, stats):
+    """Générateur : ajoute à stats un fichier CSV ou texte, bloc par bloc ; rend la fraction lue
+
+    Une valeur (x) ou plus (x, y, les suivantes ignorées) par ligne, séparées
+    par des virgules, points-virgules ou blancs. Le fichier est projeté en
+    mémoire (mmap) et lu par blocs de STATS_CHUNK_BYTES coupés en fin de
+    ligne : seul le bloc en cours est copié, le fichier peut dépasser la RAM.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            release = hasattr(mm, "madvise")
+            if release:
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            width = None
+            pos = 0
+            while pos < size:
+                end = min(pos + STATS_CHUNK_BYTES, size)
+                if end < size:
+                    cut = mm.rfind(b"\n", pos, end)
+                    end = cut + 1 if cut >= 0 else (mm.find(b"\n", end) + 1 or size)
+                text = mm[pos:end].translate(_STATS_SEPARATORS)
+                pos = end
+                if width is None:
+                    width = _row_width(text)
+                if width is None:
+                    stats.skipped += len(text.split(b"\n")) - 1
+                else:
+                    xs, ys, skipped = _parse_rows(text, width)
+                    stats.add_block(xs, ys)
+                    stats.skipped += skipped
+                done = pos - pos % mmap.PAGESIZE
+                if release and done:
+                    # Pages déjà lues rendues au système : la mémoire ne croît pas avec le fichier
+                    mm.madvise(mmap.MADV_DONTNEED, 0, done)
+                perf.count('stats_bytes', len(text))
+                yield pos / size
+
+def format_result(result):
+    """Texte affiché après '=' : entier si possible, sinon arrondi à 10 décimales"""
+    if isinstance(result, Big):
+        return _format_approx(result.d)
+    if not isinstance(result, int):
+        result = round(result, 10)
+        # Après arrondi : les résidus binaires (0.1*3*10) ne laissent pas de « .0 »
+        if result.is_integer():
+            result = int(result)
+    if isinstance(result, int) and _int_digits(result) > RESULT_DIGIT_BUDGET:
+        # Au-delà du budget : notation scientifique plutôt que des milliers de chiffres
+        return _format_approx(_APPROX.plus(Decimal(result)))
+    return str(result)
+
+def _format_approx(d):
+    """Notation scientifique à 11 chiffres significatifs d'un Decimal"""
+    text = format(d.normalize(decimal.Context(prec=11, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)), 'E')
+    return text.replace("E+", "e").replace("E", "e")
+
+def _format_part(x):
+    return _format_approx(Decimal(x)) if abs(x) >= 1e15 else format_result(x)
+
+def _format_entry(x):
+    """Coefficient compact d'une matrice affichée"""
+    text = f"{x:.{MATRIX_ENTRY_DIGITS}g}"
+    return "0" if text == "-0" else text
+
+def format_complex(z, part=_format_part):
+    """a+bi ; partie réelle seule si la partie imaginaire est nulle (après arrondi)"""
+    if type(z) is not complex:
+        return part(z)
+    re_, im = round(z.real, 10), round(z.imag, 10)
+    if not im:
+        return part(z.real)
+    imag = ("" if abs(im) == 1 else part(abs(z.imag))) + "i"
+    if not re_:
+        return "-" + imag if im < 0 else imag
+    return part(z.real) + ("-" if im < 0 else "+") + imag
+
+def matrix_lines(a, part=_format_entry, rows=MATRIX_ROWS_SHOWN, cols=MATRIX_COLS_SHOWN):
+    """Lignes d'affichage d'un vecteur ou d'une matrice ; rows/cols None : tout"""
+    def row_text(row):
+        items = [format_complex(z, part) for z in row[:cols].tolist()]
+        if cols is not None and len(row) > cols:
+            items.append("...")
+        return "[" + ", ".join(items) + "]"
+    if a.ndim == 1:
+        line = row_text(a)
+        return [line + f" ({len(a)})" if cols is not None and len(a) > cols else line]
+    shown = a[:rows]
+    lines = [" " + row_text(row) + "," for row in shown]
+    lines[0] = "[" + lines[0][1:]
+    if len(shown) < len(a):
+        lines.append(" ...]")
+    else:
+        lines[-1] = lines[-1][:-1] + "]"
+    if len(shown) < len(a) or (cols is not None and a.shape[1] > cols):
+        lines[-1] += f" {a.shape[0]}x{a.shape[1]}"
+    return lines
+
+def format_value(value, precision=None):
+    """Texte complet d'une valeur native du mode réel (precision None), décimal ou complexe"""
+    if precision is None:
+        return format_result(value)
+    if precision == COMPLEX_MODE:
+        if _is_array(value):
+            return "".join(matrix_lines(value, format_complex, None, None))
+        return format_complex(value)
+    return format_decimal(value, precision)
+
+def _to_float(v):
+    try:
+        f = float(v)
+    except OverflowError:
+        f = math.inf
+    if not math.isfinite(f):
+        raise ExprError("overflow", None)
+    return f
+
+def _mode_value(v, precision):
+    """Valeur native d'un mode convertie pour le mode demandé (ANS et registres)"""
+    if precision == COMPLEX_MODE:
+        if type(v) is complex or _is_array(v):
+            return v
+        return _to_float(v)
+    if _is_array(v):
+        raise ExprError("matrix value", None)
+    if type(v) is complex:
+        raise ExprError("complex value", None)
+    if precision is not None:
+        if type(v) is Big:
+            return v.d
+        if type(v) is float:
+            # Le nombre tel qu'affiché, pas son développement binaire
+            return Fraction(repr(v))
+        return Fraction(v) if type(v) is int else v
+    if type(v) is Fraction:
+        if v.denominator == 1:
+            return v.numerator
+        return _big(_APPROX.divide(Decimal(v.numerator), Decimal(v.denominator)))
+    if type(v) is Decimal:
+        if v.adjusted() > RESULT_DIGIT_BUDGET:
+            return Big(v)
+        return int(v) if v == v.to_integral_value() else float(v)
+    return v
+
+def compute_value(text, tokens=None, precision=None, variables=None):
+    """Valeur native d'une expression (int, float, Big, Fraction, Decimal, complex, tableau
+    NumPy), sans mise en forme
+
+    precision : chiffres significatifs du mode décimal, None pour les flottants,
+    COMPLEX_MODE pour le mode complexe et matriciel.
+    variables : nom -> valeur native de n'importe quel mode (ANS, registres).
+    """
+    if variables:
+        variables = {name: _mode_value(v, precision) for name, v in variables.items()}
+    return evaluate(text, mode_ops(precision), variables, tokens)
+
+def compute(text, tokens=None, precision=None):
+    """Chemin d'évaluation commun : texte de l'expression -> texte du résultat"""
+    return format_value(compute_value(text, tokens, precision), precision)
+
+@functools.lru_cache(maxsize=64)
+def _pow10(n):
+    return 10 ** n
+
+class Result:
+    """Résultat d'un calcul gardé sous forme native (ANS, registres, mémo)
+
+    Le texte affiché est mis en forme une fois, à la demande : tous les chiffres
+    s'ils tiennent sur une ligne, notation scientifique sinon. Le texte complet
+    d'un entier n'est jamais converti d'un bloc : la vue des chiffres (V) ne
+    convertit que les blocs de DIGITS_CHUNK chiffres qu'elle affiche.
+    """
+    __slots__ = ('value', 'precision', '_integer', '_ndigits', '_text', '_full', '_chunks')
+
+    def __init__(self, value, precision=None):
+        self.value = value
+        self.precision = precision
+        if type(value) is float and value.is_integer():
+            value = int(value)
+        elif type(value) is Fraction and value.denominator == 1:
+            value = value.numerator
+        self._integer = value if type(value) is int else None
+        self._ndigits = None
+        self._text = None
+        self._full = None
+        self._chunks = {}
+
+    def digit_count(self):
+        """Nombre de chiffres d'un résultat entier, sans conversion en texte"""
+        if self._ndigits is None:
+            n = abs(self._integer)
+            d = int(n.bit_length() * _LOG10_2) + 1   # Exact ou un de trop
+            if d > 1 and n < _pow10(d - 1):
+                d -= 1
+            self._ndigits = d
+        return self._ndigits
+
+    @property
+    def text(self):
+        """Texte de la ligne « = ... »"""
+        if self._text is None:
+            n = self._integer
+            if n is not None:
+                d = self.digit_count()
+                if d <= RESULT_LINE_DIGITS:
+                    self._text = str(n)
+                else:
+                    # Premiers chiffres seulement
+                    lead = Decimal(abs(n) // _pow10(d - APPROX_DIGITS)).scaleb(d - APPROX_DIGITS)
+                    self._text = _format_approx(lead.copy_negate() if n < 0 else lead)
+            elif self.precision is None:
+                self._text = format_result(self.value)
+            elif self.precision == COMPLEX_MODE:
+                v = self.value
+                self._text = "".join(matrix_lines(v)) if _is_array(v) else format_complex(v)
+            else:
+                self._text = format_decimal(self.value, min(self.precision, RESULT_LINE_DIGITS))
+        return self._text
+
+    def lines(self):
+        """Lignes écrites dans l'historique : une par ligne de matrice (bornées)"""
+        if _is_array(self.value):
+            return matrix_lines(self.value)
+        return [self.text]
+
+    def _full_text(self):
+        if self._full is None:
+            v = self.value
+            if type(v) is float:
+                self._full = repr(v)
+            elif type(v) is Big:
+                self._full = format(v.d, 'E')
+            else:
+                self._full = format_value(v, self.precision)
+        return self._full
+
+    def full_length(self):
+        if self._integer is None:
+            return len(self._full_text())
+        return self.digit_count() + (self._integer < 0)
+
+    def full_slice(self, start, stop):
+        """Caractères [start, stop) du texte complet"""
+        n = self._integer
+        if n is None:
+            return self._full_text()[start:stop]
+        parts = []
+        if n < 0:
+            if start == 0:
+                parts.append("-")
+            start = max(0, start - 1)
+            stop -= 1
+        stop = min(stop, self.digit_count())
+        for k in range(start // DIGITS_CHUNK, (stop - 1) // DIGITS_CHUNK + 1):
+            base = k * DIGITS_CHUNK
+            parts.append(self._chunk(k)[max(0, start - base):stop - base])
+        return "".join(parts)
+
+    def _chunk(self, k):
+        """Bloc k des chiffres (depuis les poids forts), converti une seule fois"""
+        chunk = self._chunks.get(k)
+        if chunk is None:
+            d = self.digit_count()
+            start = k * DIGITS_CHUNK
+            stop = min(d, start + DIGITS_CHUNK)
+            part = abs(self._integer) // _pow10(d - stop) % _pow10(stop - start)
+            chunk = self._chunks[k] = str(part).zfill(stop - start)
+        return chunk
+
+def _value_key(v):
+    """Clé de mémo d'une valeur native : le type compte (3 et 3.0 ne donnent pas le même résultat)"""
+    if _is_array(v):
+        return ('ndarray', v.dtype.str, v.shape, v.tobytes())
+    return (type(v).__name__, v.d if type(v) is Big else v)
+
+class ResultMemo:
+    """Résultats réussis par (expression normalisée, précision, variables lues) ; LRU borné"""
+    def __init__(self, capacity=RESULT_MEMO_SIZE):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            perf.count('memo_miss')
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        perf.count('memo_hit')
+        return result
+
+    def put(self, key, result):
+        if len(self.entries) >= self.capacity:
+            self.entries.popitem(last=False)
+        self.entries[key] = result
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries),
+                'capacity': self.capacity, 'hit_rate': self.hits / lookups if lookups else None}
+
+# Aperçu du résultat pendant la frappe
+_OPERAND_END = frozenset(('num', 'name', 'var', ')', ']', '!'))
+_CLOSER = {'(': ')', '[': ']'}
+
+def _token_key(tokens):
+    """Forme normalisée d'une suite de jetons (sans positions ; « ^ » et « ** » confondus)"""
+    return tuple(value if kind in ('num', 'name') else kind for kind, value, _ in tokens)
+
+def _magnitude(v):
+    """Exposant décimal approché de |v| ; 0 pour les complexes et les matrices"""
+    t = type(v)
+    if t is int:
+        return _int_digits(v) - 1
+    if t is Fraction:
+        return _int_digits(v.numerator) - _int_digits(v.denominator)
+    if t is Decimal:
+        return v.adjusted() if v.is_finite() else 0
+    if t is Big:
+        return v.d.adjusted()
+    return 0
+
+def _preview_guard(func, check):
+    def guarded(*args):
+        if not check(*args):
+            raise ExprError("too costly for a preview", None)
+        return func(*args)
+    return guarded
+
+@functools.lru_cache(maxsize=None)
+def _preview_ops(precision):
+    """Table d'opérations de l'aperçu : celle du mode, sans les opérations au coût non borné
+
+    Le budget de l'aperçu n'est vérifié qu'entre deux instructions : une seule
+    instruction ne doit pas pouvoir bloquer l'interface. Les fonctions
+    trigonométriques sur un argument énorme (réduction avec autant de
+    chiffres de π) et, en mode décimal, ! et nCr / nPr hors des entiers
+    exacts (fonction Gamma de Spouge à la précision du mode) n'ont pas
+    d'aperçu. Les puissances sont bornées par RESULT_DIGIT_BUDGET.
+    """
+    ops = OpTable(mode_ops(precision))
+    small = lambda *args: all(_magnitude(v) <= PREVIEW_MAX_MAGNITUDE for v in args)
+    for name in ('sin', 'cos', 'tan', '!', 'nCr', 'nPr'):
+        ops[name] = _preview_guard(ops[name], small)
+    if precision is not None and precision != COMPLEX_MODE:
+        def exact(v):
+            """Entier positif dont la factorielle tient dans le budget, sinon None"""
+            if type(v) is Fraction:
+                n = v.numerator if v.denominator == 1 else None
+            else:
+                n = int(v) if v.is_finite() and v == v.to_integral_value() else None
+            return n if n is not None and 0 <= n and _factorial_digits(n) <= RESULT_DIGIT_BUDGET else None
+
+        def exact_factorial(v):
+            return exact(v) is not None
+
+        def exact_combinatorics(n, r):
+            n, r = exact(n), exact(r)
+            return n is not None and r is not None and r <= n
+        ops['!'] = _preview_guard(ops['!'], exact_factorial)
+        ops['nCr'] = _preview_guard(ops['nCr'], exact_combinatorics)
+        ops['nPr'] = _preview_guard(ops['nPr'], exact_combinatorics)
+    return ops
+
+class LivePreview:
+    """Résultat provisoire de la saisie, recalculé à chaque touche avec un budget de temps
+
+    L'expression est découpée en termes (+ et - hors parenthèses) et en groupes
+    entre parenthèses (appels de fonction compris). Les valeurs des termes et
+    des groupes complets sont gardées : ajouter un chiffre ou un opérateur ne
+    réanalyse et ne réévalue que le dernier terme, les groupes déjà vus n'y
+    étant plus que des valeurs. Au-delà du budget, l'aperçu est différé
+    jusqu'à une pause de la frappe ; le travail déjà fait reste acquis.
+    Les opérations dont le coût ne se borne pas d'avance n'ont pas d'aperçu
+    (_preview_ops) : le résultat attend la touche =.
+    """
+    def __init__(self, capacity=PREVIEW_MEMO_SIZE):
+        self.capacity = capacity
+        self.memo = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.text = ""
+        self.key = None
+        self.deferred = False
+        self.retries = 0
+        self._ops = None
+        self._precision = None
+        self._variables = None
+        self._deadline = 0
+
+    def update(self, calc, budget_ms=PREVIEW_BUDGET_MS):
+        """Met à jour l'aperçu si la saisie ou le contexte a changé ; True si le texte change"""
+        key = (calc.buffer.version, calc.precision, calc.answer, tuple(calc.registers.items()))
+        if key == self.key and not self.deferred:
+            return False
+        if key != self.key:
+            self.retries = 0
+        self.key = key
+        text = ""
+        self.deferred = False
+        if calc.expression and not calc.just_calculated:
+            t0 = time.perf_counter_ns()
+            try:
+                text = "= " + Result(self._compute(calc, t0 + budget_ms * 1000000), calc.precision).text
+            except EvalDeadline:
+                self.retries += 1
+                self.deferred = self.retries <= PREVIEW_RETRIES
+                perf.count('preview_deferred')
+            except ExprError:
+                pass
+            perf.add_time('preview', time.perf_counter_ns() - t0)
+        changed = text != self.text
+        self.text = text
+        return changed
+
+    def _compute(self, calc, deadline):
+        tokens = calc.buffer.tokens() or tokenize(calc.expression)
+        tokens = list(tokens[:-1])
+        # Saisie inachevée : opérateur en attente ignoré, parenthèses et crochets fermés
+        while tokens and tokens[-1][0] not in _OPERAND_END:
+            tokens.pop()
+        if not tokens or (tokens[-1][0] == 'name' and tokens[-1][1] in FUNCTIONS):
+            raise ExprError("incomplete expression", None)
+        closers = []
+        for kind, value, _ in tokens:
+            if kind in _CLOSER:
+                closers.append(_CLOSER[kind])
+            elif kind == ')' or kind == ']':
+                if not closers or closers.pop() != kind:
+                    raise ExprError(f"unexpected '{value}'", None)
+        end = tokens[-1][2] + len(tokens[-1][1])
+        tokens += [(kind, kind, end) for kind in reversed(closers)]
+        precision = calc.precision
+        self._ops = _preview_ops(precision)
+        self._precision = precision
+        self._variables = {}
+        for name in VARIABLES:
+            result = calc.variable(name)
+            if result is not None:
+                self._variables[name] = _mode_value(result.value, precision)
+        self._deadline = deadline
+        try:
+            return self._expr(tokens)
+        finally:
+            self._variables = None
+
+    def _run(self, tokens):
+        if not tokens:
+            raise ExprError("incomplete expression", None)
+        program = Program("", parse(tokens + [('end', '', tokens[-1][2])]))
+        return program.run(self._ops, self._variables, self._deadline)
+
+    def _var(self, value, pos):
+        """Jeton remplaçant une valeur déjà calculée"""
+        name = f"${len(self._variables)}"
+        self._variables[name] = value
+        return ('var', name, pos)
+
+    def _memoized(self, tokens, compute):
+        # Un groupe qui lit ANS, un registre ou x n'est pas gardé
+        if any(kind == 'name' and value in VARIABLES for kind, value, _ in tokens):
+            return compute(tokens)
+        key = (self._precision, _token_key(tokens))
+        value = self.memo.get(key)
+        if value is not None:
+            self.memo.move_to_end(key)
+            self.hits += 1
+            return value
+        if time.perf_counter_ns() > self._deadline:
+            raise EvalDeadline()
+        self.misses += 1
+        value = compute(tokens)
+        if len(self.memo) >= self.capacity:
+            self.memo.popitem(last=False)
+        self.memo[key] = value
+        return value
+
+    @staticmethod
+    def _split(tokens, separators):
+        """Découpe aux séparateurs hors parenthèses et crochets ; + et - seulement en opérateurs binaires"""
+        parts = []
+        start = depth = 0
+        prev = None
+        for i, (kind, _, _) in enumerate(tokens):
+            if kind == '(' or kind == '[':
+                depth += 1
+            elif kind == ')' or kind == ']':
+                depth -= 1
+            elif depth == 0 and kind in separators and (kind == ',' or prev in _OPERAND_END):
+                parts.append(tokens[start:i])
+                parts.append(tokens[i])
+                start = i + 1
+            prev = kind
+        parts.append(tokens[start:])
+        return parts
+
+    def _expr(self, tokens):
+        """Somme de termes : chaque terme vient du cache ou est évalué seul"""
+        parts = self._split(tokens, ('+', '-'))
+        if len(parts) == 1:
+            return self._memoized(tokens, self._term)
+        reduced = [part if i % 2 else self._var(self._memoized(part, self._term), part[0][2])
+                   for i, part in enumerate(parts)]
+        return self._run(reduced)
+
+    def _term(self, tokens):
+        """Terme dont les groupes entre parenthèses ou crochets sont remplacés par leur valeur"""
+        reduced = []
+        i = 0
+        n = len(tokens)
+        while i < n:
+            kind = tokens[i][0]
+            is_call = kind == 'name' and tokens[i][1] in FUNCTIONS and i + 1 < n and tokens[i + 1][0] == '('
+            if kind != '(' and kind != '[' and not is_call:
+                reduced.append(tokens[i])
+                i += 1
+                continue
+            # Parenthèse ou crochet fermant correspondant
+            j = i + 1 if is_call else i
+            depth = 0
+            while True:
+                if tokens[j][0] in _CLOSER:
+                    depth += 1
+                elif tokens[j][0] == ')' or tokens[j][0] == ']':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j += 1
+            group = tokens[i:j + 1]
+            reduced.append(self._var(self._memoized(group, self._group), tokens[i][2]))
+            i = j + 1
+        return self._run(reduced)
+
+    def _group(self, tokens):
+        if tokens[0][0] == '(':
+            return self._expr(tokens[1:-1])
+        # Appel de fonction ou crochets : éléments évalués un à un, puis l'appel seul
+        head = 1 if tokens[0][0] == '[' else 2
+        args = self._split(tokens[head:-1], (',',))
+        reduced = list(tokens[:head])
+        for i, part in enumerate(args):
+            reduced.append(part if i % 2 else self._var(self._expr(part), part[0][2]))
+        reduced.append(tokens[-1])
+        return self._run(reduced)
+
+# Processus de calcul
+def _limit_memory(budget_mb):
+    # RLIMIT_AS porte sur tout l'espace d'adressage : budget en plus de l'existant
+    if resource is None or not budget_mb:
+        return
+    try:
+        with open('/proc/self/status') as f:
+            vm_kb = next(int(l.split()[1]) for l in f if l.startswith('VmSize:'))
+    except (OSError, StopIteration, ValueError):
+        return
+    limit = (vm_kb << 10) + (budget_mb << 20)
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+def _worker_main(conn, budget_mb):
+    _limit_memory(budget_mb)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        try:
+            conn.send(('ok', compute_value(*job)))
+        except ExprError as e:
+            conn.send(('error', (e.message, e.pos)))
+        except MemoryError:
+            conn.send(('error', ("out of memory", None)))
+        except Exception as e:
+            # Erreur inattendue : signalée, le processus reste disponible
+            conn.send(('error', (str(e) or type(e).__name__, None)))
+
+class EvalWorker:
+    """Évalue les expressions dans un processus séparé, avec délai et mémoire bornés
+
+    Un calcul trop long ou annulé tue le processus ; il est relancé au calcul suivant.
+    """
+    def __init__(self, timeout=EVAL_TIMEOUT_S, memory_mb=EVAL_MEMORY_MB):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.proc = None
+        self.conn = None
+        self.job = None
+        self.started = 0.0
+
+    def start(self):
+        if self.proc is not None and self.proc.is_alive():
+            return
+        ctx = multiprocessing.get_context('fork')
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, self.memory_mb), daemon=True)
+        self.proc.start()
+        child.close()
+
+    @property
+    def busy(self):
+        return self.job is not None
+
+    def elapsed(self):
+        return time.monotonic() - self.started if self.job is not None else 0.0
+
+    def submit(self, text, tokens=None, precision=None, variables=None):
+        self.start()
+        self.conn.send((text, tokens, precision, variables))
+        self.job = text
+        self.started = time.monotonic()
+
+    def poll(self, wait=0.0):
+        """Retourne (statut, valeur) quand le calcul en cours est terminé, sinon None"""
+        if self.job is None:
+            return None
+        if self.conn.poll(wait):
+            try:
+                outcome = self.conn.recv()
+            except EOFError:
+                outcome = ('error', ("worker crashed", None))
+                self._stop()
+            self.job = None
+            return outcome
+        if not self.proc.is_alive():
+            # Processus mort sans réponse (tué par le système, plantage)
+            self._stop()
+            self.job = None
+            return ('error', ("worker crashed", None))
+        if self.elapsed() > self.timeout:
+            self.cancel()
+            return ('timeout', None)
+        return None
+
+    def cancel(self):
+        self.job = None
+        self._stop()
+
+    def _stop(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.join()
+            self.conn.close()
+        self.proc = None
+        self.conn = None
+
+    def close(self):
+        if self.proc is not None and self.job is None:
+            try:
+                self.conn.send(None)
+                self.proc.join(0.5)
+            except (OSError, ValueError):
+                pass
+        self._stop()
+
+# Instrumentation
+def process_age_ns():
+    """Temps écoulé depuis le lancement du processus (/proc, au 1/100 s), sinon depuis l'import"""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # Champ 22 (starttime), en tops d'horloge depuis le démarrage du système
+        start_s = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return int((time.clock_gettime(time.CLOCK_BOOTTIME) - start_s) * 1e9)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.perf_counter_ns() - _IMPORT_NS
+
+class _PerfTimer:
+    """Chronomètre réutilisable : with perf.timer('nom'): ..."""
+    __slots__ = ('perf', 'name', 't0')
+
+    def __init__(self, perf, name):
+        self.perf = perf
+        self.name = name
+        self.t0 = 0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.perf.add_time(self.name, time.perf_counter_ns() - self.t0)
+        return False
+
+class PerfStats:
+    """Compteurs et chronomètres nommés : image en cours, fenêtre de mesure et cumul"""
+    def __init__(self, window_ms=PERF_WINDOW_MS):
+        self.window_ns = window_ms * 1000000
+        self.started = time.perf_counter_ns()
+        self.frames = 0
+        self.frame = {}        # Compteurs de l'image en cours
+        self.last_frame = {}   # Compteurs de la dernière image présentée
+        self.counters = {}     # Cumul depuis le démarrage
+        self.timers = {}       # nom -> [total_ns, appels, max_ns, dernier_ns]
+        self._timer_objs = {}
+        self.window_start = self.started
+        self.window_frames = 0
+        self.window_times = {}
+        self.window_max = {}
+        self.summary = {}      # Dernière fenêtre complète (affichée par le HUD)
+
+    def count(self, name, n=1):
+        self.frame[name] = self.frame.get(name, 0) + n
+
+    def add_time(self, name, ns):
+        t = self.timers.get(name)
+        if t is None:
+            t = self.timers[name] = [0, 0, 0, 0]
+        t[0] += ns
+        t[1] += 1
+        t[2] = max(t[2], ns)
+        t[3] = ns
+        self.window_times[name] = self.window_times.get(name, 0) + ns
+
+    def timer(self, name):
+        t = self._timer_objs.get(name)
+        if t is None:
+            t = self._timer_objs[name] = _PerfTimer(self, name)
+        return t
+
+    def last_ms(self, name):
+        t = self.timers.get(name)
+        return t[3] / 1e6 if t else None
+
+    def max_ms(self, name):
+        t = self.timers.get(name)
+        return t[2] / 1e6 if t else None
+
+    def end_frame(self):
+        """À appeler après SDL_RenderPresent"""
+        self.frames += 1
+        self.window_frames += 1
+        for name, n in self.frame.items():
+            self.counters[name] = self.counters.get(name, 0) + n
+            if n > self.window_max.get(name, 0):
+                self.window_max[name] = n
+        # Deux dicts en alternance : pas de nouvel objet par image
+        self.last_frame, self.frame = self.frame, self.last_frame
+        self.frame.clear()
+        now = time.perf_counter_ns()
+        elapsed = now - self.window_start
+        if elapsed >= self.window_ns:
+            times = self.window_times
+            per_frame = 1e6 * max(1, self.window_frames)
+            self.summary = {
+                'fps': self.window_frames * 1e9 / elapsed,
+                'frame_ms': (times.get('render', 0) + times.get('present', 0)) / per_frame,
+                'events_ms': times.get('events', 0) / per_frame,
+                'render_ms': times.get('render', 0) / per_frame,
+                'idle_pct': min(100.0, 100.0 * times.get('idle', 0) / elapsed),
+                'max': self.window_max,
+            }
+            self.window_start = now
+            self.window_frames = 0
+            self.window_times = {}
+            self.window_max = {}
+
+    def report(self):
+        timers = {name: {'total_ms': t[0] / 1e6, 'count': t[1], 'mean_ms': t[0] / 1e6 / t[1],
+                         'max_ms': t[2] / 1e6, 'last_ms': t[3] / 1e6}
+                  for name, t in sorted(self.timers.items())}
+        return {
+            'wall_s': (time.perf_counter_ns() - self.started) / 1e9,
+            'frames': self.frames,
+            'timers': timers,
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+perf = PerfStats()
+
+# Utilitaires police
+FONT_CANDIDATES = [
+    "./DejaVuSansMono.ttf",
+    "./LiberationMono-Regular.ttf",
+    "/usr/local/share/fonts/DejaVuSansMono.ttf",
+    "/usr/local/share/fonts/LiberationMono-Regular.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSansMono.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationMono-Regular.ttf",
+    "/system/fonts/DroidSansMono.ttf",
+]
+
+_font_path = None   # Police retenue, résolue une fois par processus
+_font_data = {}     # Chemin -> contenu du fichier, gardé tant que les polices vivent
+
+def _font_cache_file():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "sdlcalc", "font_path")
+
+def _read_font_cache():
+    try:
+        with open(_font_cache_file(), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _write_font_cache(path):
+    cache_file = _font_cache_file()
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file, "w", encoding="utf-8") as f:
+            f.write(path + "\n")
+    except OSError:
+        pass
+
+def _open_font(path, size):
+    """Ouvre une taille de police depuis le fichier lu une seule fois en mémoire"""
+    data = _font_data.get(path)
+    if data is None:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+    rw = sdl2.SDL_RWFromConstMem(data, len(data))
+    font = sdl2_ttf.TTF_OpenFontRW(rw, 1, size) if rw else None
+    if font:
+        # Les polices ouvertes lisent ce tampon : il ne doit pas être libéré
+        _font_data[path] = data
+    return font
+
+def open_any_font(size=10):
+    global _font_path
+    if _font_path is not None:
+        font = _open_font(_font_path, size)
+        if font:
+            return font
+    # Police locale d'abord, puis le chemin trouvé au lancement précédent
+    local = [p for p in FONT_CANDIDATES if p.startswith("./")]
+    cached = _read_font_cache()
+    candidates = local + ([cached] if cached else []) + [p for p in FONT_CANDIDATES if p not in local]
+    for p in candidates:
+        if not os.path.exists(p): continue
+        font = _open_font(p, size)
+        if font:
+            print("Font OK:", p)
+            _font_path = p
+            if not p.startswith("./") and p != cached:
+                _write_font_cache(p)
+            return font
+    print("ERREUR: aucune police chargée. Placez DejaVuSansMono.ttf à côté du script.")
+    return None
+
+# Cache de textures texte
+class TextCache:
+    """Textures de texte rendues une seule fois, clé (police, texte, couleur), LRU borné"""
+    __slots__ = ('capacity', 'renderer', 'entries')
+
+    def __init__(self, capacity=TEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self.renderer = None
+        self.entries = collections.OrderedDict()
+
+    def get(self, renderer, font, text, color):
+        # Un nouveau renderer invalide toutes les textures existantes
+        if renderer != self.renderer:
+            self.clear()
+            self.renderer = renderer
+        key = (font, text, color)
+        entry = self.entries.get(key)
+        if entry is not None:
+            # Entrée la plus récente en dernier, sans réallouer la table
+            self.entries.move_to_end(key)
+            return entry
+        if len(self.entries) >= self.capacity:
+            tex = self.entries.popitem(last=False)[1][0]
+            if tex:
+                sdl2.SDL_DestroyTexture(tex)
+        entry = self.entries[key] = self._render(renderer, font, text, color)
+        return entry
+
+    def _render(self, renderer, font, text, color):
+        perf.count('ttf_render')
+        surf = sdl2_ttf.TTF_RenderUTF8_Solid(font, text.encode("utf-8", errors="ignore"), SDL_Color(*color, 255))
+        if not surf:
+            return (None, 0, 0)
+        perf.count('texture_upload')
+        tex = sdl2.SDL_CreateTextureFromSurface(renderer, surf)
+        sdl2.SDL_FreeSurface(surf)
+        if not tex:
+            return (None, 0, 0)
+        tw = c_int()
+        th = c_int()
+        sdl2.SDL_QueryTexture(tex, None, None, ctypes.byref(tw), ctypes.byref(th))
+        return (tex, tw.value, th.value)
+
+    def clear(self):
+        for tex, _, _ in self.entries.values():
+            if tex:
+                sdl2.SDL_DestroyTexture(tex)
+        self.entries.clear()
+        self.renderer = None
+
+text_cache = TextCache()
+
+# Rectangle de destination partagé par les copies de texture : rien n'est alloué par copie
+_dst_rect = SDL_Rect()
+_dst_ref = ctypes.byref(_dst_rect)
+
+def copy_texture(renderer, tex, x, y, w, h):
+    _dst_rect.x = x
+    _dst_rect.y = y
+    _dst_rect.w = w
+    _dst_rect.h = h
+    sdl2.SDL_RenderCopy(renderer, tex, None, _dst_ref)
+
+# Atlas de glyphes
+ATLAS_CHARS = "".join(map(chr, range(32, 127)))
+# Un glyphe = 4 sommets SDL_Vertex (x, y, r, g, b, a, u, v), sans remplissage,
+# écrits par paires (bord haut, bord bas) : un seul appel à 32 arguments
+# alloue un bloc temporaire à chaque glyphe
+_EDGE = struct.Struct("=" + "2f4B2f" * 2)
+_QUAD_SIZE = 2 * _EDGE.size
+
+class GlyphAtlas:
+    """Caractères ASCII imprimables d'une police à chasse fixe, rendus une fois dans une texture
+
+    Les lignes ajoutées par add() sont dessinées par flush() : un seul
+    SDL_RenderGeometry si SDL le fournit, sinon une copie par glyphe.
+    Rien n'est rendu par TTF ni alloué côté SDL d'une image à l'autre ;
+    les autres caractères (« ± », « π ») passent par text_cache, un par un.
+    Les abscisses, ordonnées et décalages du tampon sont tirés de tables :
+    la boucle par glyphe ne calcule aucun entier ni flottant.
+    """
+    __slots__ = ('renderer', 'font', 'tex', 'advance', 'height', 'u', 'glyph_x', 'columns', 'bottoms',
+                 'geometry', 'capacity', 'buffer', 'vertices', 'indices', 'offsets', 'count', 'color',
+                 'src', 'dst', 'src_ref', 'dst_ref')
+
+    def __init__(self):
+        self.renderer = None
+        self.font = None
+        self.tex = None
+        self.advance = 0
+        self.height = 0
+        self.u = []               # Abscisse de texture de chaque glyphe, plus la borne finale
+        self.glyph_x = []         # Même chose en pixels (copie par glyphe)
+        self.columns = {}         # Origine x -> abscisses des colonnes x, x + advance...
+        self.bottoms = {}         # Ordonnée y -> y + height
+        self.geometry = None      # SDL_RenderGeometry disponible (None : pas encore vérifié)
+        self.capacity = 0
+        self.buffer = None        # Sommets, écrits par _EDGE.pack_into
+        self.vertices = None      # Vue SDL_Vertex sur buffer
+        self.indices = None
+        self.offsets = []         # Décalages dans buffer des deux bords de chaque glyphe
+        self.count = 0            # Glyphes en attente de flush()
+        self.color = None
+        self.src = SDL_Rect()
+        self.dst = SDL_Rect()
+        self.src_ref = ctypes.byref(self.src)
+        self.dst_ref = ctypes.byref(self.dst)
+
+    def ready(self, renderer, font):
+        """Construit l'atlas au premier usage ; False si la police ne s'y prête pas"""
+        if renderer != self.renderer or font != self.font:
+            self.release()
+            self.renderer = renderer
+            self.font = font
+            self._build()
+        return self.tex is not None
+
+    def _build(self):
+        perf.count('ttf_render')
+        surf = sdl2_ttf.TTF_RenderText_Solid(self.font, ATLAS_CHARS.encode("ascii"), SDL_Color(255, 255, 255, 255))
+        if not surf:
+            return
+        perf.count('texture_upload')
+        tex = sdl2.SDL_CreateTextureFromSurface(self.renderer, surf)
+        sdl2.SDL_FreeSurface(surf)
+        if not tex:
+            return
+        tw = c_int()
+        th = c_int()
+        sdl2.SDL_QueryTexture(tex, None, None, ctypes.byref(tw), ctypes.byref(th))
+        n = len(ATLAS_CHARS)
+        if tw.value % n:
+            # Chasse variable (ou crénage) : les lignes passent par text_cache
+            sdl2.SDL_DestroyTexture(tex)
+            return
+        self.tex = tex
+        self.advance = tw.value // n
+        self.height = th.value
+        self.u = [i / n for i in range(n + 1)]
+        self.glyph_x = [i * self.advance for i in range(n)]
+        if self.geometry is None:
+            try:
+                sdl2.SDL_RenderGeometry
+                self.geometry = True
+            except AttributeError:
+                self.geometry = False
+
+    def _reserve(self, glyphs):
+        if glyphs <= self.capacity:
+            return
+        capacity = max(64, self.capacity)
+        while capacity < glyphs:
+            capacity *= 2
+        buffer = bytearray(_QUAD_SIZE * capacity)
+        if self.count:
+            buffer[:_QUAD_SIZE * self.count] = self.buffer[:_QUAD_SIZE * self.count]
+        self.buffer = buffer
+        self.vertices = (SDL_Vertex * (4 * capacity)).from_buffer(buffer)
+        self.indices = (c_int * (6 * capacity))(*itertools.chain.from_iterable(
+            (4 * k, 4 * k + 1, 4 * k + 2, 4 * k + 2, 4 * k + 1, 4 * k + 3) for k in range(capacity)))
+        self.offsets = [(_QUAD_SIZE * k, _QUAD_SIZE * k + _EDGE.size) for k in range(capacity)]
+        self.capacity = capacity
+
+    def _columns(self, x, end):
+        cols = self.columns.get(x)
+        if cols is None or len(cols) <= end:
+            adv = self.advance
+            cols = self.columns[x] = [x + i * adv for i in range(max(end, 64) + 1)]
+        return cols
+
+    def _bottom(self, y):
+        y1 = self.bottoms.get(y)
+        if y1 is None:
+            y1 = self.bottoms[y] = y + self.height
+        return y1
+
+    def add(self, text, x, y, color, max_chars):
+        """Ajoute une ligne, coupée à max_chars suivis de « ... »
+
+        Les caractères hors atlas (non ASCII) sont copiés tout de suite
+        depuis text_cache, à leur colonne.
+        """
+        adv = self.advance
+        n = len(text)
+        if n > max_chars:
+            n = max_chars
+            end = n + 3
+        else:
+            end = n
+        cols = self._columns(x, end)
+        if not self.geometry:
+            if color != self.color:
+                sdl2.SDL_SetTextureColorMod(self.tex, *color)
+                self.color = color
+            src, dst = self.src, self.dst
+            src.y, src.w, src.h = 0, adv, self.height
+            dst.y, dst.w, dst.h = y, adv, self.height
+            glyph_x = self.glyph_x
+            for i in range(end):
+                g = ord(text[i]) - 32 if i < n else 14   # '.'
+                if 0 < g < 95:
+                    src.x = glyph_x[g]
+                    dst.x = cols[i]
+                    sdl2.SDL_RenderCopy(self.renderer, self.tex, self.src_ref, self.dst_ref)
+                elif g >= 95:
+                    self._add_other(text[i], cols[i], y, color)
+            return
+        self._reserve(self.count + end)
+        r, g_, b = color
+        u = self.u
+        y1 = self._bottom(y)
+        pack, buffer, offsets = _EDGE.pack_into, self.buffer, self.offsets
+        k = self.count
+        for i in range(end):
+            g = ord(text[i]) - 32 if i < n else 14   # '.'
+            if 0 < g < 95:
+                x0 = cols[i]
+                x1 = cols[i + 1]
+                u0 = u[g]
+                u1 = u[g + 1]
+                top, bottom = offsets[k]
+                pack(buffer, top,
+                     x0, y, r, g_, b, 255, u0, 0.0,
+                     x1, y, r, g_, b, 255, u1, 0.0)
+                pack(buffer, bottom,
+                     x0, y1, r, g_, b, 255, u0, 1.0,
+                     x1, y1, r, g_, b, 255, u1, 1.0)
+                k += 1
+            elif g >= 95:
+                self._add_other(text[i], cols[i], y, color)
+        self.count = k
+
+    def _add_other(self, char, x, y, color):
+        # Glyphe absent de l'atlas : texture d'un caractère, gardée par text_cache
+        tex, tw, th = text_cache.get(self.renderer, self.font, char, color)
+        if tex:
+            copy_texture(self.renderer, tex, x, y, tw, th)
+
+    def flush(self):
+        """Dessine les glyphes en attente en un seul appel"""
+        if self.count:
+            sdl2.SDL_RenderGeometry(self.renderer, self.tex, self.vertices, 4 * self.count,
+                                    self.indices, 6 * self.count)
+            self.count = 0
+
+    def release(self):
+        if self.tex:
+            sdl2.SDL_DestroyTexture(self.tex)
+        self.tex = None
+        self.renderer = None
+        self.font = None
+        self.color = None
+        self.count = 0
+        self.columns.clear()
+        self.bottoms.clear()
+
+glyph_atlas = GlyphAtlas()
+
+class Button:
+    __slots__ = ('rect', 'text', 'color', 'value', 'font', 'hint', 'box', 'box_ref')
+
+    def __init__(self, x, y, w, h, text, color, value, font, hint=""):
+        self.rect = SDL_Rect(x, y, w, h)
+        self.text = text
+        self.color = color
+        self.value = value
+        self.font = font
+        self.hint = hint
+        # Rectangle dessiné, décalé selon la cible de rendu
+        self.box = SDL_Rect(x, y, w, h)
+        self.box_ref = ctypes.byref(self.box)
+
+    def draw(self, renderer, show_hints=True, hint_font=None, ox=0, oy=0):
+        # (ox, oy) : origine de la cible de rendu (calque du clavier)
+        rect = self.box
+        rect.x = self.rect.x - ox
+        rect.y = self.rect.y - oy
+
+        # Fond du bouton
+        sdl2.SDL_SetRenderDrawColor(renderer, *self.color, 255)
+        sdl2.SDL_RenderFillRect(renderer, self.box_ref)
+        
+        # Bordure
+        sdl2.SDL_SetRenderDrawColor(renderer, 0, 0, 0, 255)
+        sdl2.SDL_RenderDrawRect(renderer, self.box_ref)
+        
+        # Texte principal
+        if self.font and self.text:
+            tex, tw, th = text_cache.get(renderer, self.font, self.text, Color.WHITE)
+            if tex:
+                copy_texture(renderer, tex, rect.x + (rect.w - tw) // 2, rect.y + (rect.h - th) // 2, tw, th)
+        
+        # Overlay d'aide (hint) en haut à droite
+        if show_hints and self.hint and hint_font:
+            tex, tw, th = text_cache.get(renderer, hint_font, self.hint, Color.HINT_TEXT)
+            if tex:
+                copy_texture(renderer, tex, rect.x + rect.w - tw - 2, rect.y + 2, tw, th)
+
+# Calque statique du clavier
+class KeypadLayer:
+    """Clavier composé une fois dans une texture cible, recopié à chaque image"""
+    __slots__ = ('renderer', 'tex', 'rect', 'rect_ref', 'key')
+
+    def __init__(self):
+        self.renderer = None
+        self.tex = None
+        self.rect = SDL_Rect(0, 0, 0, 0)
+        self.rect_ref = ctypes.byref(self.rect)
+        self.key = None
+
+    def invalidate(self):
+        # Après SDL_RENDER_TARGETS_RESET le contenu des textures cibles est perdu
+        self.key = None
+
+    def draw(self, renderer, calc, hint_font):
+        if not calc.buttons:
+            return
+        key = (calc.layout_version, calc.show_hints)
+        if renderer != self.renderer or key != self.key:
+            if not self._rebuild(renderer, calc, hint_font):
+                # Pas de texture cible : dessin direct des boutons
+                for btn in calc.buttons:
+                    btn.draw(renderer, calc.show_hints, hint_font)
+                return
+            self.key = key
+        sdl2.SDL_RenderCopy(renderer, self.tex, None, self.rect_ref)
+
+    def _rebuild(self, renderer, calc, hint_font):
+        x0 = min(b.rect.x for b in calc.buttons)
+        y0 = min(b.rect.y for b in calc.buttons)
+        x1 = max(b.rect.x + b.rect.w for b in calc.buttons)
+        y1 = max(b.rect.y + b.rect.h for b in calc.buttons)
+        if (renderer != self.renderer or self.rect.x != x0 or self.rect.y != y0
+                or self.rect.w != x1 - x0 or self.rect.h != y1 - y0):
+            self.release()
+            if not sdl2.SDL_RenderTargetSupported(renderer):
+                return False
+            perf.count('texture_create')
+            self.tex = sdl2.SDL_CreateTexture(renderer, SDL_PIXELFORMAT_RGBA8888,
+                                              SDL_TEXTUREACCESS_TARGET, x1 - x0, y1 - y0)
+            if not self.tex:
+                return False
+            self.renderer = renderer
+            self.rect.x = x0
+            self.rect.y = y0
+            self.rect.w = x1 - x0
+            self.rect.h = y1 - y0
+
+        if sdl2.SDL_SetRenderTarget(renderer, self.tex) < 0:
+            return False
+        # Fond opaque : les espaces entre boutons gardent la couleur de l'écran
+        sdl2.SDL_SetRenderDrawColor(renderer, *Color.BG, 255)
+        sdl2.SDL_RenderClear(renderer)
+        for btn in calc.buttons:
+            btn.draw(renderer, calc.show_hints, hint_font, x0, y0)
+        sdl2.SDL_SetRenderTarget(renderer, None)
+        return True
+
+    def release(self):
+        if self.tex:
+            sdl2.SDL_DestroyTexture(self.tex)
+        self.tex = None
+        self.renderer = None
+        self.key = None
+
+# HUD de performance
+class PerfOverlay:
+    """Mesures de perf en surimpression ; une texture par ligne, refaite si le texte change
+
+    Ses propres rendus de texte ne sont pas comptés dans perf.
+    """
+    __slots__ = ('renderer', 'lines', 'box', 'box_ref')
+
+    WIDTH = 170
+    LINE_H = 11
+
+    def __init__(self):
+        self.renderer = None
+        self.lines = []   # (texte, texture, w, h)
+        self.box = SDL_Rect(0, 2, self.WIDTH, 0)
+        self.box_ref = ctypes.byref(self.box)
+
+    def text_lines(self):
+        summary = perf.summary
+        last = perf.last_frame
+        calc_ms = perf.last_ms('calculate')
+        if not summary:
+            lines = ["measuring..."]
+        else:
+            peak = summary['max']
+            lines = [
+                f"{summary['fps']:4.1f} fps  frame {summary['frame_ms']:.2f} ms",
+                f"idle {summary['idle_pct']:3.0f}%  ev {summary['events_ms']:.2f}  draw {summary['render_ms']:.2f}",
+                f"ttf {last.get('ttf_render', 0)}  upl {last.get('texture_upload', 0)}"
+                f"  (max {peak.get('ttf_render', 0)}/{peak.get('texture_upload', 0)})",
+            ]
+        start_ms = perf.last_ms('startup')
+        line = "calc -" if calc_ms is None else f"calc {calc_ms:.1f} ms"
+        if start_ms is not None:
+            line += f"  start {start_ms:.0f} ms"
+        lines.append(line)
+        input_ms = perf.last_ms('input_latency')
+        if input_ms is not None:
+            lines.append(f"input {input_ms:.0f} ms  (max {perf.max_ms('input_latency'):.0f}, "
+                         f"late {perf.counters.get('late_input', 0)})")
+        hits = perf.counters.get('memo_hit', 0)
+        lookups = hits + perf.counters.get('memo_miss', 0)
+        if lookups:
+            lines.append(f"memo {hits}/{lookups} hits")
+        return lines
+
+    def draw(self, renderer, font, width):
+        if not font:
+            return
+        if renderer != self.renderer:
+            self.release()
+            self.renderer = renderer
+        texts = self.text_lines()
+        for i, text in enumerate(texts):
+            if i < len(self.lines) and self.lines[i][0] == text:
+                continue
+            surf = sdl2_ttf.TTF_RenderUTF8_Solid(font, text.encode('utf-8'), SDL_Color(*Color.HINT_TEXT, 255))
+            tex = None
+            tw = c_int()
+            th = c_int()
+            if surf:
+                tex = sdl2.SDL_CreateTextureFromSurface(renderer, surf)
+                sdl2.SDL_FreeSurface(surf)
+                if tex:
+                    sdl2.SDL_QueryTexture(tex, None, None, ctypes.byref(tw), ctypes.byref(th))
+            if i < len(self.lines):
+                if self.lines[i][1]:
+                    sdl2.SDL_DestroyTexture(self.lines[i][1])
+                self.lines[i] = (text, tex, tw.value, th.value)
+            else:
+                self.lines.append((text, tex, tw.value, th.value))
+        while len(self.lines) > len(texts):
+            old = self.lines.pop()
+            if old[1]:
+                sdl2.SDL_DestroyTexture(old[1])
+
+        box = self.box
+        box.x = width - self.WIDTH - 2
+        box.h = len(texts) * self.LINE_H + 4
+        sdl2.SDL_SetRenderDrawColor(renderer, *Color.BLACK, 255)
+        sdl2.SDL_RenderFillRect(renderer, self.box_ref)
+        y = box.y + 2
+        for _, tex, tw, th in self.lines:
+            if tex:
+                copy_texture(renderer, tex, box.x + 3, y, tw, th)
+            y += self.LINE_H
+
+    def release(self):
+        for _, tex, _, _ in self.lines:
+            if tex:
+                sdl2.SDL_DestroyTexture(tex)
+        self.lines = []
+        self.renderer = None
+
+# Vue graphique
+def _nice_step(raw):
+    """Pas de grille « rond » (1, 2 ou 5 × 10^n) proche de raw"""
+    exp = math.floor(math.log10(raw))
+    f = raw / 10 ** exp
+    return (1 if f < 1.5 else 2 if f < 3.5 else 5 if f < 7.5 else 10) * 10 ** exp
+
+class GraphView:
+    """Tracé de graph_func dans la zone d'affichage
+
+    Le repère est un centre (cx, cy) et une échelle en unités par pixel,
+    identique sur les deux axes. Les échantillons sont alignés sur des
+    colonnes entières (x = colonne × échelle) : un déplacement horizontal
+    n'évalue que les colonnes découvertes, et un zoom affiche d'abord une
+    colonne sur GRAPH_REFINE_START puis affine d'un niveau par image.
+    Le tracé est gardé dans une texture tant que le repère ne change pas.
+    """
+    __slots__ = ('cx', 'cy', 'scale', 'width', 'samples_key', 'col0', 'ys', 'level',
+                 'renderer', 'tex', 'tex_size', 'tex_key')
+
+    def __init__(self):
+        self.cx = 0.0
+        self.cy = 0.0
+        self.scale = 20.0 / 314
+        self.width = 314        # Largeur du dernier tracé, en pixels
+        # Tampon d'échantillons : (fonction, échelle, largeur), première colonne
+        self.samples_key = None
+        self.col0 = 0
+        self.ys = None
+        self.level = 0
+        # Texture du tracé
+        self.renderer = None
+        self.tex = None
+        self.tex_size = (0, 0)
+        self.tex_key = None
+
+    @property
+    def refining(self):
+        return self.level > 1
+
+    def pan(self, dx, dy):
+        """Déplace le repère de dx, dy pixels (y vers le haut)"""
+        self.cx += dx * self.scale
+        self.cy += dy * self.scale
+
+    def zoom(self, factor):
+        self.scale *= factor
+
+    def x_range(self):
+        """Abscisses visibles au dernier tracé"""
+        half = 0.5 * self.width * self.scale
+        return self.cx - half, self.cx + half
+
+    def release(self):
+        if self.tex:
+            sdl2.SDL_DestroyTexture(self.tex)
+        self.tex = None
+        self.renderer = None
+        self.tex_key = None
+
+    def draw(self, renderer, rect, func, font):
+        self.width = rect.w
+        col0 = round(self.cx / self.scale - rect.w / 2)
+        row0 = round(self.cy / self.scale + rect.h / 2)
+        try:
+            program = compile_expression(func)
+            self._update_samples(program, func, col0, rect.w)
+        except ExprError as e:
+            self.samples_key = None
+            self._render(renderer, rect, col0, row0, font, f"y={func}: {e.message}")
+            return
+
+        key = (func, col0, row0, self.scale, rect.w, rect.h, self.level)
+        if key != self.tex_key or renderer != self.renderer:
+            if not self._render_to_texture(renderer, rect, col0, row0, font, f"y={func}"):
+                self._render(renderer, rect, col0, row0, font, f"y={func}")
+                return
+            self.tex_key = key
+        copy_texture(renderer, self.tex, rect.x, rect.y, rect.w, rect.h)
+
+    # Échantillons
+    def _sample_columns(self, program, cols):
+        """Évalue la fonction sur les colonnes absolues cols"""
+        if np is not None:
+            return sample_function(program, np.asarray(cols, dtype=float) * self.scale)
+        return sample_function(program, array('d', [c * self.scale for c in cols]))
+
+    def _store(self, program, idx):
+        # idx : indices dans le tampon, relatifs à col0
+        if not len(idx):
+            return
+        vals = self._sample_columns(program, [self.col0 + i for i in idx] if np is None else idx + self.col0)
+        if np is not None:
+            self.ys[idx] = vals
+        else:
+            for i, v in zip(idx, vals):
+                self.ys[i] = v
+
+    def _stride_indices(self, lo, hi, step, skip=0):
+        """Indices i de [lo, hi) dont la colonne est multiple de step (et pas de skip)"""
+        first = lo + (-(self.col0 + lo)) % step
+        if np is not None:
+            idx = np.arange(first, hi, step)
+            return idx[(self.col0 + idx) % skip != 0] if skip else idx
+        return [i for i in range(first, hi, step) if not skip or (self.col0 + i) % skip]
+
+    def _update_samples(self, program, func, col0, w):
+        key = (func, self.scale, w)
+        if key != self.samples_key:
+            # Nouvelle fonction ou nouvelle échelle : esquisse grossière d'abord
+            self.samples_key = key
+            self.col0 = col0
+            self.ys = np.full(w, np.nan) if np is not None else array('d', [math.nan]) * w
+            self.level = GRAPH_REFINE_START
+            self._store(program, self._stride_indices(0, w, self.level))
+            return
+
+        shift = col0 - self.col0
+        if shift:
+            # Déplacement : on garde le recouvrement, seules les colonnes découvertes sont évaluées
+            self.col0 = col0
+            keep = max(0, w - abs(shift))
+            if np is not None:
+                ys = np.full(w, np.nan)
+                if shift > 0:
+                    ys[:keep] = self.ys[shift:shift + keep]
+                else:
+                    ys[w - keep:] = self.ys[:keep]
+            else:
+                ys = array('d', [math.nan]) * w
+                if shift > 0:
+                    ys[:keep] = self.ys[shift:shift + keep]
+                else:
+                    ys[w - keep:] = self.ys[:keep]
+            self.ys = ys
+            lo, hi = (keep, w) if shift > 0 else (0, w - keep)
+            self._store(program, self._stride_indices(lo, hi, self.level))
+        elif self.level > 1:
+            # Affinage progressif : colonnes du niveau suivant uniquement
+            self.level //= 2
+            self._store(program, self._stride_indices(0, w, self.level, self.level * 2))
+
+    # Rendu
+    def _render_to_texture(self, renderer, rect, col0, row0, font, label):
+        if renderer != self.renderer or self.tex_size != (rect.w, rect.h):
+            self.release()
+            if not sdl2.SDL_RenderTargetSupported(renderer):
+                return False
+            perf.count('texture_create')
+            self.tex = sdl2.SDL_CreateTexture(renderer, SDL_PIXELFORMAT_RGBA8888,
+                                              SDL_TEXTUREACCESS_TARGET, rect.w, rect.h)
+            if not self.tex:
+                return False
+            self.renderer = renderer
+            self.tex_size = (rect.w, rect.h)
+        if sdl2.SDL_SetRenderTarget(renderer, self.tex) < 0:
+            return False
+        self._render(renderer, SDL_Rect(0, 0, rect.w, rect.h), col0, row0, font, label)
+        sdl2.SDL_SetRenderTarget(renderer, None)
+        return True
+
+    def _render(self, renderer, rect, col0, row0, font, label):
+        x_min = col0 * self.scale
+        y_max = row0 * self.scale
+        sdl2.SDL_SetRenderDrawColor(renderer, *Color.WHITE, 255)
+        sdl2.SDL_RenderFillRect(renderer, ctypes.byref(rect))
+        sdl2.SDL_RenderSetClipRect(renderer, ctypes.byref(rect))
+        if self.samples_key is not None:
+            self._draw_grid(renderer, rect, x_min, y_max)
+            self._draw_curve(renderer, rect, self._stride_indices(0, rect.w, self.level), y_max)
+        sdl2.SDL_RenderSetClipRect(renderer, None)
+        sdl2.SDL_SetRenderDrawColor(renderer, 0, 0, 0, 255)
+        sdl2.SDL_RenderDrawRect(renderer, ctypes.byref(rect))
+
+        if font:
+            tex, tw, th = text_cache.get(renderer, font, label, Color.BLACK)
+            if tex:
+                copy_texture(renderer, tex, rect.x + 4, rect.y + 2, tw, th)
+
+    def _draw_grid(self, renderer, rect, x_min, y_max):
+        step = _nice_step(self.scale * 40)
+        x_max = x_min + rect.w * self.scale
+        y_min = y_max - rect.h * self.scale
+        sdl2.SDL_SetRenderDrawColor(renderer, *Color.GRID, 255)
+        for k in range(math.ceil(x_min / step), math.floor(x_max / step) + 1):
+            px = rect.x + int((k * step - x_min) / self.scale)
+            sdl2.SDL_RenderDrawLine(renderer, px, rect.y, px, rect.y + rect.h - 1)
+        for k in range(math.ceil(y_min / step), math.floor(y_max / step) + 1):
+            py = rect.y + int((y_max - k * step) / self.scale)
+            sdl2.SDL_RenderDrawLine(renderer, rect.x, py, rect.x + rect.w - 1, py)
+
+        # Axes
+        sdl2.SDL_SetRenderDrawColor(renderer, *Color.BLACK, 255)
+        if x_min <= 0 <= x_max:
+            px = rect.x + int(-x_min / self.scale)
+            sdl2.SDL_RenderDrawLine(renderer, px, rect.y, px, rect.y + rect.h - 1)
+        if y_min <= 0 <= y_max:
+            py = rect.y + int(y_max / self.scale)
+            sdl2.SDL_RenderDrawLine(renderer, rect.x, py, rect.x + rect.w - 1, py)
+
+    def _draw_curve(self, renderer, rect, idx, y_max):
+        # idx : colonnes connues au niveau d'affinage courant
+        # Ordonnées écran bornées à un écran au-dessus / en dessous de la zone
+        lo, hi = rect.y - rect.h, rect.y + 2 * rect.h
+        if np is not None:
+            with np.errstate(all='ignore'):
+                py = (y_max - self.ys[idx]) / self.scale + rect.y
+            valid = np.isfinite(py)
+            py = np.clip(np.where(valid, py, 0), lo, hi)
+            pts = np.empty((len(py), 2), dtype=np.int32)
+            pts[:, 0] = idx + rect.x
+            pts[:, 1] = py
+            # Saut d'un bord à l'autre (asymptote) : le trait est coupé
+            jump = np.zeros(len(py), dtype=bool)
+            jump[1:] = ((py[:-1] <= lo) & (py[1:] >= hi)) | ((py[:-1] >= hi) & (py[1:] <= lo))
+            starts = np.flatnonzero(valid & (np.concatenate(([True], ~valid[:-1])) | jump))
+            ends = np.flatnonzero(valid & (np.concatenate((~valid[1:], [True])) | np.append(jump[1:], False)))
+            runs = zip(starts.tolist(), (ends + 1).tolist())
+            base = pts.ctypes.data
+        else:
+            pts = (SDL_Point * len(idx))()
+            runs = []
+            start = None
+            prev = None
+            for n, i in enumerate(idx):
+                y = self.ys[i]
+                p = (y_max - y) / self.scale + rect.y if math.isfinite(y) else math.nan
+                if p != p:
+                    if start is not None:
+                        runs.append((start, n))
+                    start = None
+                    continue
+                p = min(max(p, lo), hi)
+                if start is not None and ((prev <= lo and p >= hi) or (prev >= hi and p <= lo)):
+                    runs.append((start, n))
+                    start = None
+                if start is None:
+                    start = n
+                pts[n].x = rect.x + i
+                pts[n].y = int(p)
+                prev = p
+            if start is not None:
+                runs.append((start, len(idx)))
+            base = ctypes.addressof(pts)
+
+        sdl2.SDL_SetRenderDrawColor(renderer, *Color.BLUE, 255)
+        size = ctypes.sizeof(SDL_Point)
+        for start, end in runs:
+            if end - start > 1:
+                sdl2.SDL_RenderDrawLines(renderer, base + start * size, end - start)
+
+# Ordonnanceur d'images
+class FrameScheduler:
+    """Attend les événements et ne présente une image que si une région a changé
+
+    Pendant la frappe, SDL_RenderPresent (synchro verticale) donne seul la
+    cadence ; sans entrée depuis active_ms, les images dues aux animations
+    et aux calculs de fond sont limitées à max_fps.
+    """
+    REGIONS = ('display', 'keypad', 'info', 'perf')
+
+    def __init__(self, max_fps=MAX_FPS, always_redraw=ALWAYS_REDRAW, idle_timeout=IDLE_TIMEOUT_MS,
+                 active_ms=ACTIVE_MS):
+        self.frame_ms = 1000 // max(1, max_fps)
+        self.always_redraw = always_redraw
+        self.idle_timeout = idle_timeout
+        self.active_ms = active_ms
+        self.dirty = set(self.REGIONS)
+        self.last_present = 0
+        self.last_input = None
+        self.wakeups = {}
+
+    def input(self):
+        """Une entrée vient d'être traitée : les images ne sont plus limitées à max_fps"""
+        self.last_input = sdl2.SDL_GetTicks()
+
+    def _min_frame_ms(self, now):
+        if self.last_input is not None and now - self.last_input < self.active_ms:
+            return 0
+        return self.frame_ms
+
+    def invalidate(self, *regions):
+        # Sans argument : tout l'écran
+        self.dirty.update(regions or self.REGIONS)
+
+    def wake(self, region, delay_ms):
+        """Invalide une région après un délai (animation, travail en arrière-plan)"""
+        due = sdl2.SDL_GetTicks() + delay_ms
+        if due < self.wakeups.get(region, due + 1):
+            self.wakeups[region] = due
+
+    def _expire_wakeups(self, now):
+        for region, due in list(self.wakeups.items()):
+            if now >= due:
+                del self.wakeups[region]
+                self.dirty.add(region)
+
+    def pending(self):
+        return self.always_redraw or bool(self.dirty)
+
+    def wait_event(self, event_ref, poll=False):
+        """Bloque jusqu'au prochain événement ou jusqu'à l'échéance de l'image suivante
+
+        event_ref : ctypes.byref(SDL_Event), créé une fois par l'appelant.
+        poll : du travail attend (préchargement), on ne bloque pas.
+        """
+        now = sdl2.SDL_GetTicks()
+        self._expire_wakeups(now)
+        if poll:
+            timeout = 0
+        elif self.pending():
+            timeout = max(0, self.last_present + self._min_frame_ms(now) - now)
+        else:
+            timeout = self.idle_timeout
+            for due in self.wakeups.values():
+                timeout = min(timeout, max(0, due - now))
+        return sdl2.SDL_WaitEventTimeout(event_ref, timeout)
+
+    def frame_due(self):
+        now = sdl2.SDL_GetTicks()
+        self._expire_wakeups(now)
+        if not self.pending():
+            return False
+        return now - self.last_present >= self._min_frame_ms(now)
+
+    def presented(self):
+        self.dirty.clear()
+        self.last_present = sdl2.SDL_GetTicks()
+
+# Saisie
+_NUMBER_CHARS = frozenset("0123456789.")
+
+@functools.lru_cache(maxsize=256)
+def _piece_tokens(text):
+    """Jetons d'un élément seul (positions relatives), None s'il ne se découpe pas seul"""
+    try:
+        return tuple(tokenize(text)[:-1])
+    except ExprError:
+        return None
+
+_WORD_CHARS = frozenset("0123456789.abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_")
+
+def _joins(a, b):
+    """Vrai si les caractères a puis b peuvent appartenir au même jeton"""
+    return ((a in _WORD_CHARS and b in _WORD_CHARS) or (a == '*' and b == '*')
+            or (a in 'eE' and b in '+-'))
+
+class ExprBuffer:
+    """Saisie en cours : éléments tels que tapés, curseur, texte et jetons en cache
+
+    Un élément est (texte, nombre). Un nombre en cours de saisie est prolongé
+    par les chiffres suivants et raccourci caractère par caractère ; les autres
+    éléments (« sin( », « ** », π...) sont insérés et retirés d'un bloc.
+    Le curseur est un indice d'élément. Les jetons des éléments avant la
+    première modification sont gardés : une touche ne redécoupe que
+    l'élément touché et ceux qui le suivent.
+    """
+    def __init__(self):
+        self.pieces = []
+        self.cursor = 0
+        self.version = 0      # Incrémenté à chaque modification du contenu
+        self._text = ""
+        self._text_version = 0
+        self._tokens = None
+        self._tokens_version = -1
+        self._token_list = []     # Jetons (position absolue) des _valid premiers éléments
+        self._token_marks = []    # Après chacun de ces éléments : (nombre de jetons, position)
+        self._valid = 0
+        self._display_version = -1
+        self._display_cursor = -1
+        self._display_width = -1
+        self._display = ""
+
+    def _changed(self, index):
+        """Le contenu a changé à partir de l'élément index"""
+        self.version += 1
+        if index < self._valid:
+            self._valid = index
+
+    @property
+    def text(self):
+        if self._text_version != self.version:
+            self._text = "".join(text for text, _ in self.pieces)
+            self._text_version = self.version
+        return self._text
+
+    def insert(self, piece, atomic=False):
+        """Insère au curseur ; un chiffre ou un point prolonge le nombre qui précède"""
+        number = not atomic and _NUMBER_CHARS.issuperset(piece)
+        i = self.cursor
+        if number and i > 0 and self.pieces[i - 1][1]:
+            self.pieces[i - 1] = (self.pieces[i - 1][0] + piece, True)
+            self._changed(i - 1)
+        else:
+            self.pieces.insert(i, (piece, number))
+            self.cursor = i + 1
+            self._changed(i)
+
+    def undo(self):
+        """Retire l'élément avant le curseur ; O(1) en fin de ligne"""
+        if self.cursor == 0:
+            return False
+        self.cursor -= 1
+        del self.pieces[self.cursor]
+        self._changed(self.cursor)
+        return True
+
+    def backspace(self):
+        """Retire un chiffre d'un nombre, sinon l'élément entier (jamais la moitié de « sqrt( »)"""
+        if self.cursor == 0:
+            return
+        text, number = self.pieces[self.cursor - 1]
+        if number and len(text) > 1:
+            self.pieces[self.cursor - 1] = (text[:-1], True)
+            self._changed(self.cursor - 1)
+        else:
+            self.undo()
+
+    def move(self, step):
+        self.cursor = max(0, min(len(self.pieces), self.cursor + step))
+
+    def clear(self):
+        if self.pieces:
+            self.pieces = []
+            self.cursor = 0
+            self._changed(0)
+
+    def set_text(self, text):
+        """Remplace la saisie par un texte découpé en éléments (nom de fonction et « ( » groupés)"""
+        pieces = []
+        last = None
+        for m in _TOKEN_RE.finditer(text):
+            value = m.group()
+            if value == '(' and last == 'name':
+                pieces[-1] = (pieces[-1][0] + '(', False)
+            else:
+                pieces.append((value, m.lastgroup == 'num'))
+            last = m.lastgroup
+        self.pieces = pieces
+        self.cursor = len(pieces)
+        self._changed(0)
+
+    def tokens(self):
+        """Jetons d'analyse (comme tokenize) assemblés élément par élément ; None : découper le texte"""
+        if self._tokens_version != self.version:
+            self._tokens = self._update_tokens()
+            self._tokens_version = self.version
+        return self._tokens
+
+    def _update_tokens(self):
+        tokens = self._token_list
+        marks = self._token_marks
+        # Jetons des éléments avant la première modification : gardés tels quels
+        start = self._valid
+        del marks[start:]
+        count, pos = marks[-1] if marks else (0, 0)
+        del tokens[count:]
+        pieces = self.pieces
+        last = pieces[start - 1][0][-1] if start else ""
+        for i in range(start, len(pieces)):
+            text = pieces[i][0]
+            lexed = _piece_tokens(text)
+            # Un jeton à cheval sur deux éléments (« x » puis « 2 », « * » puis « ** ») :
+            # le texte entier sera découpé, pour garder le sens du texte affiché
+            if lexed is None or (last and _joins(last, text[0])):
+                self._valid = i
+                return None
+            for kind, value, p in lexed:
+                tokens.append((kind, value, pos + p))
+            pos += len(text)
+            marks.append((len(tokens), pos))
+            last = text[-1]
+        self._valid = len(pieces)
+        return tuple(tokens) + (('end', '', pos),)
+
+    def display_line(self, max_chars):
+        """Ligne affichée (curseur « | » hors fin de ligne), au plus max_chars caractères"""
+        if (self.version != self._display_version or self.cursor != self._display_cursor
+                or max_chars != self._display_width):
+            line = self.text
+            col = None
+            if self.cursor < len(self.pieces):
+                col = sum(len(text) for text, _ in self.pieces[:self.cursor])
+                line = line[:col] + "|" + line[col:]
+            if len(line) > max_chars:
+                width = max_chars - 3
+                if col is None or col < width:
+                    line = line[:width] + "..."
+                else:
+                    start = col + 1 - width
+                    line = "..." + line[start:start + width]
+            self._display_version = self.version
+            self._display_cursor = self.cursor
+            self._display_width = max_chars
+            self._display = line
+        return self._display
+
+# Historique
+class History:
+    """Tampon circulaire de lignes : au-delà de la capacité, les plus anciennes sont oubliées"""
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        self.capacity = max(1, capacity)
+        self.buf = [None] * self.capacity
+        self.start = 0
+        self.size = 0
+        self.version = 0   # Incrémenté à chaque modification
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError("history index out of range")
+        return self.buf[(self.start + i) % self.capacity]
+
+    def __iter__(self):
+        return self.lines(0, self.size)
+
+    def lines(self, start, stop):
+        """Lignes [start, stop) sans copier le reste du tampon"""
+        for i in range(max(0, start), min(stop, self.size)):
+            yield self.buf[(self.start + i) % self.capacity]
+
+    def append(self, line):
+        if self.size < self.capacity:
+            self.buf[(self.start + self.size) % self.capacity] = line
+            self.size += 1
+        else:
+            self.buf[self.start] = line
+            self.start = (self.start + 1) % self.capacity
+        self.version += 1
+
+    def clear(self):
+        self.buf = [None] * self.capacity
+        self.start = 0
+        self.size = 0
+        self.version += 1
+
+def session_dir():
+    base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "sdlcalc")
+
+# Valeurs natives enregistrées dans le journal (ANS)
+def encode_value(value):
+    """Texte « type valeur » d'une valeur native, relu par decode_value ; None si non enregistrable"""
+    kind = type(value)
+    try:
+        if kind is int or kind is float or kind is complex:
+            return f"{kind.__name__} {value!r}"
+        if kind is Fraction:
+            return f"fraction {value.numerator}/{value.denominator}"
+        if kind is Decimal:
+            return f"decimal {value}"
+        if kind is Big:
+            return f"big {value.d}"
+        if _is_array(value):
+            return f"array {value.tolist()!r}"
+    except ValueError:
+        # Entier trop long pour str() (plus de sys.get_int_max_str_digits() chiffres)
+        pass
+    return None
+
+def decode_value(text):
+    """Valeur native d'un texte de encode_value, None s'il est illisible"""
+    kind, _, body = text.partition(" ")
+    try:
+        if kind == 'int':
+            return int(body)
+        if kind == 'float':
+            return float(body)
+        if kind == 'complex':
+            return complex(body)
+        if kind == 'fraction':
+            return Fraction(body)
+        if kind == 'decimal':
+            return Decimal(body)
+        if kind == 'big':
+            return Big(Decimal(body))
+        if kind == 'array' and np is not None:
+            return np.array(ast.literal_eval(body))
+    except (ValueError, SyntaxError, ArithmeticError):
+        pass
+    return None
+
+# Début des lignes du journal qui ne sont pas de l'historique : ANS après chaque résultat
+ANSWER_RECORD = "\x1eans "
+
+def answer_record(result):
+    """Ligne de journal d'un Result (mode et valeur native), None si la valeur ne s'écrit pas"""
+    value = encode_value(result.value)
+    if value is None:
+        return None
+    mode = "-" if result.precision is None else result.precision
+    return f"{ANSWER_RECORD}{mode} {value}"
+
+def read_answer_record(line):
+    """Result d'une ligne de answer_record, None si elle est illisible"""
+    mode, _, value = line[len(ANSWER_RECORD):].partition(" ")
+    value = decode_value(value)
+    if value is None:
+        return None
+    if mode == "-":
+        return Result(value)
+    if mode == COMPLEX_MODE:
+        return Result(value, COMPLEX_MODE)
+    return Result(value, int(mode)) if mode.isdigit() else None
+
+class HistoryLog:
+    """Journal d'historique en ajout seul : fsync groupés, reprise en lisant la fin du fichier
+
+    Une ligne d'historique par ligne de fichier, et après chaque résultat sa
+    valeur native (ANSWER_RECORD). Au-delà de max_bytes, le journal est
+    réécrit avec ses keep_lines dernières lignes, sans attendre la sortie :
+    il reste borné même si la session s'arrête brutalement. La saisie en
+    cours est enregistrée à part, en quittant. Les erreurs d'E/S (carte SD
+    pleine ou en lecture seule) désactivent le journal sans interrompre le calcul.
+    """
+    BLOCK = 65536
+
+    def __init__(self, directory, sync_lines=HISTORY_SYNC_LINES, sync_s=HISTORY_SYNC_S,
+                 max_bytes=HISTORY_LOG_MAX_BYTES, keep_lines=HISTORY_LOG_KEEP_LINES):
+        self.path = os.path.join(directory, "history.log")
+        self.state_path = os.path.join(directory, "expression")
+        self.sync_lines = sync_lines
+        self.sync_s = sync_s
+        self.max_bytes = max_bytes
+        self.keep_lines = keep_lines
+        self.f = None
+        self.failed = False
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def read_tail(self, n):
+        """Les n dernières lignes, en ne lisant que la fin du fichier"""
+        try:
+            with open(self.path, "rb") as f:
+                pos = f.seek(0, os.SEEK_END)
+                data = b""
+                # Un saut de ligne de plus que n : la première ligne lue est complète
+                while pos > 0 and data.count(b"\n") <= n:
+                    step = min(self.BLOCK, pos)
+                    pos -= step
+                    f.seek(pos)
+                    data = f.read(step) + data
+        except OSError:
+            return []
+        lines = data.decode("utf-8", errors="replace").split("\n")
+        if pos > 0:
+            lines = lines[1:]
+        if lines and lines[-1] == "":
+            lines.pop()
+        return lines[-n:] if n > 0 else []
+
+    def _open(self):
+        if self.f is None and not self.failed:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.f = open(self.path, "a+b")
+                # Dernière ligne tronquée (arrêt brutal) : on la termine
+                if self.f.seek(0, os.SEEK_END) > 0:
+                    self.f.seek(-1, os.SEEK_END)
+                    if self.f.read(1) != b"\n":
+                        self.f.write(b"\n")
+            except OSError:
+                self._fail()
+        return self.f
+
+    def _fail(self):
+        self.failed = True
+        self._close()
+
+    def _close(self):
+        # Le fichier est oublié même si close() échoue (flush sur carte pleine)
+        f, self.f = self.f, None
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                pass
+
+    def append(self, line):
+        f = self._open()
+        if f is None:
+            return
+        try:
+            # Écrit tout de suite pour l'OS ; fsync seulement par lots
+            f.write(line.encode("utf-8", errors="replace") + b"\n")
+            f.flush()
+            size = f.tell()
+        except OSError:
+            self._fail()
+            return
+        self.unsynced += 1
+        if size > self.max_bytes:
+            self.compact()
+        elif self.unsynced >= self.sync_lines:
+            self.sync()
+
+    def maybe_sync(self):
+        """À appeler régulièrement : fsync des lignes en attente depuis trop longtemps"""
+        if self.unsynced and time.monotonic() - self.last_sync >= self.sync_s:
+            self.sync()
+
+    def sync(self):
+        if self.f is not None:
+            try:
+                self.f.flush()
+                os.fsync(self.f.fileno())
+            except OSError:
+                self._fail()
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def _write_atomic(self, path, data):
+        tmp = path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except OSError:
+            # Ancien fichier intact ; pas de fichier temporaire laissé sur la carte
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def compact(self):
+        """Ne garde que les keep_lines dernières lignes du journal"""
+        self.rewrite(self.read_tail(self.keep_lines))
+
+    def rewrite(self, lines):
+        """Remplace le journal par ces lignes"""
+        self._close()
+        self.unsynced = 0
+        self._write_atomic(self.path, "".join(line + "\n" for line in lines).encode("utf-8", errors="replace"))
+
+    def read_state(self):
+        try:
+            with open(self.state_path, encoding="utf-8", errors="replace") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def write_state(self, expression):
+        self._write_atomic(self.state_path, expression.encode("utf-8", errors="replace"))
+
+    def close(self):
+        self.sync()
+        self._close()
+
+class DigitsView:
+    """Texte complet d'un résultat, une page à la fois (touche V)
+
+    Les lignes sont découpées à la demande dans Result.full_slice : seuls les
+    blocs de chiffres atteints en défilant sont convertis.
+    """
+    __slots__ = ('result', 'top', 'width', 'visible', 'lines', 'header')
+
+    def __init__(self, result):
+        self.result = result
+        self.top = 0
+        self.width = 0
+        self.visible = 1
+        self.lines = {}   # (largeur, indice) -> ligne déjà découpée
+        length = result.full_length()
+        kind = "digits" if result._integer is not None else "chars"
+        self.header = f"{length} {kind}  Up/Down  V: close"
+
+    def line_count(self):
+        return -(-self.result.full_length() // self.width) if self.width else 0
 
-class Button:
-    def __init__(self, x, y, w, h, text, color, value, font, hint=""):
-        self.rect = SDL_Rect(x, y, w, h)
-        self.text = text
-        self.color = color
-        self.value = value
-        self.font = font
-        self.hint = hint
+    def scroll(self, step):
+        top = self.top + step
+        if self.width:
+            top = min(top, self.line_count() - self.visible)
+        self.top = max(0, top)
 
-    def draw(self, renderer, show_hints=True, hint_font=None):
-        # Fond du bouton
-        sdl2.SDL_SetRenderDrawColor(renderer, *self.color, 255)
-        sdl2.SDL_RenderFillRect(renderer, ctypes.byref(self.rect))
-        
-        # Bordure
-        sdl2.SDL_SetRenderDrawColor(renderer, 0, 0, 0, 255)
-        sdl2.SDL_RenderDrawRect(renderer, ctypes.byref(self.rect))
-        
-        # Texte principal
-        if self.font and self.text:
-            text_color = SDL_Color(255, 255, 255, 255)
-            text_bytes = self.text.encode("utf-8", errors="ignore")
-            surf = sdl2_ttf.TTF_RenderText_Solid(self.font, text_bytes, text_color)
-            if surf:
-                tex = sdl2.SDL_CreateTextureFromSurface(renderer, surf)
-                if tex:
-                    tw = c_int()
-                    th = c_int()
-                    sdl2.SDL_QueryTexture(tex, None, None, ctypes.byref(tw), ctypes.byref(th))
-                    tx = self.rect.x + (self.rect.w - tw.value) // 2
-                    ty = self.rect.y + (self.rect.h - th.value) // 2
-                    dst = SDL_Rect(tx, ty, tw.value, th.value)
-                    sdl2.SDL_RenderCopy(renderer, tex, None, ctypes.byref(dst))
-                    sdl2.SDL_DestroyTexture(tex)
-                sdl2.SDL_FreeSurface(surf)
-        
-        # Overlay d'aide (hint) en haut à droite
-        if show_hints and self.hint and hint_font:
-            hint_color = SDL_Color(*Color.HINT_TEXT, 255)
-            hint_bytes = self.hint.encode("utf-8", errors="ignore")
-            surf = sdl2_ttf.TTF_RenderText_Solid(hint_font, hint_bytes, hint_color)
-            if surf:
-                tex = sdl2.SDL_CreateTextureFromSurface(renderer, surf)
-                if tex:
-                    tw = c_int()
-                    th = c_int()
-                    sdl2.SDL_QueryTexture(tex, None, None, ctypes.byref(tw), ctypes.byref(th))
-                    tx = self.rect.x + self.rect.w - tw.value - 2
-                    ty = self.rect.y + 2
-                    dst = SDL_Rect(tx, ty, tw.value, th.value)
-                    sdl2.SDL_RenderCopy(renderer, tex, None, ctypes.byref(dst))
-                    sdl2.SDL_DestroyTexture(tex)
-                sdl2.SDL_FreeSurface(surf)
+    def line(self, i):
+        key = (self.width, i)
+        line = self.lines.get(key)
+        if line is None:
+            line = self.lines[key] = self.result.full_slice(i * self.width, (i + 1) * self.width)
+        return line
+
+    def layout(self, width, visible):
+        """Largeur et hauteur de la page ; le haut de page reste dans le texte"""
+        self.width = width
+        self.visible = max(1, visible)
+        self.scroll(0)
+
+class TableView:
+    """Table de x et f(x) pour graph_func, x = start + i × step (touche A)
+
+    Les lignes sont calculées par blocs de TABLE_CHUNK : un seul passage du
+    programme par bloc (sample_function, NumPy si disponible), pour la page
+    affichée et la page suivante seulement. Au plus TABLE_CACHE_CHUNKS blocs
+    sont gardés : la mémoire ne dépend pas de la distance parcourue.
+    """
+    __slots__ = ('program', 'start', 'step', 'top', 'width', 'visible', 'chunks', 'header')
+
+    def __init__(self, func, start, step):
+        self.program = compile_expression(func)
+        self.start = start
+        self.step = step
+        self.top = 0
+        self.width = 0
+        self.visible = 1
+        self.chunks = collections.OrderedDict()   # (largeur, bloc) -> lignes
+        self.header = f"y={func}  step {format_result(step)}"
+
+    def scroll(self, step):
+        self.top = max(0, min(self.top + step, TABLE_ROWS - self.visible))
+
+    def page(self, direction):
+        self.scroll(direction * self.visible)
+
+    def line(self, i):
+        k, j = divmod(i, TABLE_CHUNK)
+        return self._chunk(k)[j]
+
+    def prefetch(self):
+        """Bloc de la page suivante, calculé avant d'y arriver"""
+        self._chunk(min(TABLE_ROWS - 1, self.top + 2 * self.visible) // TABLE_CHUNK)
+
+    def layout(self, width, visible):
+        self.width = width
+        self.visible = max(1, visible)
+        self.scroll(0)
+
+    def _chunk(self, k):
+        key = (self.width, k)
+        lines = self.chunks.get(key)
+        if lines is not None:
+            self.chunks.move_to_end(key)
+            return lines
+        t0 = time.perf_counter_ns()
+        lo = k * TABLE_CHUNK
+        hi = min(lo + TABLE_CHUNK, TABLE_ROWS)
+        if np is not None:
+            xs = self.start + self.step * np.arange(lo, hi, dtype=float)
+        else:
+            xs = array('d', [self.start + self.step * i for i in range(lo, hi)])
+        ys = sample_function(self.program, xs)
+        column = self.width // 2
+        lines = [f"{x:<{column}.10g}{y:.10g}" if math.isfinite(y) else f"{x:<{column}.10g}undefined"
+                 for x, y in zip(xs.tolist(), ys.tolist())]
+        if len(self.chunks) >= TABLE_CACHE_CHUNKS:
+            self.chunks.popitem(last=False)
+        self.chunks[key] = lines
+        perf.count('table_chunk')
+        perf.add_time('table', time.perf_counter_ns() - t0)
+        return lines
 
 class Calculator:
-    def __init__(self):
-        self.expression = ""
-        self.history = []
+    INFO_LINES = (
+        "Designed by Uldrix",
+        "For experimentations only",
+        "Not allowed for commercial use",
+    )
+
+    def __init__(self, worker=None, history_log=None):
+        self.worker = worker
+        self.history_log = history_log
+        self.buffer = ExprBuffer()
+        self.recall_pos = None
+        self.recall_base = ""
+        self.recall_text = None
+        self.pending_expression = None
+        self.history = History()
         self.buttons = []
+        self.layout_version = 0
         self.show_graph = False
         self.graph_func = "x**2"
+        self.graph_view = GraphView()
         self.scroll_offset = 0
         self.key_press_times = {}
         self.just_calculated = False
@@ -236,11 +3853,53 @@ class Calculator:
         self.fullscreen_mode = False
         self.show_hints = True
         self.show_info = False
+        self.show_perf = False
+        self.precision = None      # Chiffres du mode décimal, None : flottants
+        self.precision_label = ""
+        self.answer = None         # Dernier résultat (Result), lu par ANS
+        self.registers = {}        # 'R0'..'R9' -> Result
+        self.register_mode = None  # 'store' / 'fetch' : un chiffre est attendu
+        self.register_prompt = ""
+        self.result_memo = ResultMemo()
+        self.memo_key = None
+        self.digits_view = None
+        self.table_view = None
+        self.stats = StreamStats()  # Données statistiques (touche Y)
+        self.stats_source = ""      # Fichier d'où viennent les données
+        self.stats_loader = None    # Lecture en cours (read_stats_file)
+        self.stats_progress = 0.0
+        self.stats_time = 0
+        self.preview = LivePreview()
+        self.quit_requested = False
+        self.grid = (0, 0, 1, 1, 0, 0)
+        self.button_grid = {}
+        self.calc_started = 0
+        # Rectangles réutilisés à chaque image
+        self.display_rect = SDL_Rect()
+        self.display_ref = ctypes.byref(self.display_rect)
+        self.info_rect = SDL_Rect()
+        self.info_ref = ctypes.byref(self.info_rect)
+        self.input_rect = SDL_Rect()
+        self.input_ref = ctypes.byref(self.input_rect)
+        self.plot_rect = SDL_Rect()
+        # Lignes après l'historique (saisie, aperçu, occupation, chargement), remplies à chaque image
+        self.tail_lines = [""] * 4
+
+    @property
+    def expression(self):
+        return self.buffer.text
+
+    @expression.setter
+    def expression(self, text):
+        self.buffer.set_text(text)
 
     def build_layout_compact(self, font_btn):
         self.buttons = []
+        self.button_grid = {}
+        self.layout_version += 1
         btn_w, btn_h = 50, 30
         start_x, start_y, gap = 3, 125, 2
+        self.grid = (start_x, start_y, btn_w + gap, btn_h + gap, btn_w, btn_h)
         
         # Mapping des hints (touches clavier)
         hints = {
@@ -301,6 +3960,7 @@ class Calculator:
                 y = start_y + r * (btn_h + gap)
                 hint = hints.get(label, "")
                 self.buttons.append(Button(x, y, btn_w, btn_h, label, color, val, font_btn, hint))
+                self.button_grid[(r, c)] = self.buttons[-1]
         
         # Colonne 6
         col6_layout = [
@@ -309,8 +3969,7 @@ class Calculator:
             ('cos', Color.BTN_FUNC, 'cos'),
             ('tan', Color.BTN_FUNC, 'tan'),
             ('pi', Color.BTN_FUNC, 'π'),
-            ('e', Color.BTN_FUNC, 'e'),
-            ('', Color.BG, '')
+            ('e', Color.BTN_FUNC, 'e')
         ]
         
         col6_x = start_x + 5 * (btn_w + gap)
@@ -319,88 +3978,196 @@ class Calculator:
                 y = start_y + r * (btn_h + gap)
                 hint = hints.get(label, "")
                 self.buttons.append(Button(col6_x, y, btn_w, btn_h, label, color, val, font_btn, hint))
+                self.button_grid[(r, 5)] = self.buttons[-1]
 
     def undo_step(self):
         """Retire la dernière étape de l'expression"""
-        if not self.expression:
-            return
-        
-        # Pattern pour identifier les différents types d'étapes
-        patterns = [
-            r'(sin|cos|tan|sqrt|log10|log)\($',  # Fonctions
-            r'\d+\.?\d*$',  # Nombres (avec ou sans décimale)
-            r'[+\-*/%^]$',  # Opérateurs
-            r'\*\*\d*$',  # Puissance
-            r'\)$',  # Parenthèse fermante
-            r'\($',  # Parenthèse ouvrante
-            r'!$',  # Factorielle
-            r'\d+\.\d+e[+-]?\d+$',  # Notation scientifique (pi, e)
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, self.expression)
-            if match:
-                self.expression = self.expression[:match.start()]
-                self.just_calculated = False
-                self.last_was_error = False
-                return
-        
-        # Si aucun pattern ne correspond, retire le dernier caractère
-        if self.expression:
-            self.expression = self.expression[:-1]
+        if self.buffer.undo():
             self.just_calculated = False
             self.last_was_error = False
 
+    def insert(self, piece, fresh=False, atomic=False):
+        """Insère un élément au curseur ; fresh : après un résultat, commence une nouvelle saisie"""
+        if fresh and (self.just_calculated or self.last_was_error):
+            self.buffer.clear()
+        self.buffer.insert(piece, atomic)
+        self.just_calculated = False
+        self.last_was_error = False
+
+    def backspace(self):
+        self.buffer.backspace()
+        self.just_calculated = False
+        self.last_was_error = False
+
+    def move_cursor(self, step):
+        self.buffer.move(step)
+
+    def clear_all(self):
+        self.buffer.clear()
+        self.clear_history()
+        self.stats = StreamStats()
+        self.stats_source = ""
+        self.stats_loader = None
+        self.just_calculated = False
+        self.last_was_error = False
+
     def draw_display(self, renderer, font_display, width, height):
+        display_rect = self.display_rect
+        display_rect.x = 3
+        display_rect.y = 3
         if self.fullscreen_mode:
-            display_rect = SDL_Rect(3, 3, width - 6, height - 6)
+            display_rect.w = width - 6
+            display_rect.h = height - 6
             max_visible_lines = (height - 12) // 18
         else:
-            display_rect = SDL_Rect(3, 3, 314, 115)
+            display_rect.w = 314
+            display_rect.h = 115
             max_visible_lines = 6
 
+        if self.show_graph and self.table_view is None:
+            # Saisie en cours : le tracé laisse la place à la bande du bas
+            strip = self.expression and font_display
+            plot_rect = self.plot_rect
+            plot_rect.x = display_rect.x
+            plot_rect.y = display_rect.y
+            plot_rect.w = display_rect.w
+            plot_rect.h = display_rect.h - GRAPH_INPUT_PX if strip else display_rect.h
+            self.graph_view.draw(renderer, plot_rect, self.graph_func, font_display)
+            if strip:
+                self._draw_graph_input(renderer, font_display, 40 if not self.fullscreen_mode else 60)
+            return
+
         sdl2.SDL_SetRenderDrawColor(renderer, *Color.DISPLAY_BG, 255)
-        sdl2.SDL_RenderFillRect(renderer, ctypes.byref(display_rect))
+        sdl2.SDL_RenderFillRect(renderer, self.display_ref)
         sdl2.SDL_SetRenderDrawColor(renderer, 0, 0, 0, 255)
-        sdl2.SDL_RenderDrawRect(renderer, ctypes.byref(display_rect))
+        sdl2.SDL_RenderDrawRect(renderer, self.display_ref)
 
         if not font_display:
             return
         
-        text_color = SDL_Color(0, 255, 0, 255)
         line_height = 18
         max_chars = 40 if not self.fullscreen_mode else 60
-        
-        all_lines = []
-        for line in self.history:
-            line = (line[:max_chars] + "...") if len(line) > max_chars else line
-            all_lines.append(line)
+
+        # Lignes après l'historique : saisie en cours, indicateur d'occupation
+        tail_lines = self.tail_lines
+        n_tail = 0
+        preview_line = -1
         if self.expression:
-            expr = (self.expression[:max_chars] + "...") if len(self.expression) > max_chars else self.expression
-            all_lines.append(expr)
-        
-        total_lines = len(all_lines)
+            tail_lines[0] = self.buffer.display_line(max_chars)
+            n_tail = 1
+            if self.show_preview:
+                preview_line = len(self.history) + 1
+                tail_lines[1] = self.preview.text
+                n_tail = 2
+        if self.busy:
+            # Indicateur d'occupation, animé tant que le calcul tourne
+            elapsed = self.worker.elapsed()
+            spinner = "|/-\\"[int(elapsed * 8) % 4]
+            tail_lines[n_tail] = f"{spinner} computing {elapsed:.1f}s  Esc: cancel"
+            n_tail += 1
+        if self.stats_loader is not None:
+            tail_lines[n_tail] = f"reading {self.stats_source} {self.stats_progress:.0%}"
+            n_tail += 1
+
+        if self.digits_view is not None:
+            self._draw_digits(renderer, font_display, max_chars, max_visible_lines, line_height)
+            return
+        if self.table_view is not None:
+            self._draw_table(renderer, font_display, max_chars, max_visible_lines, line_height)
+            return
+
+        n_history = len(self.history)
+        total_lines = n_history + n_tail
         max_scroll = max(0, total_lines - max_visible_lines)
         self.scroll_offset = max(0, min(self.scroll_offset, max_scroll))
-        
+
+        # Seules les lignes visibles sont lues, tronquées et rendues
         start_idx = self.scroll_offset
         end_idx = min(start_idx + max_visible_lines, total_lines)
-        visible_lines = all_lines[start_idx:end_idx]
-        
+        x = display_rect.x + 6
         y_offset = display_rect.y + 4
-        for line in visible_lines:
-            surf = sdl2_ttf.TTF_RenderText_Solid(font_display, line.encode('utf-8'), text_color)
-            if surf:
-                tex = sdl2.SDL_CreateTextureFromSurface(renderer, surf)
+        atlas = glyph_atlas.ready(renderer, font_display)
+        for i in range(start_idx, end_idx):
+            line = self.history[i] if i < n_history else tail_lines[i - n_history]
+            color = Color.PREVIEW_TEXT if i == preview_line else Color.DISPLAY_TEXT
+            self._draw_line(renderer, font_display, atlas, line, x, y_offset, max_chars, color)
+            y_offset += line_height
+        self._draw_label(renderer, font_display, atlas, max_chars)
+        if atlas:
+            glyph_atlas.flush()
+
+    def _draw_graph_input(self, renderer, font_display, max_chars):
+        """Saisie en cours sur une bande en bas du graphe (intervalle « a,b » des touches O et B)"""
+        display_rect = self.display_rect
+        input_rect = self.input_rect
+        input_rect.x = display_rect.x
+        input_rect.w = display_rect.w
+        input_rect.h = GRAPH_INPUT_PX
+        input_rect.y = display_rect.y + display_rect.h - input_rect.h
+        sdl2.SDL_SetRenderDrawColor(renderer, *Color.DISPLAY_BG, 255)
+        sdl2.SDL_RenderFillRect(renderer, self.input_ref)
+        sdl2.SDL_SetRenderDrawColor(renderer, 0, 0, 0, 255)
+        sdl2.SDL_RenderDrawRect(renderer, self.input_ref)
+        atlas = glyph_atlas.ready(renderer, font_display)
+        self._draw_line(renderer, font_display, atlas, self.buffer.display_line(max_chars),
+                        input_rect.x + 6, input_rect.y + 2, max_chars)
+        if atlas:
+            glyph_atlas.flush()
+
+    def _draw_line(self, renderer, font_display, atlas, line, x, y, max_chars, color=Color.DISPLAY_TEXT):
+        if atlas:
+            glyph_atlas.add(line, x, y, color, max_chars)
+        else:
+            if len(line) > max_chars:
+                line = line[:max_chars] + "..."
+            tex, tw, th = text_cache.get(renderer, font_display, line, color)
+            if tex:
+                copy_texture(renderer, tex, x, y, tw, th)
+
+    def _draw_digits(self, renderer, font_display, max_chars, max_visible_lines, line_height):
+        """Vue des chiffres complets : en-tête puis une page de lignes pleines"""
+        view = self.digits_view
+        view.layout(max_chars, max_visible_lines - 1)
+        display_rect = self.display_rect
+        x = display_rect.x + 6
+        y = display_rect.y + 4
+        atlas = glyph_atlas.ready(renderer, font_display)
+        self._draw_line(renderer, font_display, atlas, view.header, x, y, max_chars)
+        for i in range(view.top, min(view.top + view.visible, view.line_count())):
+            y += line_height
+            self._draw_line(renderer, font_display, atlas, view.line(i), x, y, max_chars)
+        if atlas:
+            glyph_atlas.flush()
+
+    def _draw_table(self, renderer, font_display, max_chars, max_visible_lines, line_height):
+        """Table de valeurs : en-tête puis les lignes de la page"""
+        view = self.table_view
+        view.layout(max_chars, max_visible_lines - 1)
+        display_rect = self.display_rect
+        x = display_rect.x + 6
+        y = display_rect.y + 4
+        atlas = glyph_atlas.ready(renderer, font_display)
+        self._draw_line(renderer, font_display, atlas, view.header, x, y, max_chars, Color.HINT_TEXT)
+        for i in range(view.top, view.top + view.visible):
+            y += line_height
+            self._draw_line(renderer, font_display, atlas, view.line(i), x, y, max_chars)
+        if atlas:
+            glyph_atlas.flush()
+        view.prefetch()
+
+    def _draw_label(self, renderer, font_display, atlas, max_chars):
+        # Attente d'un registre (S / G) ou mode décimal, en haut à droite de l'affichage
+        label = self.register_prompt or self.precision_label
+        if label:
+            display_rect = self.display_rect
+            right = display_rect.x + display_rect.w - 4
+            if atlas:
+                glyph_atlas.add(label, right - len(label) * glyph_atlas.advance, display_rect.y + 4,
+                                Color.HINT_TEXT, max_chars)
+            else:
+                tex, tw, th = text_cache.get(renderer, font_display, label, Color.HINT_TEXT)
                 if tex:
-                    tw = c_int()
-                    th = c_int()
-                    sdl2.SDL_QueryTexture(tex, None, None, ctypes.byref(tw), ctypes.byref(th))
-                    dst = SDL_Rect(display_rect.x + 6, y_offset, tw.value, th.value)
-                    sdl2.SDL_RenderCopy(renderer, tex, None, ctypes.byref(dst))
-                    sdl2.SDL_DestroyTexture(tex)
-                    y_offset += line_height
-                sdl2.SDL_FreeSurface(surf)
+                    copy_texture(renderer, tex, right - tw, display_rect.y + 4, tw, th)
 
     def draw_info_overlay(self, renderer, font_info, width, height):
         """Dessine l'overlay d'information"""
@@ -412,191 +4179,647 @@ class Calculator:
         info_x = (width - info_w) // 2
         info_y = (height - info_h) // 2
         
-        info_rect = SDL_Rect(info_x, info_y, info_w, info_h)
+        info_rect = self.info_rect
+        info_rect.x = info_x
+        info_rect.y = info_y
+        info_rect.w = info_w
+        info_rect.h = info_h
         
         # Fond gris clair
         sdl2.SDL_SetRenderDrawColor(renderer, *Color.INFO_BG, 255)
-        sdl2.SDL_RenderFillRect(renderer, ctypes.byref(info_rect))
+        sdl2.SDL_RenderFillRect(renderer, self.info_ref)
         
         # Bordure noire
         sdl2.SDL_SetRenderDrawColor(renderer, 0, 0, 0, 255)
-        sdl2.SDL_RenderDrawRect(renderer, ctypes.byref(info_rect))
+        sdl2.SDL_RenderDrawRect(renderer, self.info_ref)
         
         # Textes
-        text_color = SDL_Color(*Color.INFO_TEXT, 255)
-        lines = [
-            "Designed by Uldrix",
-            "For experimentations only",
-            "Not allowed for commercial use"
-        ]
-        
         y_offset = info_y + 15
-        for line in lines:
-            surf = sdl2_ttf.TTF_RenderText_Solid(font_info, line.encode('utf-8'), text_color)
-            if surf:
-                tex = sdl2.SDL_CreateTextureFromSurface(renderer, surf)
-                if tex:
-                    tw = c_int()
-                    th = c_int()
-                    sdl2.SDL_QueryTexture(tex, None, None, ctypes.byref(tw), ctypes.byref(th))
-                    tx = info_x + (info_w - tw.value) // 2
-                    dst = SDL_Rect(tx, y_offset, tw.value, th.value)
-                    sdl2.SDL_RenderCopy(renderer, tex, None, ctypes.byref(dst))
-                    sdl2.SDL_DestroyTexture(tex)
-                    y_offset += 25
-                sdl2.SDL_FreeSurface(surf)
+        for line in self.INFO_LINES:
+            tex, tw, th = text_cache.get(renderer, font_info, line, Color.INFO_TEXT)
+            if tex:
+                copy_texture(renderer, tex, info_x + (info_w - tw) // 2, y_offset, tw, th)
+                y_offset += 25
 
     def scroll_up(self):
+        if self.table_view is not None:
+            self.table_view.scroll(-1)
+            return
+        if self.digits_view is not None:
+            self.digits_view.scroll(-1)
+            return
         self.scroll_offset = max(0, self.scroll_offset - 1)
     
     def scroll_down(self):
+        if self.table_view is not None:
+            self.table_view.scroll(1)
+            return
+        if self.digits_view is not None:
+            self.digits_view.scroll(1)
+            return
         self.scroll_offset += 1
 
+    @property
+    def show_preview(self):
+        """Aperçu grisé sous la saisie : pas après un résultat ni pendant un calcul"""
+        return bool(self.preview.text) and not self.just_calculated and not self.busy
+
+    def update_preview(self, budget_ms=PREVIEW_BUDGET_MS):
+        """Recalcule l'aperçu après une touche ; la ligne d'aperçu reste visible"""
+        if self.preview.update(self, budget_ms) and self.show_preview:
+            self.adjust_scroll_to_show_input()
+
     def adjust_scroll_to_show_input(self):
         max_visible_lines = 6 if not self.fullscreen_mode else 15
-        total_lines = len(self.history) + (1 if self.expression else 0)
+        total_lines = len(self.history) + (1 if self.expression else 0) + (1 if self.show_preview else 0)
         
         if total_lines > max_visible_lines:
             self.scroll_offset = total_lines - max_visible_lines
         else:
             self.scroll_offset = 0
 
+    def toggle_graph(self):
+        """Bascule la vue graphique ; une expression en x devient la fonction tracée"""
+        self.show_graph = not self.show_graph
+        if self.show_graph and self.expression:
+            try:
+                if 'x' in compile_expression(self.expression, self.buffer.tokens()).names:
+                    # La saisie devient la fonction tracée : place à l'intervalle « a,b »
+                    self.graph_func = self.expression
+                    self.clear_entry()
+            except ExprError:
+                pass
+
+    def input_values(self, expected, counts):
+        """Valeurs réelles saisies « a,b,... » (ANS et registres permis), leur nombre parmi counts"""
+        text = self.expression
+        commas = LivePreview._split(tokenize(text)[:-1], (',',))[1::2]
+        if len(commas) + 1 not in counts:
+            raise ExprError(f"expected {expected}", None)
+        cuts = [-1] + [comma[2] for comma in commas] + [len(text)]
+        variables = {}
+        for name in VARIABLES:
+            result = self.variable(name)
+            if result is not None:
+                variables[name] = result.value
+        try:
+            return tuple(_to_float(compute_value(text[a + 1:b], variables=variables)) for a, b in zip(cuts, cuts[1:]))
+        except TypeError:
+            # Complexe ou matrice lus par ANS ou un registre
+            raise ExprError("real value expected", None)
+
+    def input_pair(self, expected):
+        """Deux valeurs saisies « a,b » ; None sans saisie"""
+        if not self.expression or self.just_calculated or self.last_was_error:
+            return None
+        return self.input_values(expected, (2,))
+
+    def solver_interval(self):
+        """Intervalle « a,b » saisi, sinon la partie visible du graphe"""
+        pair = self.input_pair("an interval a,b")
+        if pair is None:
+            return self.graph_view.x_range()
+        a, b = pair
+        if a == b:
+            raise ExprError("empty interval", None)
+        return min(a, b), max(a, b)
+
+    def run_solver(self, kind):
+        """root, integ, fmin ou fmax de graph_func sur l'intervalle ; résultat dans l'historique comme un calcul"""
+        if self.busy:
+            return
+        self.calc_started = time.perf_counter_ns()
+        func = self.graph_func
+        f = None
+        try:
+            f = FunctionSampler(compile_expression(func), -1.0 if kind == 'fmax' else 1.0)
+            a, b = self.solver_interval()
+            expression = f"{kind}({func}, {format_result(a)}, {format_result(b)})"
+            if kind == 'root':
+                value = find_root(f, a, b)
+                note = ""
+            elif kind == 'integ':
+                value, error = integrate(f, a, b)
+                note = f" ±{error:.1g}"
+            else:
+                value, y = find_minimum(f, a, b)
+                note = f" y={format_result(f.sign * y)}"
+        except ExprError as e:
+            if f is not None and f.evals:
+                perf.count('solver_evals', f.evals)
+            self.finish_calculation(f"{kind}({func})", 'error', (e.message, None))
+            return
+        ns = time.perf_counter_ns() - self.calc_started
+        perf.add_time('solver', ns)
+        perf.count('solver_evals', f.evals)
+        self.finish_calculation(f"{expression}{note}  {f.evals} evals {ns / 1e6:.2f} ms", 'ok', Result(value))
+
     def toggle_hints(self):
         self.show_hints = not self.show_hints
 
     def toggle_info(self):
         self.show_info = not self.show_info
 
-    def handle_button(self, value):
-        if value == 'OFF':
-            import sys
-            sys.exit(0)
-            
-        if self.last_was_error and value.isdigit():
-            self.expression = value
-            self.last_was_error = False
+    def toggle_precision(self):
+        """Mode suivant : flottants, décimal à 50 et 100 chiffres, puis complexe et matriciel"""
+        levels = PRECISION_LEVELS
+        self.precision = levels[(levels.index(self.precision) + 1) % len(levels)]
+        if self.precision is None:
+            self.precision_label = ""
+        elif self.precision == COMPLEX_MODE:
+            self.precision_label = "CPLX"
+        else:
+            self.precision_label = f"DEC{self.precision}"
+
+    def toggle_perf(self):
+        self.show_perf = not self.show_perf
+
+    def toggle_digits(self):
+        """Ouvre ou ferme la vue des chiffres complets du dernier résultat"""
+        if self.digits_view is not None:
+            self.digits_view = None
+        elif self.answer is not None:
+            self.table_view = None
+            self.digits_view = DigitsView(self.answer)
+
+    def toggle_table(self):
+        """Ouvre ou ferme la table de valeurs de graph_func, depuis « start,step » saisi ou 0,1"""
+        if self.table_view is not None:
+            self.table_view = None
             return
-            
-        if value == '=':
-            self.calculate()
-        elif value == 'C':
-            self.expression = ""
-            self.history = []
-            self.scroll_offset = 0
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == 'CE':
-            self.expression = ""
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == '⌫' or value == 'Bk':
-            self.expression = self.expression[:-1]
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == 'Gr' or value == 'Graph':
-            self.show_graph = not self.show_graph
-        elif value in ['+', '-', '*', '/', '%']:
-            self.expression += value
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == 'π' or value == 'pi':
-            if self.just_calculated:
-                self.expression = str(math.pi)
-            else:
-                self.expression += str(math.pi)
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == 'e':
-            if self.just_calculated:
-                self.expression = str(math.e)
-            else:
-                self.expression += str(math.e)
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == '√' or value == 'sq':
-            self.expression += 'sqrt('
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == 'x²' or value == 'x2':
-            self.expression += '**2'
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == 'xʸ' or value == 'xy':
-            self.expression += '**'
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == 'log':
-            self.expression += 'log10('
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == 'ln':
-            self.expression += 'log('
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value in ['sin', 'cos', 'tan']:
-            self.expression += value + '('
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == '1/x':
-            self.expression += '**(-1)'
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == '!':
-            self.expression += '!'
-            self.just_calculated = False
-            self.last_was_error = False
-        elif value == 'mod':
-            self.expression += '%'
-            self.just_calculated = False
-            self.last_was_error = False
+        func = self.graph_func
+        try:
+            start, step = self.input_pair("start,step") or (0.0, 1.0)
+            if not step:
+                raise ExprError("step must not be 0", None)
+            view = TableView(func, start, step)
+            view.line(0)
+        except ExprError as e:
+            self.add_history(f"table({func})")
+            self.add_history(f"= Error: {e.message}")
+            self.adjust_scroll_to_show_input()
+            return
+        self.digits_view = None
+        self.table_view = view
+
+    def add_data(self):
+        """Y : ajoute la saisie « x » ou « x,y » (ou le dernier résultat) aux données statistiques"""
+        if self.stats_loader is not None or not self.expression:
+            return
+        text = self.expression
+        try:
+            values = self.input_values("x or x,y", (1, 2))
+            self.stats.add(*values)
+        except ExprError as e:
+            self.add_history(f"data {text}")
+            self.add_history(f"= Error: {e.message}")
+            self.adjust_scroll_to_show_input()
+            return
+        self.add_history(f"data {','.join(format_result(v) for v in values)}  n={self.stats.n}")
+        self.clear_entry()
+        self.adjust_scroll_to_show_input()
+
+    def show_stats(self):
+        """Y long : statistiques des données saisies ou lues, écrites dans l'historique"""
+        if self.stats_loader is not None:
+            return
+        t0 = time.perf_counter_ns()
+        lines = self.stats.report()
+        perf.add_time('stats', time.perf_counter_ns() - t0)
+        self.add_history(f"stats {self.stats_source}".rstrip())
+        for line in lines:
+            self.add_history(line)
+        self.adjust_scroll_to_show_input()
+
+    def load_stats(self, path):
+        """Remplace les données par celles d'un fichier, lu par tranches (step_stats_load)"""
+        self.stats = StreamStats()
+        self.stats_source = os.path.basename(path)
+        self.stats_progress = 0.0
+        self.stats_time = 0
+        self.stats_loader = read_stats_file(path, self.stats)
+
+    def step_stats_load(self, budget_ms=STATS_STEP_MS):
+        """Lit des blocs du fichier de données pendant budget_ms ; le résultat va dans l'historique à la fin"""
+        if self.stats_loader is None:
+            return
+        t0 = time.perf_counter_ns()
+        deadline = t0 + budget_ms * 1000000
+        try:
+            for self.stats_progress in self.stats_loader:
+                if time.perf_counter_ns() >= deadline:
+                    self.stats_time += time.perf_counter_ns() - t0
+                    return
+        except (OSError, ValueError) as e:
+            self.stats_loader = None
+            self.stats = StreamStats()
+            self.add_history(f"stats {self.stats_source}")
+            self.add_history(f"= Error: {getattr(e, 'strerror', None) or 'cannot read file'}")
+            self.stats_source = ""
+            self.adjust_scroll_to_show_input()
+            return
+        self.stats_loader = None
+        self.stats_time += time.perf_counter_ns() - t0
+        perf.add_time('stats', self.stats_time)
+        self.add_history(f"stats {self.stats_source}  {self.stats_time / 1e9:.2f} s")
+        for line in self.stats.report():
+            self.add_history(line)
+        self.adjust_scroll_to_show_input()
+
+    def start_register(self, mode):
+        """S / G : le chiffre suivant désigne le registre"""
+        self.register_mode = mode
+        self.register_prompt = "STO" if mode == 'store' else "RCL"
+
+    def register_action(self, digit):
+        name = f"R{digit}"
+        if self.register_mode == 'fetch':
+            self.insert(name, fresh=True, atomic=True)
+        elif self.answer is not None:
+            self.registers[name] = self.answer
+            self.add_history(f"{name} = {self.answer.text}")
+            self.adjust_scroll_to_show_input()
+
+    def perform(self, action):
+        """Exécute une action (valeur de bouton ou nom de commande), clavier et souris confondus"""
+        if self.register_mode is not None:
+            # Un chiffre complète S / G ; toute autre action les abandonne
+            digit = action.isdigit()
+            if digit:
+                self.register_action(action)
+            self.register_mode = None
+            self.register_prompt = ""
+            if digit:
+                return
+        if action not in self.VIEW_ACTIONS:
+            self.digits_view = None
+            self.table_view = None
+        command = self.COMMANDS.get(action)
+        if command is not None:
+            command(self)
+        elif action in self.CONSTANT_VALUES:
+            self.insert(self.CONSTANT_VALUES[action], fresh=True, atomic=True)
+        elif action.isdigit():
+            self.insert(action, fresh=True)
         else:
-            self.expression += value
-            self.just_calculated = False
-            self.last_was_error = False
+            piece = self.INSERTIONS.get(action, action)
+            # Un nom (fonction, x) ne se colle pas à « ANS » : nouvelle saisie
+            self.insert(piece, fresh=piece[0].isalpha())
+
+    def request_quit(self):
+        """OFF / Esc : annule le calcul en cours, sinon demande la fermeture"""
+        if self.busy:
+            self.cancel_calculation()
+        else:
+            self.quit_requested = True
+
+    def clear_entry(self):
+        self.buffer.clear()
+        self.just_calculated = False
+        self.last_was_error = False
+
+    @property
+    def busy(self):
+        return self.worker is not None and self.worker.busy
+
+    def variable(self, name):
+        """Résultat lu par ANS ou un registre, None s'il n'est pas défini"""
+        return self.answer if name == 'ANS' else self.registers.get(name)
 
     def calculate(self):
-        if not self.expression:
+        if not self.expression or self.busy:
             return
+        self.calc_started = time.perf_counter_ns()
+        text = self.expression
+        # Jetons déjà découpés à la saisie : le texte n'est pas relu
+        tokens = self.buffer.tokens()
         try:
-            expr = self.expression
-            # Remplacer ^ par **
-            expr = expr.replace('^', '**')
-            # Factorielles
-            for m in re.findall(r'(\d+)!', expr):
-                expr = expr.replace(f'{m}!', str(math.factorial(int(m))), 1)
-            expr = expr.replace('sqrt', 'math.sqrt')
-            expr = expr.replace('sin', 'math.sin')
-            expr = expr.replace('cos', 'math.cos')
-            expr = expr.replace('tan', 'math.tan')
-            expr = expr.replace('log10', 'math.log10')
-            expr = expr.replace('log', 'math.log')
-            result = eval(expr)
-            if isinstance(result, float) and result.is_integer():
-                result = int(result)
-            else:
-                result = round(result, 10)
-            self.history.append(self.expression)
-            self.history.append(f"= {result}")
-            self.expression = str(result)
-            max_visible_lines = 6 if not self.fullscreen_mode else 15
-            self.scroll_offset = max(0, len(self.history) + 1 - max_visible_lines)
+            program = compile_expression(text, tokens)
+        except ExprError as e:
+            self.finish_calculation(text, 'error', (e.message, e.pos))
+            return
+        # Valeurs natives d'ANS et des registres lus : pas de perte en passant par le texte
+        variables = {}
+        for name in program.names:
+            result = self.variable(name)
+            if result is not None:
+                variables[name] = result.value
+        self.memo_key = None
+        if len(variables) == len(program.names):
+            key = (program.key, self.precision, tuple(sorted((name, _value_key(v)) for name, v in variables.items())))
+            result = self.result_memo.get(key)
+            if result is not None:
+                self.finish_calculation(text, 'ok', result)
+                return
+            self.memo_key = key
+        if self.worker is None:
+            try:
+                outcome = ('ok', compute_value(text, tokens, self.precision, variables))
+            except ExprError as e:
+                outcome = ('error', (e.message, e.pos))
+            self.finish_calculation(text, *outcome)
+            return
+        self.pending_expression = text
+        self.worker.submit(text, tokens, self.precision, variables)
+        # La plupart des calculs répondent tout de suite : pas d'indicateur « occupé »
+        self.poll_calculation(EVAL_FAST_WAIT_S)
+
+    def poll_calculation(self, wait=0.0):
+        """Récupère le résultat du processus de calcul ; True si le calcul est terminé"""
+        if not self.busy:
+            return False
+        outcome = self.worker.poll(wait)
+        if outcome is None:
+            return False
+        self.finish_calculation(self.pending_expression, *outcome)
+        return True
+
+    def cancel_calculation(self):
+        if self.busy:
+            self.worker.cancel()
+            self.finish_calculation(self.pending_expression, 'cancelled', None)
+
+    def finish_calculation(self, expression, status, value):
+        # Durée vue par l'utilisateur, aller-retour du processus compris
+        perf.add_time('calculate', time.perf_counter_ns() - self.calc_started)
+        self.pending_expression = None
+        self.add_history(expression)
+        if status == 'ok':
+            if not isinstance(value, Result):
+                value = Result(value, self.precision)
+                if self.memo_key is not None:
+                    self.result_memo.put(self.memo_key, value)
+            self.memo_key = None
+            self.answer = value
+            lines = value.lines()
+            self.add_history(f"= {lines[0]}")
+            # Matrice : une ligne d'historique par ligne de la matrice
+            for line in lines[1:]:
+                self.add_history(f"  {line}")
+            if self.history_log is not None:
+                # Valeur native et mode d'ANS, pour la session suivante
+                record = answer_record(value)
+                if record is not None:
+                    self.history_log.append(record)
+            # La suite du calcul lit la valeur exacte, pas son texte
+            self.expression = "ANS"
             self.just_calculated = True
             self.last_was_error = False
-        except:
-            self.history.append(self.expression)
-            self.history.append("= Error")
+        else:
+            if status == 'error':
+                message, pos = value
+                if pos is None:
+                    self.add_history(f"= Error: {message}")
+                else:
+                    self.add_history(f"= Error (col {pos + 1}): {message}")
+            elif status == 'timeout':
+                self.add_history("= Error: timeout")
+            else:
+                self.add_history("= Cancelled")
             self.expression = ""
-            max_visible_lines = 6 if not self.fullscreen_mode else 15
-            self.scroll_offset = max(0, len(self.history) + 1 - max_visible_lines)
             self.just_calculated = False
             self.last_was_error = True
+        max_visible_lines = 6 if not self.fullscreen_mode else 15
+        self.scroll_offset = max(0, len(self.history) + 1 - max_visible_lines)
+
+    def add_history(self, line):
+        self.history.append(line)
+        if self.history_log is not None:
+            self.history_log.append(line)
+
+    def clear_history(self):
+        """Efface l'affichage ; le journal sur disque est gardé"""
+        self.history.clear()
+        self.scroll_offset = 0
+
+    def restore_session(self):
+        """Recharge la fin du journal et la saisie laissée à la sortie précédente"""
+        if self.history_log is None:
+            return
+        with perf.timer('restore'):
+            answer = None
+            for line in self.history_log.read_tail(self.history_log.keep_lines):
+                if line.startswith(ANSWER_RECORD):
+                    answer = line
+                else:
+                    self.history.append(line)
+            self.expression = self.history_log.read_state()
+            # ANS repart du dernier résultat, valeur native dans son mode
+            if answer is not None:
+                self.answer = read_answer_record(answer)
+        self.adjust_scroll_to_show_input()
+
+    def save_session(self):
+        if self.history_log is not None:
+            self.history_log.write_state(self.expression)
+            self.history_log.close()
+
+    def recall_result(self):
+        """Insère un résultat précédent ; chaque nouvel appui remonte au résultat d'avant"""
+        if self.recall_text is None or self.expression != self.recall_text:
+            # Nouvelle recherche depuis le résultat le plus récent
+            start = len(self.history)
+            self.recall_base = "" if self.just_calculated or self.last_was_error else self.expression
+        else:
+            start = self.recall_pos
+        for i in itertools.chain(range(start - 1, -1, -1), range(len(self.history) - 1, start - 1, -1)):
+            line = self.history[i]
+            if line.startswith("= ") and not line.startswith(("= Error", "= Cancelled")):
+                self.recall_pos = i
+                text = line[2:]
+                # Lignes suivantes d'une matrice
+                j = i + 1
+                while j < len(self.history) and self.history[j].startswith("  "):
+                    text += self.history[j][2:]
+                    j += 1
+                self.expression = self.recall_base + text
+                self.recall_text = self.expression
+                self.just_calculated = False
+                self.last_was_error = False
+                return
 
     def toggle_fullscreen(self):
         self.fullscreen_mode = not self.fullscreen_mode
         if not self.fullscreen_mode:
             self.adjust_scroll_to_show_input()
 
-def main():
+    def button_at(self, x, y):
+        """Bouton sous (x, y) : indices de ligne et de colonne calculés sur la grille, O(1)"""
+        x0, y0, pitch_x, pitch_y, btn_w, btn_h = self.grid
+        col, dx = divmod(x - x0, pitch_x)
+        row, dy = divmod(y - y0, pitch_y)
+        # Bords inclus, interstices exclus
+        if dx > btn_w or dy > btn_h:
+            return None
+        return self.button_grid.get((row, col))
+
+    # Actions sans insertion de texte
+    COMMANDS = {
+        '=': calculate,
+        'C': clear_all,
+        'CE': clear_entry,
+        '⌫': backspace, 'Bk': backspace,
+        'Gr': toggle_graph, 'Graph': toggle_graph,
+        'table': toggle_table,
+        'page_up': lambda self: self.table_view and self.table_view.page(-1),
+        'page_down': lambda self: self.table_view and self.table_view.page(1),
+        'OFF': request_quit,
+        'undo': undo_step,
+        'recall': recall_result,
+        'hints': toggle_hints,
+        'info': toggle_info,
+        'perf': toggle_perf,
+        'precision': toggle_precision,
+        'digits': toggle_digits,
+        'store': lambda self: self.start_register('store'),
+        'fetch': lambda self: self.start_register('fetch'),
+        'fullscreen': toggle_fullscreen,
+        'scroll_up': scroll_up,
+        'scroll_down': scroll_down,
+        'cursor_left': lambda self: self.move_cursor(-1),
+        'cursor_right': lambda self: self.move_cursor(1),
+        'pan_left': lambda self: self.graph_view.pan(-GRAPH_PAN_PX, 0),
+        'pan_right': lambda self: self.graph_view.pan(GRAPH_PAN_PX, 0),
+        'pan_up': lambda self: self.graph_view.pan(0, GRAPH_PAN_PX),
+        'pan_down': lambda self: self.graph_view.pan(0, -GRAPH_PAN_PX),
+        'zoom_in': lambda self: self.graph_view.zoom(0.5),
+        'zoom_out': lambda self: self.graph_view.zoom(2.0),
+        'root': lambda self: self.run_solver('root'),
+        'integ': lambda self: self.run_solver('integ'),
+        'fmin': lambda self: self.run_solver('fmin'),
+        'fmax': lambda self: self.run_solver('fmax'),
+        'data': add_data,
+        'stats': show_stats,
+    }
+    # Actions qui laissent la vue des chiffres ouverte
+    VIEW_ACTIONS = {'digits', 'table', 'scroll_up', 'scroll_down', 'page_up', 'page_down',
+                    'hints', 'info', 'perf', 'fullscreen'}
+    # Constantes : remplacent un résultat affiché, insérées d'un bloc. Par leur
+    # nom, pour être évaluées à la précision du mode courant.
+    CONSTANT_VALUES = {'π': 'pi', 'pi': 'pi', 'e': 'e', 'i': 'i'}
+    # Boutons dont le texte inséré diffère de la valeur
+    INSERTIONS = {
+        '√': 'sqrt(', 'sq': 'sqrt(',
+        'x²': '**2', 'x2': '**2',
+        'xʸ': '**', 'xy': '**',
+        'log': 'log10(', 'ln': 'log(',
+        'sin': 'sin(', 'cos': 'cos(', 'tan': 'tan(',
+        '1/x': '**(-1)',
+        'mod': '%',
+        'nCr': 'nCr(', 'nPr': 'nPr(',
+        'det': 'det(', 'inv': 'inv(', 'solve': 'solve(', 'transpose': 'transpose(',
+    }
+
+# Table des actions clavier
+# Touche -> (appui court, appui long). Sans action longue, l'action part dès
+# l'appui ; sinon au relâchement, selon la durée.
+KEY_ACTIONS = {
+    SDLK_ESCAPE: ('OFF', None),
+    SDLK_h: ('hints', None),
+    SDLK_i: ('info', None),
+    SDLK_p: ('perf', None),
+    SDLK_m: ('precision', None),
+    SDLK_l: ('recall', None),
+    SDLK_v: ('digits', None),
+    SDLK_s: ('store', None),
+    SDLK_g: ('fetch', None),
+    SDLK_c: ('undo', None),
+    SDLK_q: ('√', None),
+    SDLK_w: ('Gr', None),
+    SDLK_a: ('table', None),
+    SDLK_x: ('x', None),
+    SDLK_e: ('mod', None),
+    SDLK_r: ('1/x', None),
+    SDLK_t: ('!', None),
+    SDLK_n: ('nCr', 'nPr'),
+    SDLK_j: ('i', None),
+    SDLK_d: ('det', 'inv'),
+    SDLK_k: ('solve', 'transpose'),
+    SDLK_o: ('root', 'integ'),
+    SDLK_b: ('fmin', 'fmax'),
+    SDLK_y: ('data', 'stats'),
+    SDLK_SPACE: ('fullscreen', None),
+    SDLK_RETURN: ('=', None),
+    SDLK_BACKSPACE: ('⌫', None),
+    SDLK_DELETE: ('C', None),
+    SDLK_UP: ('scroll_up', None),
+    SDLK_DOWN: ('scroll_down', None),
+    SDLK_LEFT: ('cursor_left', None),
+    SDLK_RIGHT: ('cursor_right', None),
+    SDLK_PLUS: ('+', None),
+    SDLK_MINUS: ('-', None),
+    42: ('*', None),
+    47: ('/', None),
+    46: ('.', None),
+    SDLK_COMMA: (',', None),
+    SDLK_LEFTBRACKET: ('[', None),
+    SDLK_RIGHTBRACKET: (']', None),
+    SDLK_AT: ('@', None),
+    SDLK_0: ('0', ')'),
+    49: ('1', None),
+    50: ('2', None),
+    51: ('3', None),
+    52: ('4', None),
+    53: ('5', None),
+    SDLK_6: ('6', '^'),
+    55: ('7', None),
+    SDLK_8: ('8', '*'),
+    SDLK_9: ('9', '('),
+    SDLK_EQUALS: ('=', '+'),
+    SDLK_F1: ('sin', '√'),
+    SDLK_F2: ('cos', 'x²'),
+    SDLK_F3: ('tan', 'log'),
+    SDLK_F4: ('π', 'ln'),
+    SDLK_F5: ('e', None),
+    SDLK_F6: ('x²', None),
+    SDLK_F7: ('xʸ', None),
+    SDLK_F8: ('log', None),
+    SDLK_F9: ('ln', None),
+}
+
+# En mode graphique, ces touches déplacent et zooment la vue ; + et - restent à la saisie
+GRAPH_KEY_ACTIONS = {
+    SDLK_LEFT: ('pan_left', None),
+    SDLK_RIGHT: ('pan_right', None),
+    SDLK_UP: ('pan_up', None),
+    SDLK_DOWN: ('pan_down', None),
+    SDLK_PAGEUP: ('zoom_in', None),
+    SDLK_PAGEDOWN: ('zoom_out', None),
+}
+
+# Avec Maj en mode graphique : zoom sur les flèches (le PicoCalc n'a pas Page préc./suiv.)
+GRAPH_SHIFT_KEY_ACTIONS = {
+    SDLK_UP: ('zoom_in', None),
+    SDLK_DOWN: ('zoom_out', None),
+}
+
+# Dans la table de valeurs : défilement par ligne et par page, répété tant que la touche est tenue
+TABLE_KEY_ACTIONS = {
+    SDLK_UP: ('scroll_up', None),
+    SDLK_DOWN: ('scroll_down', None),
+    SDLK_LEFT: ('page_up', None),
+    SDLK_RIGHT: ('page_down', None),
+}
+
+# Actions permises pendant un calcul ; Esc (OFF) annule au lieu de quitter
+BUSY_ACTIONS = {'OFF', 'hints', 'info', 'perf', 'fullscreen', 'scroll_up', 'scroll_down',
+                'page_up', 'page_down', 'pan_left', 'pan_right', 'pan_up', 'pan_down', 'zoom_in', 'zoom_out'}
+
+# Régions à redessiner après une action ; par défaut l'affichage
+ACTION_REGIONS = {'hints': ('keypad',), 'info': ('info',), 'perf': ('perf',), 'fullscreen': ()}
+
+LONG_PRESS_MS = 500
+
+def main(perf_dump=None, stats_path=None):
+    try:
+        init_libs()
+    except RuntimeError as e:
+        print(e); return
+
+    # Processus de calcul démarré avant SDL : il n'hérite d'aucun état graphique
+    worker = EvalWorker()
+    worker.start()
+
     if sdl2.SDL_Init(SDL_INIT_VIDEO) < 0:
         print("SDL_Init erreur"); return
     if sdl2_ttf.TTF_Init() < 0:
@@ -605,6 +4828,8 @@ def main():
     window = sdl2.SDL_CreateWindow(b"Calc", 0, 0, 320, 320, SDL_WINDOW_SHOWN)
     if not window:
         print("Window erreur"); return
+    # Sans SDL_RENDERER_TARGETTEXTURE : le pilote n'est pas refusé s'il n'a pas de
+    # texture cible, KeypadLayer vérifie SDL_RenderTargetSupported et s'en passe
     renderer = sdl2.SDL_CreateRenderer(window, -1, SDL_RENDERER_ACCELERATED | SDL_RENDERER_PRESENTVSYNC)
     if not renderer:
         print("Renderer erreur"); return
@@ -619,215 +4844,167 @@ def main():
     font_hint = open_any_font(8)
     font_info = open_any_font(12)
 
-    calc = Calculator()
+    history_log = HistoryLog(session_dir())
+    calc = Calculator(worker, history_log)
+    calc.restore_session()
+    if stats_path:
+        calc.load_stats(stats_path)
     calc.build_layout_compact(font_btn)
+    keypad = KeypadLayer()
+    hud = PerfOverlay()
+    sched = FrameScheduler()
+    # Horodatages SDL des entrées traitées, pas encore à l'écran
+    pending_inputs = []
+    frame_budget_ms = 1000 / MAX_FPS
+    last_input = 0
+
+    def dispatch(action, timestamp):
+        nonlocal last_input
+        calc.perform(action)
+        calc.update_preview()
+        sched.invalidate(*ACTION_REGIONS.get(action, ('display',)))
+        sched.input()
+        pending_inputs.append(timestamp)
+        last_input = timestamp
+
+    # Textures pas encore affichées, préparées pendant l'attente après la première image
+    preload = [(font_display, f"y={calc.graph_func}", Color.BLACK)]
+    preload += [(font_info, line, Color.INFO_TEXT) for line in Calculator.INFO_LINES]
+    preload += [(font_hint, btn.hint, Color.HINT_TEXT) for btn in calc.buttons if btn.hint]
+    preload = [item for item in reversed(preload) if item[0]]
+    first_frame_shown = False
 
     running = True
     event = SDL_Event()
+    event_ref = ctypes.byref(event)
 
     while running:
-        while sdl2.SDL_PollEvent(ctypes.byref(event)):
+        t_wait = time.perf_counter_ns()
+        have_event = sched.wait_event(event_ref, poll=(first_frame_shown and bool(preload))
+                                      or calc.stats_loader is not None)
+        t_events = time.perf_counter_ns()
+        perf.add_time('idle', t_events - t_wait)
+        while have_event:
             if event.type == SDL_QUIT:
                 running = False
+            elif event.type == SDL_WINDOWEVENT:
+                sched.invalidate()
+            elif event.type == SDL_RENDER_TARGETS_RESET:
+                keypad.invalidate()
+                calc.graph_view.tex_key = None
+                sched.invalidate()
+            elif event.type == SDL_RENDER_DEVICE_RESET:
+                # Toutes les textures sont perdues avec le périphérique
+                keypad.release()
+                hud.release()
+                calc.graph_view.release()
+                text_cache.clear()
+                glyph_atlas.release()
+                sched.invalidate()
             elif event.type == SDL_MOUSEBUTTONDOWN:
-                if not calc.fullscreen_mode:
-                    x, y = event.button.x, event.button.y
-                    for btn in calc.buttons:
-                        if (btn.rect.x <= x <= btn.rect.x + btn.rect.w and
-                            btn.rect.y <= y <= btn.rect.y + btn.rect.h):
-                            calc.handle_button(btn.value)
-                            break
-            elif event.type == SDL_KEYDOWN:
-                if event.key.repeat:
-                    continue
-                    
+                if not calc.fullscreen_mode and not calc.busy:
+                    btn = calc.button_at(event.button.x, event.button.y)
+                    if btn is not None:
+                        dispatch(btn.value, event.button.timestamp)
+            elif event.type == SDL_KEYDOWN and (not event.key.repeat or (
+                    calc.table_view is not None and event.key.keysym.sym in TABLE_KEY_ACTIONS)):
                 key = event.key.keysym.sym
-                calc.key_press_times[key] = sdl2.SDL_GetTicks()
-                
-                if key == SDLK_ESCAPE:
-                    running = False
-                elif key == SDLK_h:
-                    calc.toggle_hints()
-                elif key == SDLK_i:
-                    calc.toggle_info()
-                elif key == SDLK_c:
-                    calc.undo_step()
-                elif key == SDLK_q:
-                    calc.expression += 'sqrt('
-                    calc.just_calculated = False
-                    calc.last_was_error = False
-                elif key == SDLK_w:
-                    calc.show_graph = not calc.show_graph
-                elif key == SDLK_e:
-                    calc.expression += '%'
-                    calc.just_calculated = False
-                    calc.last_was_error = False
-                elif key == SDLK_r:
-                    calc.expression += '**(-1)'
-                    calc.just_calculated = False
-                    calc.last_was_error = False
-                elif key == SDLK_t:
-                    calc.expression += '!'
-                    calc.just_calculated = False
-                    calc.last_was_error = False
-                elif key == SDLK_SPACE:
-                    calc.toggle_fullscreen()
-                elif key == SDLK_RETURN:
-                    calc.calculate()
-                elif key == SDLK_BACKSPACE:
-                    calc.expression = calc.expression[:-1]
-                    calc.just_calculated = False
-                    calc.last_was_error = False
-                elif key == SDLK_DELETE:
-                    calc.expression = ""
-                    calc.history = []
-                    calc.scroll_offset = 0
-                    calc.just_calculated = False
-                    calc.last_was_error = False
-                elif key == SDLK_UP:
-                    calc.scroll_up()
-                elif key == SDLK_DOWN:
-                    calc.scroll_down()
-                elif key in [43, 45, 42, 47, 46]:
-                    calc.expression += chr(key)
-                    calc.just_calculated = False
-                    calc.last_was_error = False
-                elif key in [49, 50, 51, 52, 53, 55]:
-                    if calc.just_calculated or calc.last_was_error:
-                        calc.expression = chr(key)
-                        calc.just_calculated = False
-                        calc.last_was_error = False
+                shift = event.key.keysym.mod & KMOD_SHIFT
+                actions = ((calc.table_view is not None and TABLE_KEY_ACTIONS.get(key))
+                           or (calc.show_graph and shift and GRAPH_SHIFT_KEY_ACTIONS.get(key))
+                           or (calc.show_graph and GRAPH_KEY_ACTIONS.get(key)) or KEY_ACTIONS.get(key))
+                if actions is not None and (not calc.busy or actions[0] in BUSY_ACTIONS):
+                    if actions[1] is None:
+                        dispatch(actions[0], event.key.timestamp)
                     else:
-                        calc.expression += chr(key)
-                    
+                        # Court ou long : décidé au relâchement
+                        calc.key_press_times[key] = (event.key.timestamp, actions)
             elif event.type == SDL_KEYUP:
-                key = event.key.keysym.sym
-                
-                if key in calc.key_press_times:
-                    press_duration = sdl2.SDL_GetTicks() - calc.key_press_times[key]
-                    long_press = press_duration > 500
-                    
-                    if key == SDLK_0:
-                        if long_press:
-                            calc.expression += ')'
-                        else:
-                            if calc.just_calculated or calc.last_was_error:
-                                calc.expression = '0'
-                                calc.just_calculated = False
-                                calc.last_was_error = False
-                            else:
-                                calc.expression += '0'
-                    elif key == SDLK_6:
-                        if long_press:
-                            calc.expression += '^'
-                        else:
-                            if calc.just_calculated or calc.last_was_error:
-                                calc.expression = '6'
-                                calc.just_calculated = False
-                                calc.last_was_error = False
-                            else:
-                                calc.expression += '6'
-                    elif key == SDLK_8:
-                        if long_press:
-                            calc.expression += '*'
-                            calc.just_calculated = False
-                            calc.last_was_error = False
-                        else:
-                            if calc.just_calculated or calc.last_was_error:
-                                calc.expression = '8'
-                                calc.just_calculated = False
-                                calc.last_was_error = False
-                            else:
-                                calc.expression += '8'
-                    elif key == SDLK_9:
-                        if long_press:
-                            calc.expression += '('
-                        else:
-                            if calc.just_calculated or calc.last_was_error:
-                                calc.expression = '9'
-                                calc.just_calculated = False
-                                calc.last_was_error = False
-                            else:
-                                calc.expression += '9'
-                    elif key == SDLK_EQUALS:
-                        if long_press:
-                            calc.expression += '+'
-                            calc.just_calculated = False
-                            calc.last_was_error = False
-                        else:
-                            calc.calculate()
-                    elif key == SDLK_F1:
-                        if long_press:
-                            calc.expression += 'sqrt('
-                        else:
-                            calc.expression += 'sin('
-                        calc.just_calculated = False
-                        calc.last_was_error = False
-                    elif key == SDLK_F2:
-                        if long_press:
-                            calc.expression += '**2'
-                        else:
-                            calc.expression += 'cos('
-                        calc.just_calculated = False
-                        calc.last_was_error = False
-                    elif key == SDLK_F3:
-                        if long_press:
-                            calc.expression += 'log10('
-                        else:
-                            calc.expression += 'tan('
-                        calc.just_calculated = False
-                        calc.last_was_error = False
-                    elif key == SDLK_F4:
-                        if long_press:
-                            calc.expression += 'log('
-                        else:
-                            if calc.just_calculated or calc.last_was_error:
-                                calc.expression = str(math.pi)
-                            else:
-                                calc.expression += str(math.pi)
-                        calc.just_calculated = False
-                        calc.last_was_error = False
-                    elif key == SDLK_F5:
-                        if calc.just_calculated or calc.last_was_error:
-                            calc.expression = str(math.e)
-                        else:
-                            calc.expression += str(math.e)
-                        calc.just_calculated = False
-                        calc.last_was_error = False
-                    elif key == SDLK_F6:
-                        calc.expression += '**2'
-                        calc.just_calculated = False
-                        calc.last_was_error = False
-                    elif key == SDLK_F7:
-                        calc.expression += '**'
-                        calc.just_calculated = False
-                        calc.last_was_error = False
-                    elif key == SDLK_F8:
-                        calc.expression += 'log10('
-                        calc.just_calculated = False
-                        calc.last_was_error = False
-                    elif key == SDLK_F9:
-                        calc.expression += 'log('
-                        calc.just_calculated = False
-                        calc.last_was_error = False
-                    
-                    del calc.key_press_times[key]
+                pressed = calc.key_press_times.pop(event.key.keysym.sym, None)
+                if pressed is not None:
+                    pressed_at, (short_action, long_action) = pressed
+                    long_press = event.key.timestamp - pressed_at > LONG_PRESS_MS
+                    dispatch(long_action if long_press else short_action, event.key.timestamp)
 
-        sdl2.SDL_SetRenderDrawColor(renderer, *Color.BG, 255)
-        sdl2.SDL_RenderClear(renderer)
+            have_event = sdl2.SDL_PollEvent(event_ref)
 
-        calc.draw_display(renderer, font_display, width, height)
-        
-        if not calc.fullscreen_mode:
-            for btn in calc.buttons:
-                btn.draw(renderer, calc.show_hints, font_hint)
-        
-        # Dessiner l'overlay d'info par-dessus tout
-        calc.draw_info_overlay(renderer, font_info, width, height)
+        if calc.quit_requested:
+            running = False
+        if calc.busy:
+            # Résultat attendu : on revient vérifier, et on anime l'indicateur
+            if calc.poll_calculation():
+                sched.invalidate('display')
+            else:
+                sched.wake('display', 100)
+        if calc.preview.deferred and not calc.busy:
+            # Aperçu trop long pour une touche : repris quand la frappe s'arrête
+            idle_ms = sdl2.SDL_GetTicks() - last_input
+            if idle_ms >= PREVIEW_DEFER_MS:
+                calc.update_preview(PREVIEW_IDLE_BUDGET_MS)
+                sched.invalidate('display')
+            else:
+                sched.wake('display', PREVIEW_DEFER_MS - idle_ms)
+        if calc.stats_loader is not None and first_frame_shown:
+            # Fichier de données lu par tranches entre deux images
+            calc.step_stats_load()
+            sched.invalidate('display')
+        history_log.maybe_sync()
+        perf.add_time('events', time.perf_counter_ns() - t_events)
+
+        if preload and first_frame_shown and not sched.pending():
+            # Une texture par tour : un événement n'attend jamais plus d'un rendu de texte
+            text_cache.get(renderer, *preload.pop())
+
+        if not running or not sched.frame_due():
+            continue
+
+        # Le tampon arrière est indéfini après SDL_RenderPresent : chaque image
+        # recompose toutes les régions, à partir des calques en cache.
+        with perf.timer('render'):
+            sdl2.SDL_SetRenderDrawColor(renderer, *Color.BG, 255)
+            sdl2.SDL_RenderClear(renderer)
 
-        sdl2.SDL_RenderPresent(renderer)
-        sdl2.SDL_Delay(16)
+            calc.draw_display(renderer, font_display, width, height)
 
+            if not calc.fullscreen_mode:
+                keypad.draw(renderer, calc, font_hint)
+
+            # Dessiner l'overlay d'info par-dessus tout
+            calc.draw_info_overlay(renderer, font_info, width, height)
+            if calc.show_perf:
+                hud.draw(renderer, font_hint, width)
+
+        with perf.timer('present'):
+            sdl2.SDL_RenderPresent(renderer)
+        if pending_inputs:
+            # Latence entrée -> image : horodatage SDL de l'événement jusqu'à la présentation
+            now = sdl2.SDL_GetTicks()
+            for stamp in pending_inputs:
+                latency = now - stamp
+                perf.add_time('input_latency', latency * 1000000)
+                if latency > frame_budget_ms:
+                    perf.count('late_input')
+            pending_inputs.clear()
+        perf.end_frame()
+        sched.presented()
+        if not first_frame_shown:
+            first_frame_shown = True
+            perf.add_time('startup', process_age_ns())
+        if calc.show_graph and calc.graph_view.refining:
+            # Niveau d'affinage suivant à l'image d'après
+            sched.wake('display', 0)
+        if calc.show_perf:
+            # Les mesures changent même sans événement
+            sched.wake('perf', PERF_WINDOW_MS)
+
+    # Les textures du cache doivent partir avant le renderer et les polices
+    calc.save_session()
+    worker.close()
+    keypad.release()
+    hud.release()
+    calc.graph_view.release()
+    text_cache.clear()
+    glyph_atlas.release()
     if font_display:
         sdl2_ttf.TTF_CloseFont(font_display)
     if font_btn:
@@ -840,6 +5017,170 @@ def main():
     sdl2.SDL_DestroyRenderer(renderer)
     sdl2.SDL_DestroyWindow(window)
     sdl2.SDL_Quit()
+    if perf_dump:
+        perf.dump(perf_dump)
+
+# Mode sans affichage
+# Noms et nombres découpés comme par tokenize ; le reste du texte est la forme
+_SHAPE_RE = re.compile(rf"({_NAME_PATTERN})|({_NUM_PATTERN})")
+
+class ShapeCache:
+    """Programmes liés partagés par les expressions de même forme (--batch)
+
+    La forme est le texte aux nombres près : « 12+3*4 » et « 7.5+10*2 » ont
+    le même programme, seuls les littéraux changent. Pour une forme déjà vue,
+    les littéraux sont convertis et placés dans une copie du code lié, sans
+    découpage en jetons ni analyse. Une erreur est recalculée par
+    compute_value, qui donne sa position dans ce texte-là.
+    """
+    def __init__(self, precision=None, size=BATCH_SHAPE_SIZE):
+        self.precision = precision
+        self.ops = mode_ops(precision)
+        self.size = size
+        self.shapes = {}    # forme -> (code lié, ((indice dans le code, indice du nombre), ...))
+
+    def compute(self, text):
+        """Valeur native de text, comme compute_value(text, precision=...)"""
+        # [texte, nom, nombre, texte, nom, nombre, ..., texte] ; nom ou nombre vaut None
+        parts = _SHAPE_RE.split(text)
+        numbers = parts[2::3]
+        del parts[2::3]
+        shape = tuple(parts)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            self._learn(shape, text, numbers)
+        else:
+            code, slots = entry
+            code = list(code)
+            num = self.ops['num']
+            try:
+                for i, k in slots:
+                    code[i] = (PUSH, num(numbers[k]), None)
+                return run_code(code)
+            except (ArithmeticError, ValueError):
+                pass
+        return compute_value(text, precision=self.precision)
+
+    def _learn(self, shape, text, numbers):
+        try:
+            program = compile_expression(text)
+            code = program.bind(self.ops)
+        except ExprError:
+            return
+        # Le k-ième PUSH du RPN est le k-ième nombre du texte
+        literals = [i for i, (op, _, _) in enumerate(program.rpn) if op == PUSH]
+        found = [k for k, number in enumerate(numbers) if number is not None]
+        if len(literals) != len(found):
+            return
+        if len(self.shapes) >= self.size:
+            self.shapes.clear()
+        self.shapes[shape] = (code, tuple(zip(literals, found)))
+
+def run_batch(lines, out, worker=None, precision=None):
+    """Une expression par ligne en entrée, un résultat par ligne en sortie
+
+    Même chemin d'évaluation que Calculator.calculate : compute_value() par
+    l'intermédiaire de ShapeCache, ou le processus de calcul (délai et mémoire
+    bornés) si worker est fourni.
+    precision : chiffres du mode décimal (touche M), None pour les flottants,
+    COMPLEX_MODE pour le mode complexe et matriciel.
+    Les lignes sont lues et écrites au fil de l'eau : mémoire bornée.
+    """
+    write = out.write
+    shapes = ShapeCache(precision)
+    # Lignes de sortie déjà produites (expressions répétées), taille bornée
+    memo = {}
+    count = 0
+    for line in lines:
+        text = line.strip()
+        result = memo.get(text)
+        if result is None:
+            if not text:
+                result = "\n"
+            else:
+                if worker is None:
+                    try:
+                        outcome = ('ok', shapes.compute(text))
+                    except ExprError as e:
+                        outcome = ('error', (e.message, e.pos))
+                else:
+                    worker.submit(text, precision=precision)
+                    outcome = None
+                    while outcome is None:
+                        outcome = worker.poll(0.05)
+                status, value = outcome
+                if status == 'ok':
+                    result = format_value(value, precision) + "\n"
+                elif status == 'error':
+                    message, pos = value
+                    result = f"Error: {message}\n" if pos is None else f"Error (col {pos + 1}): {message}\n"
+                else:
+                    # Un dépassement de délai n'est pas mémorisé
+                    write("Error: timeout\n")
+                    count += 1
+                    continue
+            if len(memo) >= BATCH_MEMO_SIZE:
+                memo.clear()
+            memo[text] = result
+        write(result)
+        count += 1
+    return count
+
+def batch_main(args):
+    if args.batch == '-':
+        src = sys.stdin
+    else:
+        try:
+            src = open(args.batch, encoding='utf-8', errors='replace')
+        except OSError as e:
+            print(f"SDLCalc: cannot open {args.batch}: {e.strerror or e}", file=sys.stderr)
+            return 2
+    worker = None
+    if args.timeout:
+        worker = EvalWorker(timeout=args.timeout)
+    try:
+        run_batch(src, sys.stdout, worker, COMPLEX_MODE if args.complex else args.precision)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Lecteur parti (« | head ») : arrêt sans trace ; stdout vers /dev/null
+        # pour que la vidange à la sortie de Python n'échoue pas à son tour
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if worker is not None:
+            worker.close()
+    return 0
+
+def _positive_int(text):
+    """Type argparse : entier strictement positif"""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{text}'") from None
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: '{text}'")
+    return value
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Calculatrice SDL pour PicoCalc")
+    parser.add_argument('--batch', nargs='?', const='-', metavar='FILE',
+                        help="évalue une expression par ligne (FILE ou stdin) sans fenêtre")
+    parser.add_argument('--timeout', type=float, metavar='S',
+                        help="en mode --batch : durée maximale par expression (processus séparé)")
+    parser.add_argument('--precision', type=_positive_int, metavar='DIGITS',
+                        help="en mode --batch : calcul décimal à DIGITS chiffres significatifs")
+    parser.add_argument('--complex', action='store_true',
+                        help="en mode --batch : nombres complexes, vecteurs et matrices")
+    parser.add_argument('--stats', metavar='FILE',
+                        help="statistiques d'un fichier CSV ou texte (une ou deux colonnes), lu en une passe")
+    parser.add_argument('--perf-dump', metavar='FILE',
+                        help="écrit les compteurs et chronomètres de performance (JSON) en quittant")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.batch is not None:
+        sys.exit(batch_main(args))
+    main(args.perf_dump, args.stats)
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Mesures des chemins critiques de SDLCalc (rendu et évaluation), sortie JSON
+
+    python SDLCalc_bench.py --out bench.json
+
+Le rendu tourne sous SDL_VIDEODRIVER=dummy ; sans SDL2/SDL_ttf, seule la
+partie évaluation est mesurée.
+"""
+
+import argparse, collections, contextlib, gc, io, json, os, platform, random, sys, tempfile, time, tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import SDLCalc
+
+# Corpus d'évaluation par catégorie
+EVAL_CORPUS = {
+    'simple': ["1+2*3", "10/4-3", "7%3+2^5", "-2**2+1", "3.14159*2.5"],
+    'trig': ["sin(0.5)+cos(1.2)*tan(0.3)", "sin(pi/6)^2+cos(pi/6)^2",
+             "sqrt(2)*sin(1)/cos(1)", "log10(1000)+log(e^2)", "tan(sin(cos(0.7)))"],
+    'factorial': ["10!", "20!", "(3+2)!", "170!/168!", "1000!"],
+    'nested': ["(" * 10 + "1+2" + ")*3" * 10, "(" * 30 + "2" + "+1)" * 30,
+               "((((1+2)*3)-4)/5)^((2+3)!)", "sqrt(sqrt(sqrt(sqrt(65536))))"],
+    'huge_power': ["2^10000", "3^2000*7", "(2^64)^8", "10^300+1", "7^7^3"],
+}
+
+def percentiles(samples):
+    """p50/p90/p99/max/moyenne d'une liste de mesures"""
+    if not samples:
+        return {}
+    s = sorted(samples)
+    n = len(s)
+    pick = lambda q: s[min(n - 1, int(q * n))]
+    return {'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99),
+            'max': s[-1], 'mean': sum(s) / n, 'n': n}
+
+def _calculate(calc, text):
+    """Un Calculator.calculate() complet ; True si le résultat est une erreur"""
+    calc.expression = text
+    calc.calculate()
+    while calc.busy:
+        calc.poll_calculation(0.05)
+    return calc.history[-1].startswith("= Error")
+
+def _clear_caches(calc, precision):
+    SDLCalc.compile_expression.cache_clear()
+    calc.result_memo.clear()
+    if precision is not None:
+        # Tables, constantes et résultats mémorisés du mode décimal
+        for cache in (SDLCalc.decimal_ops, SDLCalc._dec_pi, SDLCalc._dec_e):
+            cache.cache_clear()
+
+def bench_eval(repeat, precision=None):
+    """Latence à froid (caches vidés), latence à chaud (résultats mémorisés) et débit de Calculator.calculate() par catégorie"""
+    calc = SDLCalc.Calculator()
+    calc.precision = precision
+    results = {}
+    for category, corpus in EVAL_CORPUS.items():
+        cold = []
+        warm = []
+        errors = 0
+        calc.result_memo = SDLCalc.ResultMemo()
+        for _ in range(repeat):
+            for text in corpus:
+                _clear_caches(calc, precision)
+                t0 = time.perf_counter_ns()
+                errors += _calculate(calc, text)
+                cold.append((time.perf_counter_ns() - t0) / 1000)
+        for text in corpus:
+            _calculate(calc, text)
+        t_start = time.perf_counter()
+        for _ in range(repeat):
+            for text in corpus:
+                t0 = time.perf_counter_ns()
+                _calculate(calc, text)
+                warm.append((time.perf_counter_ns() - t0) / 1000)
+        elapsed = time.perf_counter() - t_start
+        results[category] = {
+            'cold_us': percentiles(cold),
+            'warm_us': percentiles(warm),
+            'throughput_per_s': len(warm) / elapsed if elapsed else None,
+            'errors': errors // max(1, repeat),
+            'result_memo': calc.result_memo.stats(),
+        }
+    return results
+
+def bench_preview(repeat):
+    """Aperçu pendant la frappe : coût par touche, corpus tapé caractère par caractère"""
+    keystroke = []
+    deferred = 0
+    for _ in range(repeat):
+        calc = SDLCalc.Calculator()
+        for corpus in EVAL_CORPUS.values():
+            for text in corpus:
+                calc.clear_entry()
+                for ch in text:
+                    calc.insert(ch)
+                    t0 = time.perf_counter_ns()
+                    calc.update_preview()
+                    keystroke.append((time.perf_counter_ns() - t0) / 1000)
+                    deferred += calc.preview.deferred
+    return {'keystroke_us': percentiles(keystroke), 'budget_ms': SDLCalc.PREVIEW_BUDGET_MS,
+            'deferred': deferred, 'memo_hits': calc.preview.hits, 'memo_misses': calc.preview.misses}
+
+def _matrix_literal(n):
+    """Système n×n à diagonale dominante (inversible), déterministe"""
+    rows = ("[" + ",".join(str(n + 1 if i == j else (i * 7 + j * 3) % 5 - 2) for j in range(n)) + "]"
+            for i in range(n))
+    return "[" + ",".join(rows) + "]", "[" + ",".join(str(i % 7 - 3) for i in range(n)) + "]"
+
+def bench_matrix(repeat):
+    """Mode complexe et matriciel : solve, inv et det de littéraux n×n, caches vidés"""
+    calc = SDLCalc.Calculator()
+    calc.precision = SDLCalc.COMPLEX_MODE
+    results = {}
+    for n in (3, 10, 50):
+        a, b = _matrix_literal(n)
+        for name, text in (('solve', f"solve({a},{b})"), ('inv', f"inv({a})"), ('det', f"det({a})")):
+            latency = []
+            errors = 0
+            for _ in range(repeat):
+                _clear_caches(calc, None)
+                t0 = time.perf_counter_ns()
+                errors += _calculate(calc, text)
+                latency.append((time.perf_counter_ns() - t0) / 1000)
+            results[f"{name}_{n}"] = {'latency_us': percentiles(latency), 'errors': errors // max(1, repeat)}
+    return results
+
+# Fonctions et intervalles des commandes O et B
+SOLVER_CORPUS = [("x**2-2", "0,2"), ("cos(x)-x", "-10,10"), ("sin(x)*e**(-x/5)", "0,20"),
+                 ("sqrt(x)", "0,1"), ("e**(-x**2)", "-10,10")]
+
+def bench_solver(repeat):
+    """root, integ, fmin, fmax : latence et évaluations de la fonction par commande"""
+    calc = SDLCalc.Calculator()
+    results = {}
+    for kind in ('root', 'integ', 'fmin', 'fmax'):
+        latency = []
+        evals = []
+        errors = 0
+        for _ in range(repeat):
+            for func, interval in SOLVER_CORPUS:
+                calc.graph_func = func
+                calc.expression = interval
+                calc.just_calculated = False
+                t0 = time.perf_counter_ns()
+                calc.perform(kind)
+                latency.append((time.perf_counter_ns() - t0) / 1000)
+                if calc.history[-1].startswith("= Error"):
+                    errors += 1
+                else:
+                    evals.append(int(calc.history[-2].rsplit(" evals", 1)[0].rsplit(" ", 1)[1]))
+        results[kind] = {'latency_us': percentiles(latency), 'evals': percentiles(evals),
+                         'errors': errors // max(1, repeat)}
+    return results
+
+def bench_table(pages):
+    """Table de valeurs : coût d'une page (défilement, lignes visibles, bloc suivant) sur toute la table"""
+    view = SDLCalc.TableView("sin(x)*x+sqrt(x)", 0.0, 0.001)
+    view.layout(40, 5)
+    step = max(1, (SDLCalc.TABLE_ROWS - view.visible) // (pages * view.visible)) * view.visible
+    latency = []
+    cached = 0
+    for _ in range(pages):
+        t0 = time.perf_counter_ns()
+        view.scroll(step)
+        for i in range(view.top, view.top + view.visible):
+            view.line(i)
+        view.prefetch()
+        latency.append((time.perf_counter_ns() - t0) / 1000)
+        cached = max(cached, len(view.chunks))
+    return {'page_us': percentiles(latency), 'rows_per_page': step, 'max_cached_chunks': cached}
+
+def bench_stats(rows):
+    """Statistiques : débit de lecture d'un CSV à deux colonnes, ajout d'une valeur saisie, erreur de rang des quartiles"""
+    rng = random.Random(1)
+    values = [rng.lognormvariate(0, 1) for _ in range(rows)]
+    with tempfile.NamedTemporaryFile('w', suffix=".csv", delete=False) as f:
+        f.write("x,y\n")
+        f.writelines(f"{x:.9g},{2 * x + rng.random():.9g}\n" for x in values)
+    try:
+        size = os.path.getsize(f.name)
+        stats = SDLCalc.StreamStats()
+        t0 = time.perf_counter_ns()
+        for _ in SDLCalc.read_stats_file(f.name, stats):
+            pass
+        read_s = (time.perf_counter_ns() - t0) / 1e9
+    finally:
+        os.unlink(f.name)
+    ordered = sorted(values)
+    rank_error = max(abs(SDLCalc.bisect.bisect_left(ordered, v) / rows - q)
+                     for q, v in zip((0.25, 0.5, 0.75), stats.sketch.quantiles((0.25, 0.5, 0.75))))
+    typed = SDLCalc.StreamStats()
+    latency = []
+    for x in values[:10000]:
+        t0 = time.perf_counter_ns()
+        typed.add(x)
+        latency.append((time.perf_counter_ns() - t0) / 1000)
+    return {'read_mb_s': round(size / 1e6 / read_s, 1), 'rows': stats.n,
+            'sketch_values': sum(len(level) for level in stats.sketch.levels),
+            'quartile_rank_error': round(rank_error, 5), 'add_us': percentiles(latency)}
+
+# Formes des lignes de --batch, nombres tirés au hasard
+BATCH_SHAPES = ["{}+{}*{}", "({}-{})/{}", "sqrt({})+{}", "{}.{}*{}^2", "sin({})*{}-{}"]
+
+def bench_batch(lines):
+    """Débit de run_batch (lignes/s) : lignes toutes distinctes, puis le corpus 'simple' répété"""
+    rng = random.Random(1)
+    distinct = [BATCH_SHAPES[i % len(BATCH_SHAPES)].format(*(rng.randint(1, 99999) for _ in range(3))) + "\n"
+                for i in range(lines)]
+    repeated = [EVAL_CORPUS['simple'][i % len(EVAL_CORPUS['simple'])] + "\n" for i in range(lines)]
+    results = {}
+    for name, corpus in (('distinct', distinct), ('repeated', repeated)):
+        t0 = time.perf_counter()
+        SDLCalc.run_batch(corpus, io.StringIO())
+        results[f"{name}_lines_per_s"] = round(lines / (time.perf_counter() - t0))
+    return results
+
+def bench_worker(repeat):
+    """Aller-retour par le processus de calcul (chemin de l'interface), corpus 'simple'"""
+    worker = SDLCalc.EvalWorker()
+    worker.start()
+    calc = SDLCalc.Calculator(worker)
+    try:
+        latency = []
+        for _ in range(repeat):
+            for text in EVAL_CORPUS['simple']:
+                t0 = time.perf_counter_ns()
+                _calculate(calc, text)
+                latency.append((time.perf_counter_ns() - t0) / 1000)
+    finally:
+        worker.close()
+    return {'roundtrip_us': percentiles(latency)}
+
+class CallCounter:
+    """Enveloppe une bibliothèque ctypes et compte les appels par fonction"""
+    def __init__(self, lib):
+        self._lib = lib
+        self.counts = collections.Counter()
+
+    def __getattr__(self, name):
+        func = getattr(self._lib, name)
+        counts = self.counts
+        def counted(*args):
+            counts[name] += 1
+            return func(*args)
+        setattr(self, name, counted)
+        return counted
+
+TEXTURE_CALLS = ('SDL_CreateTextureFromSurface', 'SDL_CreateTexture')
+
+# Pic d'octets alloués puis libérés pendant une image stable : conversions
+# d'arguments internes à ctypes, itérateurs de boucle (300 à 900 octets
+# mesurés sans SDL réelle). Ce n'est pas un nombre d'allocations.
+ALLOC_PEAK_BUDGET = 1024
+
+def _measure(frames, draw, counters):
+    times = []
+    calls = []
+    textures = []
+    for _ in range(frames):
+        for c in counters:
+            c.counts.clear()
+        t0 = time.perf_counter_ns()
+        draw()
+        times.append((time.perf_counter_ns() - t0) / 1e6)
+        calls.append(sum(sum(c.counts.values()) for c in counters))
+        textures.append(sum(c.counts[name] for c in counters for name in TEXTURE_CALLS))
+    return {
+        'frame_ms': percentiles(times),
+        'ctypes_calls_per_frame': percentiles(calls),
+        'texture_creations_per_frame': percentiles(textures),
+        # La première image remplit les caches : on la rapporte à part
+        'first_frame': {'ms': times[0], 'ctypes_calls': calls[0], 'texture_creations': textures[0]},
+    }
+
+def check_alloc(draw, frames):
+    """Images stables sous tracemalloc : aucune croissance de la mémoire tracée
+    (hors ce script), rien de retenu par SDLCalc, pic transitoire borné"""
+    for _ in range(10):
+        draw()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        # Premières images tracées à part : les listes libres de CPython s'y remplissent
+        for _ in range(10):
+            draw()
+        before = tracemalloc.take_snapshot()
+        worst = 0
+        for _ in range(frames):
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            draw()
+            worst = max(worst, tracemalloc.get_traced_memory()[1] - current)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    # Croissance de tout le processus (ctypes, bibliothèque standard compris),
+    # sauf les objets de la mesure elle-même
+    not_bench = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+    growth = sum(stat.size_diff for stat in after.filter_traces(not_bench).compare_to(
+        before.filter_traces(not_bench), 'filename'))
+    only_calc = [tracemalloc.Filter(True, SDLCalc.__file__)]
+    retained = [stat for stat in after.filter_traces(only_calc).compare_to(before.filter_traces(only_calc), 'lineno')
+                if stat.size_diff > 0]
+    return {
+        'frames': frames,
+        'growth_bytes': growth,
+        'retained_bytes': sum(stat.size_diff for stat in retained),
+        'retained_at': [f"{stat.traceback[0].lineno}: +{stat.size_diff} B" for stat in retained[:10]],
+        'peak_bytes_per_frame': worst,
+        'peak_budget': ALLOC_PEAK_BUDGET,
+        'ok': growth <= 0 and not retained and worst <= ALLOC_PEAK_BUDGET,
+    }
+
+def bench_render(frames, alloc=False):
+    try:
+        SDLCalc.init_libs()
+    except RuntimeError as e:
+        return {'skipped': str(e)}
+    sdl2 = SDLCalc.sdl2
+    ttf = SDLCalc.sdl2_ttf
+    if sdl2.SDL_Init(SDLCalc.SDL_INIT_VIDEO) < 0 or ttf.TTF_Init() < 0:
+        return {'skipped': "SDL_Init/TTF_Init failed"}
+    window = sdl2.SDL_CreateWindow(b"Calc bench", 0, 0, 320, 320, SDLCalc.SDL_WINDOW_SHOWN)
+    renderer = sdl2.SDL_CreateRenderer(window, -1, SDLCalc.SDL_RENDERER_TARGETTEXTURE) if window else None
+    if not renderer:
+        return {'skipped': "no window/renderer"}
+    # Messages de chargement des polices hors du JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        fonts = [SDLCalc.open_any_font(size) for size in (14, 10, 8, 12)]
+    font_display, font_btn, font_hint, font_info = fonts
+
+    calc = SDLCalc.Calculator()
+    calc.build_layout_compact(font_btn)
+    for i in range(20):
+        calc.expression = f"sin({i})*{i}+sqrt({i * i})"
+        calc.calculate()
+    calc.expression = "12345*(678+9)/sqrt(2)"
+    calc.show_info = True
+    keypad = SDLCalc.KeypadLayer()
+
+    # Les compteurs remplacent les bibliothèques le temps des mesures
+    SDLCalc.sdl2 = sdl_counter = CallCounter(sdl2)
+    SDLCalc.sdl2_ttf = ttf_counter = CallCounter(ttf)
+    counters = (sdl_counter, ttf_counter)
+    try:
+        def draw_buttons():
+            for btn in calc.buttons:
+                btn.draw(renderer, calc.show_hints, font_hint)
+
+        def draw_graph():
+            calc.show_graph = True
+            calc.draw_display(renderer, font_display, 320, 320)
+            calc.show_graph = False
+
+        def full_frame():
+            sdl2.SDL_SetRenderDrawColor(renderer, *SDLCalc.Color.BG, 255)
+            sdl2.SDL_RenderClear(renderer)
+            calc.draw_display(renderer, font_display, 320, 320)
+            keypad.draw(renderer, calc, font_hint)
+            calc.draw_info_overlay(renderer, font_info, 320, 320)
+
+        results = {
+            'draw_display': _measure(frames, lambda: calc.draw_display(renderer, font_display, 320, 320), counters),
+            'Button.draw': _measure(frames, draw_buttons, counters),
+            'KeypadLayer.draw': _measure(frames, lambda: keypad.draw(renderer, calc, font_hint), counters),
+            'draw_info_overlay': _measure(frames, lambda: calc.draw_info_overlay(renderer, font_info, 320, 320), counters),
+            'graph': _measure(frames, draw_graph, counters),
+            'full_frame': _measure(frames, full_frame, counters),
+        }
+    finally:
+        SDLCalc.sdl2 = sdl2
+        SDLCalc.sdl2_ttf = ttf
+    if alloc:
+        results['alloc'] = check_alloc(full_frame, frames)
+
+    keypad.release()
+    calc.graph_view.release()
+    SDLCalc.text_cache.clear()
+    SDLCalc.glyph_atlas.release()
+    for font in fonts:
+        if font:
+            ttf.TTF_CloseFont(font)
+    sdl2.SDL_DestroyRenderer(renderer)
+    sdl2.SDL_DestroyWindow(window)
+    ttf.TTF_Quit()
+    sdl2.SDL_Quit()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark SDLCalc (JSON)")
+    parser.add_argument('--out', metavar='FILE', help="fichier JSON (stdout par défaut)")
+    parser.add_argument('--frames', type=int, default=200, help="images mesurées par scénario")
+    parser.add_argument('--repeat', type=int, default=50, help="passes sur le corpus d'évaluation")
+    parser.add_argument('--skip-render', action='store_true', help="ne mesure que l'évaluation")
+    parser.add_argument('--check-alloc', action='store_true',
+                        help="vérifie qu'une image stable n'alloue rien de durable (code 1 sinon)")
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'numpy': SDLCalc.np is not None,
+            'video_driver': os.environ.get("SDL_VIDEODRIVER"),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        'eval': bench_eval(args.repeat),
+        'eval_decimal50': bench_eval(args.repeat, precision=50),
+        'preview': bench_preview(max(1, args.repeat // 10)),
+        'matrix': bench_matrix(max(1, args.repeat // 5)) if SDLCalc.np is not None else {'skipped': "numpy"},
+        'solver': bench_solver(max(1, args.repeat // 5)),
+        'table': bench_table(args.repeat * 20),
+        'stats': bench_stats(args.repeat * 20000),
+        'batch': bench_batch(args.repeat * 4000),
+        'worker': bench_worker(args.repeat),
+        'render': {'skipped': "--skip-render"} if args.skip_render else bench_render(args.frames, args.check_alloc),
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    alloc = report['render'].get('alloc')
+    if alloc is not None and not alloc['ok']:
+        print("check-alloc: steady frames grow or retain memory, or exceed the peak budget", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""Mémoire d'une image stable (--check-alloc du banc) ; ignoré sans SDL2/SDL_ttf"""
+
+import pytest
+
+import SDLCalc_bench
+
+
+def test_steady_frame_memory():
+    result = SDLCalc_bench.bench_render(20, alloc=True)
+    if 'skipped' in result:
+        pytest.skip(result['skipped'])
+    alloc = result['alloc']
+    assert alloc['ok'], alloc
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""Moteur de calcul sans SDL : analyse, évaluation, résolution, statistiques, mise en forme"""
+
+import io
+import math
+import random
+
+import pytest
+
+import SDLCalc
+from SDLCalc import COMPLEX_MODE, ExprError
+
+
+def batch_line(text, precision=None):
+    """Sortie de --batch pour une ligne"""
+    out = io.StringIO()
+    SDLCalc.run_batch([text], out, precision=precision)
+    return out.getvalue().rstrip("\n")
+
+
+# Analyse
+
+def test_tokenize_positions():
+    assert tuple(SDLCalc.tokenize("12+sin(x)")) == (
+        ('num', '12', 0), ('+', '+', 2), ('name', 'sin', 3), ('(', '(', 6),
+        ('name', 'x', 7), (')', ')', 8), ('end', '', 9))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1+2*3", "7"),
+    ("-2**2+1", "-3"),
+    ("2^3^2", "512"),
+    ("7%3", "1"),
+    ("5!", "120"),
+    ("nCr(5,2)", "10"),
+    ("nPr(5,2)", "20"),
+    ("1e3+1", "1001"),
+    ("170!/168!", "28730"),
+    ("sin(pi/6)", "0.5"),
+    ("", ""),
+])
+def test_evaluation(text, expected):
+    assert batch_line(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("(1+2", "Error (col 5): expected ')'"),
+    ("1+", "Error (col 3): incomplete expression"),
+    ("1)", "Error (col 2): unexpected ')'"),
+    ("3 4", "Error (col 3): unexpected '4'"),
+    ("2pi", "Error (col 2): unexpected 'pi'"),
+    ("foo(2)", "Error (col 1): unknown name 'foo'"),
+    ("x+1", "Error (col 1): 'x' undefined"),
+    ("1/0", "Error (col 2): division by zero"),
+    ("sqrt(-1)", "Error (col 1): math domain error"),
+])
+def test_errors(text, expected):
+    assert batch_line(text) == expected
+
+
+def test_variables():
+    assert SDLCalc.compute_value("x^2+ANS", variables={'x': 3, 'ANS': 1}) == 10
+
+
+def test_program_reused_across_modes():
+    program = SDLCalc.compile_expression("1/3")
+    assert SDLCalc.compile_expression("1/3") is program
+    assert SDLCalc.format_value(program.run(SDLCalc.REAL_OPS)) == "0.3333333333"
+    assert SDLCalc.compute("1/3", precision=20) == "0.33333333333333333333"
+
+
+# Régressions déjà rencontrées : (expression, précision du mode décimal ou None, ligne attendue)
+EVAL_CHECKS = [
+    ("2^7000 % 7", None, "2"),
+    ("10^3999 % 9", None, "1"),
+    ("2^7000 - 2^7000", None, "0"),
+    ("2^20000 - 2^20000", None, "0"),
+    ("2^20000 % 7", None, "Error (col 9): result too large for exact arithmetic"),
+    ("10^4000", None, "1e4000"),
+    ("(1001/1000)^200000", 50, "6.5387670237625415731556679827981070696326114394514E+86"),
+    ("(1000001/1000000)^3000000", 50, "20.085506794924964668898190982525266766092562015334"),
+    ("(2/3)^3", 50, "0.2962962962962962962962962962962962962962962962963"),
+    ("1e400", COMPLEX_MODE, "Error (col 1): overflow"),
+    ("1e400 * i", COMPLEX_MODE, "Error (col 1): overflow"),
+]
+
+
+@pytest.mark.parametrize("text, precision, expected", EVAL_CHECKS)
+def test_regressions(text, precision, expected):
+    assert batch_line(text, precision) == expected
+
+
+@pytest.mark.parametrize("precision", [None, 30])
+def test_batch_shapes_match_compute(precision):
+    # Lignes de même forme : un programme partagé, les nombres remplacés
+    rng = random.Random(1)
+    shapes = ["{}+{}*{}", "({}-{})/{}", "sqrt({})+{}", "{}.{}*{}^2", "{}e{}-{}", "nCr({},{})+{}"]
+    lines = [rng.choice(shapes).format(*(rng.randint(0, 99) for _ in range(3))) for _ in range(500)]
+    out = io.StringIO()
+    SDLCalc.run_batch([line + "\n" for line in lines], out, precision=precision)
+    expected = []
+    for line in lines:
+        try:
+            expected.append(SDLCalc.format_value(SDLCalc.compute_value(line, precision=precision), precision))
+        except ExprError as e:
+            expected.append(f"Error (col {e.pos + 1}): {e.message}" if e.pos is not None else f"Error: {e.message}")
+    assert out.getvalue().splitlines() == expected
+
+
+def test_input_tokens_follow_edits():
+    # Jetons patchés autour de l'édition : identiques à un découpage complet du texte
+    rng = random.Random(2)
+    keys = list("0123456789.") + ['+', '-', '*', '**', '/', '(', ')', 'sin(', 'x', 'pi', ',', '!', ' ']
+    buffer = SDLCalc.ExprBuffer()
+    for _ in range(2000):
+        r = rng.random()
+        if r < 0.6:
+            buffer.insert(rng.choice(keys))
+        elif r < 0.75:
+            buffer.backspace()
+        elif r < 0.9:
+            buffer.move(rng.choice((-1, 1)))
+        elif r < 0.92:
+            buffer.clear()
+        tokens = buffer.tokens()
+        if tokens is not None:
+            assert tokens == tuple(SDLCalc.tokenize(buffer.text))
+
+
+# Modes décimal et complexe
+
+def test_decimal_mode():
+    assert batch_line("1/3", 50) == "0.33333333333333333333333333333333333333333333333333"
+    assert batch_line("0.1*3", 50) == "0.3"
+
+
+@pytest.mark.skipif(SDLCalc.np is None, reason="NumPy")
+def test_complex_mode():
+    assert batch_line("sqrt(-1)", COMPLEX_MODE) == "i"
+    assert batch_line("i*i", COMPLEX_MODE) == "-1"
+    assert batch_line("[1,2]@[3,4]", COMPLEX_MODE) == "11"
+    assert batch_line("[1,2]", None) == "Error (col 1): '[' not available in this mode"
+
+
+# Résolution numérique
+
+def sampler(text, sign=1.0):
+    return SDLCalc.FunctionSampler(SDLCalc.compile_expression(text), sign)
+
+
+def test_find_root():
+    assert SDLCalc.find_root(sampler("x^2-2"), 0, 2) == pytest.approx(math.sqrt(2), abs=1e-12)
+
+
+def test_find_root_rejects_pole():
+    # Changement de signe de tan en π/2 : un pôle, pas un zéro
+    with pytest.raises(ExprError, match="discontinuity"):
+        SDLCalc.find_root(sampler("tan(x)"), 1, 2)
+    with pytest.raises(ExprError, match="undefined near x=0"):
+        SDLCalc.find_root(sampler("1/x"), -1, 2)
+
+
+def test_find_root_without_sign_change():
+    with pytest.raises(ExprError, match="no sign change"):
+        SDLCalc.find_root(sampler("x^2+1"), -1, 1)
+
+
+def test_find_minimum():
+    x, y = SDLCalc.find_minimum(sampler("(x-1)^2+3"), -5, 5)
+    assert x == pytest.approx(1, abs=1e-6)
+    assert y == pytest.approx(3, abs=1e-12)
+
+
+def test_find_maximum():
+    x, y = SDLCalc.find_minimum(sampler("sin(x)", -1.0), 0, 3)
+    assert x == pytest.approx(math.pi / 2, abs=1e-6)
+    assert -y == pytest.approx(1, abs=1e-12)
+
+
+def test_integrate():
+    value, error = SDLCalc.integrate(sampler("x^2"), 0, 3)
+    assert value == pytest.approx(9, rel=1e-12)
+    assert error < 1e-9
+
+
+def test_integrate_divergent():
+    with pytest.raises(ExprError, match="does not converge"):
+        SDLCalc.integrate(sampler("1/x"), 0, 1)
+
+
+# Statistiques
+
+def test_stats_typed_values():
+    stats = SDLCalc.StreamStats()
+    for v in (2, 4, 4, 4, 5, 5, 7, 9):
+        stats.add(v)
+    assert stats.report()[:5] == ["n = 8", "mean = 5", "sd = 2.1380899353", "var = 4.5714285714", "min = 2"]
+
+
+def test_stats_column_mismatch():
+    stats = SDLCalc.StreamStats()
+    stats.add(1.0, 2.0)
+    with pytest.raises(ExprError, match="expected x,y"):
+        stats.add(1.0)
+
+
+def test_stats_file(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("x,y\n1,3\n2;5\nbad line\n3\t7\n4,9\n")
+    stats = SDLCalc.StreamStats()
+    fractions = list(SDLCalc.read_stats_file(str(path), stats))
+    assert fractions[-1] == 1.0
+    assert (stats.n, stats.skipped) == (4, 2)
+    report = stats.report()
+    assert "a = 1" in report and "b = 2" in report and "r = 1" in report
+
+
+def test_stats_blocks_match_values():
+    # Blocs fusionnés (Chan) et valeurs une à une (Welford) : mêmes moments
+    rng = random.Random(3)
+    values = [rng.gauss(1e6, 1) for _ in range(3000)]
+    typed = SDLCalc.StreamStats()
+    for v in values:
+        typed.add(v)
+    blocks = SDLCalc.StreamStats()
+    for i in range(0, len(values), 700):
+        chunk = values[i:i + 700]
+        blocks.add_block(SDLCalc.np.array(chunk) if SDLCalc.np is not None else chunk)
+    assert blocks.mean_x == pytest.approx(typed.mean_x, rel=1e-13)
+    assert blocks.m2_x == pytest.approx(typed.m2_x, rel=1e-9)
+
+
+def test_quantiles_exact_when_small():
+    sketch = SDLCalc.QuantileSketch()
+    sketch.extend([float(v) for v in range(1, 101)])
+    assert list(sketch.quantiles((0.0, 0.5, 1.0))) == [1.0, 50.5, 100.0]
+
+
+# Mise en forme
+
+@pytest.mark.parametrize("value, expected", [
+    (0.1 * 3, "0.3"),
+    (2.0, "2"),
+    (1 / 3, "0.3333333333"),
+    (-7, "-7"),
+])
+def test_format_result(value, expected):
+    assert SDLCalc.format_result(value) == expected
+
+
+def test_format_huge_integer():
+    # Au-delà de RESULT_DIGIT_BUDGET chiffres : notation scientifique
+    assert SDLCalc.format_result(10 ** 5000) == "1e5000"
+    assert SDLCalc.format_result(3 * 10 ** 5000 + 1) == "3e5000"
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1 + 2j, "1+2i"),
+    (-1j, "-i"),
+    (3 + 0j, "3"),
+    (1e16 + 1j, "1e16+i"),
+])
+def test_format_complex(value, expected):
+    assert SDLCalc.format_complex(value) == expected
+
+
+def test_answer_record_round_trip():
+    for value in (12, 0.5, 2 + 3j, SDLCalc.Fraction(1, 3)):
+        record = SDLCalc.answer_record(SDLCalc.Result(value))
+        assert SDLCalc.read_answer_record(record.rstrip("\n")).value == value